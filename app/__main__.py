@@ -1,8 +1,16 @@
+import asyncio
+
 import uvicorn
 
 from app.config import settings
+from libs.database.migrations import MIGRATIONS, migrate
+from libs.metrics import registry
 
 if __name__ == "__main__":
+    # Снимки метрик прошлого запуска не должны попасть в новые значения
+    registry.clear()
+    if settings.db_migrate_on_start:
+        asyncio.run(migrate(MIGRATIONS))
     uvicorn.run(
         "app.server:create_app",
         workers=settings.workers_count,
@@ -1,7 +1,7 @@
 import enum
 from pathlib import Path
 from tempfile import gettempdir
-from typing import Optional
+from typing import Optional, List
 
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from yarl import URL
@@ -20,6 +20,14 @@ class LogLevel(str, enum.Enum):
     FATAL = "FATAL"
 
 
+class QueryCheckMode(str, enum.Enum):
+    """What to do when a request exceeds the SQL query budget."""
+
+    OFF = "OFF"
+    LOG = "LOG"
+    RAISE = "RAISE"
+
+
 class Settings(BaseSettings):
     """
     Application settings.
@@ -39,7 +47,35 @@ class Settings(BaseSettings):
     environment: str = "dev"
     secret_key: str = ""
 
+    # Lifetime of signed access tokens in seconds
+    access_token_ttl: int = 900
+    # Maximum number of revoked sessions kept in memory of each worker
+    auth_revocation_size: int = 100000
+
+    # Password hashing (scrypt) cost and worker pool
+    password_scrypt_n: int = 2 ** 14
+    password_scrypt_r: int = 8
+    password_scrypt_p: int = 1
+    password_hash_workers: int = 4
+    password_hash_queue_size: int = 64
+
     log_level: LogLevel = LogLevel.INFO
+
+    # Admission control: concurrent requests per route class in each worker
+    admission_enabled: bool = True
+    admission_search_limit: int = 64
+    admission_auth_limit: int = 16
+    admission_writes_limit: int = 32
+    admission_reads_limit: int = 64
+    # Requests waiting for a slot per route class and maximum wait in seconds
+    admission_queue_size: int = 128
+    admission_max_wait: float = 2.0
+    admission_retry_after: int = 1
+
+    # Directory shared by workers to aggregate metrics
+    metrics_dir: Path = TEMP_DIR / "quantum-metrics"
+    metrics_flush_interval: float = 5.0
+
     # Variables for the database
     db_host: str = "localhost"
     db_port: int = 5432
@@ -47,12 +83,71 @@ class Settings(BaseSettings):
     db_pass: str = "backend"
     db_name: str = "admin"
     db_echo: bool = False
+    # Apply pending migrations once in the launcher process before the workers start
+    db_migrate_on_start: bool = True
+
+    # Connection pool of each worker
+    db_pool_size: int = 10
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 30.0
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = True
+    # asyncpg prepared statement caches, set both to 0 behind pgbouncer in transaction mode
+    db_statement_cache_size: int = 100
+    db_prepared_statement_cache_size: int = 100
+    # Server-side timeouts in milliseconds, 0 disables the timeout
+    db_statement_timeout: int = 30000
+    db_lock_timeout: int = 5000
+    # Read replicas (JSON list of URLs) and how far behind a replica may fall before leaving rotation
+    db_replica_urls: List[str] = []
+    db_replica_max_lag: float = 5.0
+    db_replica_check_interval: float = 10.0
+    # SQL query budget per request and how many repeats of one statement count as N+1
+    db_query_check: QueryCheckMode = QueryCheckMode.LOG
+    db_query_max_count: int = 20
+    db_query_repeat_threshold: int = 5
+    # Rows per statement and transaction in bulk repository operations
+    db_batch_size: int = 1000
+    # Rows fetched per query when iterating over whole tables
+    db_chunk_size: int = 1000
+
+    # How long stock reserved by a new order is held until the order is accepted, in seconds
+    stock_reservation_ttl: int = 900
+
+    # Background removal of expired sessions and verification codes, release of expired
+    # reservations and the periodic search sync from the change feed
+    reaper_enabled: bool = True
+    reaper_interval: int = 300
+    reaper_batch_size: int = 1000
+    reaper_batch_pause: float = 0.1
 
     # Variables for ElasticSearch
     elastic_host: str = "localhost"
     elastic_port: int = 9200
     elastic_user: Optional[str] = None
     elastic_pass: Optional[str] = None
+    # Changes are re-read this many seconds before the last sync watermark to catch late commits
+    elastic_sync_overlap: int = 60
+    # Streaming bulk during sync: documents and bytes per request and concurrent requests
+    elastic_bulk_chunk_size: int = 500
+    elastic_bulk_max_bytes: int = 10 * 1024 * 1024
+    elastic_bulk_parallelism: int = 2
+    # Retries of documents rejected with 429 and the first backoff in seconds, doubled on every retry
+    elastic_bulk_max_retries: int = 5
+    elastic_bulk_initial_backoff: float = 1.0
+    # Write-behind queue for document changes made by requests: flush interval in seconds,
+    # documents per bulk request, retries and the first backoff in seconds
+    elastic_write_behind: bool = True
+    elastic_write_flush_interval: float = 0.2
+    elastic_write_batch_size: int = 500
+    elastic_write_max_retries: int = 5
+    elastic_write_initial_backoff: float = 0.5
+    # Documents the queue holds before dropping new changes, and seconds shutdown waits for it to drain
+    elastic_write_max_pending: int = 100000
+    elastic_write_drain_timeout: float = 10.0
+    # Listing all document ids: hits per page and parallel slices of one point-in-time
+    elastic_scan_page_size: int = 10000
+    elastic_scan_slices: int = 4
 
     # Variables for Redis
     redis_host: str = "backend-redis"
@@ -35,7 +35,7 @@ settings = {
 }
 
 index_settings = {
-    "product": {
+    "products": {
         "settings": settings,
         "mappings": {
             "properties": {
@@ -0,0 +1,191 @@
+import asyncio
+import time
+from collections import deque
+from typing import Dict, Optional
+
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Scope, Receive, Send
+
+from app.config import settings
+from libs.metrics import registry, phase
+
+WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+EXEMPT_PATHS = {"/metrics"}
+
+admission_in_flight = registry.gauge(
+    "admission_in_flight",
+    "Requests currently being processed per route class.",
+    ["route_class"],
+)
+admission_queue_depth = registry.gauge(
+    "admission_queue_depth",
+    "Requests waiting for admission per route class.",
+    ["route_class"],
+)
+admission_rejected = registry.counter(
+    "admission_rejected_total",
+    "Requests rejected by admission control.",
+    ["route_class", "reason"],
+)
+admission_wait = registry.histogram(
+    "admission_wait_seconds",
+    "Time requests spent waiting for admission.",
+    ["route_class"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+
+
+class Rejected(Exception):
+    def __init__(self, reason: str):
+        self.reason = reason
+
+
+class AdmissionLimiter:
+    """
+    Ограничитель одновременных запросов одного класса маршрутов.
+
+    Сверх лимита запросы ждут в очереди ограниченного размера. Запрос не ставится
+    в очередь, если по средней длительности обработки он не успеет дождаться
+    своей очереди до дедлайна, и снимается с очереди по истечении дедлайна.
+    """
+
+    def __init__(self, name: str, limit: int, queue_size: int, max_wait: float):
+        """
+        :param name: Имя класса маршрутов.
+        :param limit: Максимальное количество одновременно обрабатываемых запросов.
+        :param queue_size: Максимальное количество ожидающих запросов.
+        :param max_wait: Максимальное время ожидания в очереди в секундах.
+        """
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self.in_flight = 0
+        self.service_time = 0.0
+        self._waiters: deque[asyncio.Future] = deque()
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self) -> None:
+        """
+        Ждёт свободный слот.
+
+        :raises Rejected: Если очередь заполнена или дедлайн не может быть соблюдён.
+        """
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+            return
+
+        if len(self._waiters) >= self.queue_size:
+            raise Rejected("queue_full")
+
+        expected_wait = (len(self._waiters) + 1) * self.service_time / self.limit
+        if expected_wait > self.max_wait:
+            raise Rejected("deadline")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait({waiter}, timeout=self.max_wait)
+        except asyncio.CancelledError:
+            self._abandon(waiter)
+            raise
+
+        if not waiter.done():
+            self._abandon(waiter)
+            raise Rejected("timeout")
+
+    def release(self, service_time: float) -> None:
+        """
+        Освобождает слот, передавая его первому ожидающему запросу.
+
+        :param service_time: Сколько времени запрос занимал слот, для оценки ожидания.
+        """
+        self.service_time = service_time if not self.service_time else 0.9 * self.service_time + 0.1 * service_time
+
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+
+        self.in_flight -= 1
+
+    def _abandon(self, waiter: asyncio.Future) -> None:
+        if waiter.done() and not waiter.cancelled():
+            # Слот уже был передан этому запросу
+            self.release(self.service_time)
+            return
+
+        waiter.cancel()
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware, ограничивающее одновременные запросы по классам маршрутов.
+
+    Запросы, которые не удалось принять, быстро отклоняются с кодом 503 и заголовком Retry-After.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self.limiters: Dict[str, AdmissionLimiter] = {
+            name: AdmissionLimiter(name, limit, settings.admission_queue_size, settings.admission_max_wait)
+            for name, limit in {
+                "search": settings.admission_search_limit,
+                "auth": settings.admission_auth_limit,
+                "writes": settings.admission_writes_limit,
+                "reads": settings.admission_reads_limit,
+            }.items()
+        }
+        registry.add_collector(self._collect)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        limiter = self._classify(scope) if scope["type"] == "http" else None
+        if limiter is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        try:
+            with phase("queue"):
+                await limiter.acquire()
+        except Rejected as exc:
+            admission_rejected.inc(route_class=limiter.name, reason=exc.reason)
+            response = JSONResponse(
+                {"detail": "Server is overloaded, try again later"},
+                status_code=503,
+                headers={"Retry-After": str(settings.admission_retry_after)},
+            )
+            await response(scope, receive, send)
+            return
+
+        admitted_at = time.perf_counter()
+        admission_wait.observe(admitted_at - start, route_class=limiter.name)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release(time.perf_counter() - admitted_at)
+
+    def _classify(self, scope: Scope) -> Optional[AdmissionLimiter]:
+        path = scope["path"]
+        if path in EXEMPT_PATHS:
+            return None
+        if path.startswith("/auth"):
+            return self.limiters["auth"]
+        if scope["method"] == "GET" and path.rstrip("/") == "/products":
+            return self.limiters["search"]
+        if scope["method"] in WRITE_METHODS:
+            return self.limiters["writes"]
+        return self.limiters["reads"]
+
+    def _collect(self) -> None:
+        for limiter in self.limiters.values():
+            admission_in_flight.set(limiter.in_flight, route_class=limiter.name)
+            admission_queue_depth.set(limiter.queue_depth, route_class=limiter.name)
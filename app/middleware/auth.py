@@ -1,21 +1,20 @@
-from datetime import datetime
 from functools import wraps
 from typing import List, Optional, Callable, Annotated
 
 from fastapi import Request, HTTPException, status
 from fastapi.params import Depends
 
-from app.utils.auth import hash_token
-from libs.database import SessionDep
-from libs.database.models import User, UserFlag
-from libs.database.repositories import SessionRepository
+from app.utils.auth import CurrentUser, decode_access_token
+from app.utils.revocation import revocation_list
+from libs.database.models import UserFlag
+from libs.metrics import phase
 
 
 def authorize(flags: Optional[List[UserFlag]] = None):
     def decorator(func: Callable):
         @wraps(func)
         async def wrapper(*args, request: Request, **kwargs):
-            user = await get_authenticated_user(request, request.state.db)
+            user = get_authenticated_user(request)
             if flags and not any(user.flags & flag.value for flag in flags):
                 raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Permission denied")
 
@@ -27,10 +26,7 @@ def authorize(flags: Optional[List[UserFlag]] = None):
     return decorator
 
 
-async def get_authenticated_user(
-        request: Request,
-        session: SessionDep
-) -> User:
+def get_authenticated_user(request: Request) -> CurrentUser:
     token = request.cookies.get("access_token")
     if not token:
         raise HTTPException(
@@ -38,17 +34,14 @@ async def get_authenticated_user(
             detail="Authentication credentials were not provided"
         )
 
-    session_repo = SessionRepository(session)
-    db_session = await session_repo.get_by_access_token(hash_token(token), relations=["user"])
+    with phase("auth"):
+        user = decode_access_token(token)
+        revoked = user is not None and revocation_list.is_revoked(user)
 
-    if db_session is None or db_session.expire_at < datetime.now():
+    if user is None or revoked:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid or expired token")
 
-    user = db_session.user
-    if not user:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
-
     return user
 
 
-AuthUserDep = Annotated[User, Depends(get_authenticated_user)]
+AuthUserDep = Annotated[CurrentUser, Depends(get_authenticated_user)]
@@ -1,20 +1,140 @@
+import logging
+from functools import wraps
+from typing import Any, Callable, Dict
+
 from fastapi import Request
+from starlette.types import ASGIApp, Scope, Receive, Send, Message
+
+from app.config import settings, QueryCheckMode
+from libs.database.engine import async_session
+from libs.database.tracker import track_queries, QueryStats, QueryBudgetExceeded
+from libs.database.uow import begin_unit_of_work, in_unit_of_work, complete_unit_of_work
+from libs.elastic.client import es_client
+from libs.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+queries_per_request = registry.histogram(
+    "db_queries_per_request",
+    "Number of SQL statements executed per HTTP request.",
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100),
+)
+round_trips_saved_per_request = registry.histogram(
+    "db_round_trips_saved_per_request",
+    "Number of repository lookups per HTTP request served from the request identity map.",
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50),
+)
+query_budget_exceeded = registry.counter(
+    "db_query_budget_exceeded_total",
+    "Requests that exceeded the SQL query budget or repeated a statement (N+1).",
+)
+
+
+class LazyState(dict):
+    """
+    Состояние запроса, в котором ресурсы создаются при первом обращении.
+
+    `request.state.<name>` читает значение из этого словаря, поэтому отсутствующий
+    ключ с зарегистрированной фабрикой создаётся и сохраняется в `__missing__`.
+    """
+
+    def __init__(self, state: Dict[str, Any], factories: Dict[str, Callable[[], Any]]):
+        super().__init__(state)
+        self._factories = factories
+
+    def __missing__(self, key: str) -> Any:
+        factory = self._factories.get(key)
+        if factory is None:
+            raise KeyError(key)
+
+        value = self[key] = factory()
+        return value
+
+
+def unit_of_work():
+    """
+    Выполняет все изменения обработчика через `request.state.db` в одной транзакции.
+
+    Репозитории только отправляют изменения в базу, а `DependenciesMiddleware` коммитит
+    их один раз перед отправкой успешного ответа или откатывает, если обработчик
+    завершился ошибкой. Индексация в Elastic и другие отложенные действия выполняются
+    только после коммита.
+    """
+    def decorator(func: Callable):
+        @wraps(func)
+        async def wrapper(*args, request: Request, **kwargs):
+            begin_unit_of_work(request.state.db)
+            return await func(*args, request=request, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class DependenciesMiddleware:
+    """
+    ASGI middleware, которое предоставляет `request.state.db` и `request.state.elastic`.
+
+    Сессия базы данных создаётся только если обработчик к ней обратился,
+    и закрывается после отправки ответа. Если обработчик открыл единицу работы
+    (`unit_of_work`), сессия коммитится перед ответом с кодом меньше 400, а при
+    ошибке коммита клиент получает 500. Все репозитории запроса работают с этой сессией
+    и её identity map. Заодно считаются SQL-запросы запроса и сэкономленные кэшем обращения:
+    при превышении бюджета или повторе одного запроса (N+1) пишется предупреждение,
+    а в режиме RAISE запрос завершается ошибкой.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        state = LazyState(scope.get("state", {}), {
+            "db": async_session,
+            "elastic": lambda: es_client,
+        })
+        scope["state"] = state
+
+        with track_queries() as stats:
+            async def send_checked(message: Message) -> None:
+                if message["type"] == "http.response.start":
+                    self._check(scope, stats)
+                    await self._complete(state.get("db"), message["status"])
+                await send(message)
 
-from libs.database import get_session
-from libs.elastic.client import get_es_client
+            try:
+                await self.app(scope, receive, send_checked)
+            finally:
+                session = state.get("db")
+                if session is not None:
+                    await session.close()
 
+    @staticmethod
+    async def _complete(session, status_code: int) -> None:
+        if session is None or not in_unit_of_work(session):
+            return
 
-async def add_dependencies(request: Request, call_next):
-    session_gen = get_session()
-    client_gen = get_es_client()
+        if status_code < 400:
+            await complete_unit_of_work(session)
+        else:
+            await session.rollback()
 
-    try:
-        request.state.db = await anext(session_gen)
-        request.state.elastic = await anext(client_gen)
+    @staticmethod
+    def _check(scope: Scope, stats: QueryStats) -> None:
+        queries_per_request.observe(stats.count)
+        round_trips_saved_per_request.observe(stats.saved)
+        if settings.db_query_check == QueryCheckMode.OFF:
+            return
 
-        response = await call_next(request)
-    finally:
-        await session_gen.aclose()
-        await client_gen.aclose()
+        problems = stats.problems(settings.db_query_max_count, settings.db_query_repeat_threshold)
+        if not problems:
+            return
 
-    return response
+        query_budget_exceeded.inc()
+        message = f"{scope['method']} {scope['path']}: " + "; ".join(problems)
+        if settings.db_query_check == QueryCheckMode.RAISE:
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
@@ -0,0 +1,111 @@
+import asyncio
+from functools import wraps
+from typing import Callable, Any
+
+from fastapi import Request, Response
+from fastapi.routing import APIRoute
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Scope, Receive, Send, Message
+
+from libs.metrics import registry, start_request_timings, phase, RequestTimings
+
+# Фазы, которые замеряются внутри эндпоинта. Время эндпоинта за их вычетом попадает
+# в фазу app, а время обработчика FastAPI вне эндпоинта - в serialize.
+MEASURED_PHASES = ("auth", "db", "es")
+
+request_duration = registry.histogram(
+    "http_request_duration_seconds",
+    "Total time spent processing HTTP requests.",
+    ["method", "route", "status"],
+)
+request_phase_duration = registry.histogram(
+    "http_request_phase_seconds",
+    "Time spent in each phase of HTTP request processing.",
+    ["method", "route", "status", "phase"],
+)
+
+
+class TimedRoute(APIRoute):
+    """
+    Маршрут, который замеряет время эндпоинта и всего обработчика FastAPI.
+
+    Разница между ними - это валидация запроса, разрешение зависимостей
+    и сериализация ответа.
+    """
+
+    def __init__(self, path: str, endpoint: Callable[..., Any], **kwargs):
+        # include_router пересоздаёт маршрут с уже обёрнутым эндпоинтом
+        if asyncio.iscoroutinefunction(endpoint) and not getattr(endpoint, "__timed__", False):
+            endpoint = _timed_endpoint(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def timed_handler(request: Request) -> Response:
+            with phase("handler"):
+                return await handler(request)
+
+        return timed_handler
+
+
+def _timed_endpoint(endpoint: Callable) -> Callable:
+    @wraps(endpoint)
+    async def wrapper(*args, **kwargs):
+        with phase("endpoint"):
+            return await endpoint(*args, **kwargs)
+
+    wrapper.__timed__ = True
+    return wrapper
+
+
+def _phases(timings: RequestTimings) -> dict[str, float]:
+    phases = {name: timings.get(name) for name in MEASURED_PHASES}
+    phases["app"] = max(timings.get("endpoint") - sum(phases.values()), 0.0)
+    phases["serialize"] = max(timings.get("handler") - timings.get("endpoint"), 0.0)
+    phases["queue"] = timings.get("queue")
+    return phases
+
+
+class TimingMiddleware:
+    """
+    ASGI middleware, которое собирает длительности фаз запроса.
+
+    Фазы отдаются клиенту в заголовке `Server-Timing` и записываются
+    в гистограммы для `/metrics`.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = start_request_timings()
+        status_code = 500
+
+        async def send_with_timing(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                entries = [f"{name};dur={duration * 1000:.2f}" for name, duration in _phases(timings).items()]
+                entries.append(f"total;dur={timings.total * 1000:.2f}")
+
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", ", ".join(entries))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            route = scope.get("route")
+            labels = {
+                "method": scope["method"],
+                "route": route.path if route is not None else "unmatched",
+                "status": status_code,
+            }
+            request_duration.observe(timings.total, **labels)
+            for name, duration in _phases(timings).items():
+                request_phase_duration.observe(duration, phase=name, **labels)
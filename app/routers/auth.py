@@ -2,25 +2,32 @@ import secrets
 import uuid
 from datetime import datetime, timedelta
 
-from fastapi import APIRouter, HTTPException, status, Response, Cookie
-
-from app.schemas.auth import RegisterRequest, LoginRequest
-from app.utils.auth import hash_token, verify_token, create_session
-from libs.database import SessionDep
-from libs.database.models import User
+from fastapi import APIRouter, HTTPException, status, Response, Cookie, Request
+
+from app.middleware.auth import authorize
+from app.middleware.deps import unit_of_work
+from app.middleware.timing import TimedRoute
+from app.schemas.auth import RegisterRequest, LoginRequest, CacheStatsResponse
+from app.utils.auth import hash_token, create_session, issue_access_token, decode_access_token
+from app.utils.password import password_hasher
+from app.utils.revocation import revocation_list
+from libs.database.models import User, UserFlag
+from libs.database.uow import after_commit
 from libs.database.repositories import UserRepository, SessionRepository
 
 router = APIRouter(
     prefix="/auth",
     tags=["auth"],
+    route_class=TimedRoute,
 )
 
 
 @router.post("/register")
-async def register(register_data: RegisterRequest, response: Response, db: SessionDep):
+@unit_of_work()
+async def register(request: Request, register_data: RegisterRequest, response: Response):
     """Регистрирует нового пользователя, создаёт сессию и возвращает оригинальные токены."""
-    user_repo = UserRepository(db)
-    session_repo = SessionRepository(db)
+    user_repo = UserRepository(request.state.db)
+    session_repo = SessionRepository(request.state.db)
 
     existing_user = await user_repo.get_by_field("email", register_data.email)
     if existing_user:
@@ -29,7 +36,7 @@ async def register(register_data: RegisterRequest, response: Response, db: Sessi
     new_user = User(
         id=uuid.uuid4(),
         email=register_data.email,
-        password=hash_token(register_data.password),
+        password=await password_hasher.hash(register_data.password),
         first_name=register_data.first_name,
         last_name=register_data.last_name,
         created_at=datetime.now(),
@@ -40,38 +47,48 @@ async def register(register_data: RegisterRequest, response: Response, db: Sessi
     except:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="User cannot create")
 
-    token, refresh_token = await create_session(new_user.id, session_repo)
+    token, refresh_token = await create_session(new_user, session_repo)
     response.set_cookie(key="access_token", value=token, httponly=True, secure=True, samesite="lax")
     response.set_cookie(key="refresh_token", value=refresh_token, httponly=True, secure=True, samesite="lax")
     return {"message": "Successfully registered"}
 
 
 @router.post("/login")
-async def login(login_data: LoginRequest, response: Response, db: SessionDep):
+@unit_of_work()
+async def login(request: Request, login_data: LoginRequest, response: Response):
     """Выполняет вход пользователя, создаёт сессию и возвращает токены."""
-    user_repo = UserRepository(db)
-    session_repo = SessionRepository(db)
+    user_repo = UserRepository(request.state.db)
+    session_repo = SessionRepository(request.state.db)
     user = await user_repo.get_by_field("email", login_data.email)
 
-    if user is None or not verify_token(login_data.password, user.password):
+    if user is None:
+        await password_hasher.verify_dummy(login_data.password)
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
+
+    valid, needs_rehash = await password_hasher.verify(login_data.password, user.password)
+    if not valid:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
 
-    token, refresh_token = await create_session(user.id, session_repo)
+    if needs_rehash:
+        await user_repo.update(user.id, {"password": await password_hasher.hash(login_data.password)})
+
+    token, refresh_token = await create_session(user, session_repo)
     response.set_cookie(key="access_token", value=token, httponly=True, secure=True, samesite="lax")
     response.set_cookie(key="refresh_token", value=refresh_token, httponly=True, secure=True, samesite="lax")
     return {"message": "Successfully logged in"}
 
 
 @router.post("/refresh")
-async def refresh(response: Response, db: SessionDep, refresh_token: str = Cookie(...)):
+@unit_of_work()
+async def refresh(request: Request, response: Response, refresh_token: str = Cookie(...)):
     """Обновляет токен сессии, если токен обновления действителен."""
-    session_repo = SessionRepository(db)
-    session = await session_repo.get_by_refresh_token(refresh_token)
+    session_repo = SessionRepository(request.state.db)
+    session = await session_repo.get_by_refresh_token(hash_token(refresh_token), relations=["user"])
 
-    if session is None or session.expire_at < datetime.now():
+    if session is None or session.expire_at < datetime.now() or session.user is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Session expired")
 
-    new_token = secrets.token_urlsafe(32)
+    new_token = issue_access_token(session.user, session.id)
     new_refresh_token = secrets.token_urlsafe(32)
     await session_repo.update(session.id, {
         "access_token": hash_token(new_token),
@@ -85,16 +102,34 @@ async def refresh(response: Response, db: SessionDep, refresh_token: str = Cooki
 
 
 @router.post("/logout")
-async def logout(response: Response, db: SessionDep, access_token: str = Cookie(...)):
+@unit_of_work()
+async def logout(request: Request, response: Response, access_token: str = Cookie(...)):
     """Удаляет сессию пользователя при выходе из системы."""
-    session_repo = SessionRepository(db)
-    session = await session_repo.get_by_token(access_token)
+    session_repo = SessionRepository(request.state.db)
+    current_user = decode_access_token(access_token, verify_expiry=False)
+    session = await session_repo.get(current_user.session_id) if current_user else None
 
     if session is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Session not found")
 
     await session_repo.delete(session.id)
+    await after_commit(request.state.db, revocation_list.revoke_session, session.id)
     response.delete_cookie(key="access_token")
     response.delete_cookie(key="refresh_token")
 
     return {"message": "Successfully logged out"}
+
+
+@router.get("/revocations", response_model=CacheStatsResponse)
+@authorize(flags=[UserFlag.ADMIN])
+async def revocation_stats(request: Request):
+    """Возвращает счётчики списка отозванных токенов текущего воркера."""
+    stats = revocation_list.stats()
+    return CacheStatsResponse(
+        size=stats.size,
+        maxsize=stats.maxsize,
+        hits=stats.hits,
+        misses=stats.misses,
+        evictions=stats.evictions,
+        hit_ratio=stats.hit_ratio,
+    )
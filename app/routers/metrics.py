@@ -0,0 +1,14 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from libs.metrics import registry
+
+router = APIRouter(
+    tags=["metrics"]
+)
+
+
+@router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def metrics():
+    """Метрики всех воркеров в текстовом формате Prometheus."""
+    return PlainTextResponse(await registry.render(), media_type="text/plain; version=0.0.4")
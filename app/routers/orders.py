@@ -1,69 +1,118 @@
-from typing import List
+import uuid
+from typing import Optional, List
 
-from fastapi import Request, APIRouter, HTTPException, status
+from fastapi import Request, APIRouter, HTTPException, Query, status
 
 from app.middleware.auth import authorize
-from app.schemas.order import OrderCreate, OrderUpdate, OrderResponse
-from libs.database import SessionDep
-from libs.database.models import Order, OrderState
-from libs.database.repositories import OrderRepository
+from app.middleware.deps import unit_of_work
+from app.middleware.timing import TimedRoute
+from app.schemas.order import OrderCreate, OrderUpdate, OrderResponse, OrderStatusBulkUpdate, OrderStatusBulkResult
+from app.schemas.pagination import Page
+from libs.database.models import OrderState, UserFlag
+from libs.database.pagination import InvalidCursor
+from libs.database.repositories import OrderRepository, ProductsUnavailable, OutOfStock, StockContention
 
 router = APIRouter(
     prefix="/orders",
-    tags=["orders"]
+    tags=["orders"],
+    route_class=TimedRoute,
 )
 
 
-@router.get("/", response_model=List[OrderResponse])
+@router.get("/", response_model=Page[OrderResponse])
 @authorize()
-async def get_user_orders(request: Request):
-    """Получить список всех заказов пользователя."""
-    product_repo = OrderRepository(request.state.db)
-    products = await product_repo.get_user_orders(request.state.current_user.id)
-    return products
+async def get_user_orders(
+        request: Request,
+        cursor: Optional[str] = None,
+        limit: int = Query(20, ge=1, le=100),
+        statuses: Optional[List[OrderState]] = Query(None, alias="status"),
+):
+    """Получить страницу заказов пользователя, начиная с последних."""
+    order_repo = OrderRepository(request.state.db)
+    try:
+        orders, next_cursor = await order_repo.get_user_orders(
+            request.state.current_user.id, limit, cursor, statuses
+        )
+    except InvalidCursor:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+    return {"items": orders, "next_cursor": next_cursor}
 
 
 @router.post("/", response_model=OrderResponse)
 @authorize()
-async def create_order(order_data: OrderCreate, db: SessionDep):
-    order_repo = OrderRepository(db)
-    new_order = Order(
-        user_id=order_data.user_id,
-        status=OrderState.CREATED
+@unit_of_work()
+async def create_order(request: Request, order_data: OrderCreate):
+    """Оформить заказ."""
+    order_repo = OrderRepository(request.state.db, request.state.elastic)
+    try:
+        return await order_repo.create_order(
+            request.state.current_user.id,
+            [(item.product_id, item.quantity) for item in order_data.items],
+        )
+    except ProductsUnavailable as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={"message": "Some products are unavailable", "product_ids": [str(i) for i in e.product_ids]},
+        )
+    except OutOfStock as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={"message": "Some products are out of stock", "product_ids": [str(i) for i in e.product_ids]},
+        )
+    except StockContention as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={"message": "Stock is busy, retry the order", "product_ids": [str(i) for i in e.product_ids]},
+        )
+
+
+@router.post("/status", response_model=OrderStatusBulkResult)
+@authorize(flags=[UserFlag.ADMIN, UserFlag.MODERATOR])
+@unit_of_work()
+async def update_orders_status(request: Request, data: OrderStatusBulkUpdate):
+    """Перевести несколько заказов в новый статус одним запросом."""
+    order_repo = OrderRepository(request.state.db)
+    order_ids = list(dict.fromkeys(data.order_ids))
+    updated = await order_repo.bulk_transition(order_ids, data.status)
+
+    updated_ids = set(updated)
+    return OrderStatusBulkResult(
+        updated=updated,
+        failed=[order_id for order_id in order_ids if order_id not in updated_ids],
     )
-    new_order.products = order_data.products
-    await order_repo.add(new_order)
-    return new_order
 
 
 @router.put("/{order_id}", response_model=OrderResponse)
 @authorize()
-async def update_order(request: Request, order_id: int, data: OrderUpdate):
+@unit_of_work()
+async def update_order(request: Request, order_id: uuid.UUID, data: OrderUpdate):
+    """Перевести заказ в новый статус."""
     order_repo = OrderRepository(request.state.db)
+    user_id = request.state.current_user.id
+    order = await order_repo.transition(order_id, data.status, owner_id=user_id, version=data.version)
+    if order:
+        return order
+
     order = await order_repo.get(order_id)
-    if not order:
+    if not order or order.user_id != user_id:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Order not found")
 
-    if order.user_id != request.state.current_user.id:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authorized")
-
-    for field, value in data.model_dump(exclude_unset=True).items():
-        setattr(order, field, value)
-
-    await order_repo.update(order_id, order)
-    return order
+    raise HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail={
+            "message": "Order was changed or cannot move to this status",
+            "status": order.status,
+            "version": order.version,
+        },
+    )
 
 
 @router.delete("/{order_id}", status_code=status.HTTP_204_NO_CONTENT)
 @authorize()
-async def delete_order(request: Request, order_id: int):
+@unit_of_work()
+async def delete_order(request: Request, order_id: uuid.UUID):
     order_repo = OrderRepository(request.state.db)
-    order = await order_repo.get(order_id)
+    order = await order_repo.delete_returning(order_id, owner_id=request.state.current_user.id)
     if not order:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Order not found")
-
-    if order.user_id != request.state.current_user.id:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authorized")
-
-    await order_repo.delete(order)
-    return {"message": "Order deleted successfully"}
@@ -1,15 +1,23 @@
+import uuid
 from typing import List
 
 from fastapi import Request, APIRouter, HTTPException, status
+from sqlalchemy.exc import IntegrityError
 
 from app.middleware.auth import authorize
-from app.schemas.product import ProductCreate, ProductUpdate, ProductResponse, ProductSearchRequest
+from app.middleware.deps import unit_of_work
+from app.middleware.timing import TimedRoute
+from app.schemas.product import (
+    ProductCreate, ProductUpdate, ProductResponse, ProductSearchRequest, ProductStockUpdate
+)
 from libs.database.models import Product, ProductState
-from libs.database.repositories import ProductRepository
+from libs.database.repositories import ProductRepository, StockRepository
+from libs.database.uow import after_commit
 
 router = APIRouter(
     prefix="/products",
-    tags=["products"]
+    tags=["products"],
+    route_class=TimedRoute,
 )
 
 
@@ -34,13 +42,16 @@ async def get_products(request: Request, product_search: ProductSearchRequest):
 
 @router.post("/", response_model=ProductResponse)
 @authorize()
+@unit_of_work()
 async def create_product(request: Request, product_data: ProductCreate):
     """Создать новый продукт."""
     product_repo = get_product_repository(request)
     new_product = Product(
         title=product_data.title,
         description=product_data.description,
-        price=product_data.price
+        price=product_data.price,
+        stock=product_data.stock,
+        status=ProductState.OUT_OF_STOCK if product_data.stock == 0 else ProductState.ACTIVE,
     )
 
     new_product.user_id = request.state.current_user.id
@@ -51,36 +62,49 @@ async def create_product(request: Request, product_data: ProductCreate):
 
 @router.put("/{product_id}", response_model=ProductResponse)
 @authorize()
-async def update_product(request: Request, product_id: int, product_data: ProductUpdate):
+@unit_of_work()
+async def update_product(request: Request, product_id: uuid.UUID, product_data: ProductUpdate):
     """Обновить информацию о продукте."""
     product_repo = get_product_repository(request)
-    product = await product_repo.get(product_id)
+    product = await product_repo.update_returning(
+        product_id,
+        product_data.model_dump(exclude_unset=True),
+        owner_id=request.state.current_user.id,
+    )
 
     if not product:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
 
-    if product.user_id != request.state.current_user.id:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authorized")
+    return product
+
+
+@router.put("/{product_id}/stock", response_model=ProductResponse)
+@authorize()
+@unit_of_work()
+async def update_product_stock(request: Request, product_id: uuid.UUID, data: ProductStockUpdate):
+    """Установить остаток продукта."""
+    product_repo = get_product_repository(request)
+    product = await StockRepository(request.state.db).set_stock(
+        product_id, data.stock, data.shards, owner_id=request.state.current_user.id
+    )
 
-    for field, value in product_data.model_dump(exclude_unset=True).items():
-        setattr(product, field, value)
+    if not product:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
 
-    await product_repo.update(product_id, product)
+    await after_commit(request.state.db, product_repo.index_entity, product)
     return product
 
 
 @router.delete("/{product_id}", status_code=status.HTTP_204_NO_CONTENT)
 @authorize()
-async def delete_product(request: Request, product_id: int):
+@unit_of_work()
+async def delete_product(request: Request, product_id: uuid.UUID):
     """Удалить продукт."""
     product_repo = get_product_repository(request)
-    product = await product_repo.get(product_id)
+    try:
+        product = await product_repo.delete_returning(product_id, owner_id=request.state.current_user.id)
+    except IntegrityError:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Product is used in orders")
 
     if not product:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
-
-    if product.user_id != request.state.current_user.id:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authorized")
-
-    await product_repo.delete(product_id)
-    return {"message": "Product deleted successfully"}
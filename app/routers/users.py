@@ -3,12 +3,15 @@ import uuid
 from fastapi import Request, APIRouter, HTTPException, status
 
 from app.middleware.auth import authorize
-from app.schemas.user import UserRead
+from app.middleware.deps import unit_of_work
+from app.middleware.timing import TimedRoute
+from app.schemas.user import UserRead, UserProfileUpdate
 from libs.database.repositories import UserRepository
 
 router = APIRouter(
     prefix="/users",
-    tags=["users"]
+    tags=["users"],
+    route_class=TimedRoute,
 )
 
 
@@ -18,8 +21,35 @@ async def read_user_me(request: Request):
     """
     Возвращает информацию о текущем авторизованном пользователе.
     """
+    user_repo = UserRepository(request.state.db)
+    user = await user_repo.get(request.state.current_user.id)
+
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+
+    return user
+
+
+@router.patch("/me", response_model=UserRead)
+@authorize()
+@unit_of_work()
+async def update_user_me(request: Request, data: UserProfileUpdate):
+    """
+    Обновляет имя, фамилию и аватар текущего авторизованного пользователя.
+    """
+    user_repo = UserRepository(request.state.db)
+    user = await user_repo.update_returning(request.state.current_user.id, data.model_dump(exclude_unset=True))
 
-    return request.state.current_user
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+
+    return user
 
 
 @router.get("/{id}", response_model=UserRead)
@@ -19,3 +19,13 @@ class LoginResponse(BaseModel):
     """Схема ответа при успешной аутентификации."""
     token: str
     refresh_token: str
+
+
+class CacheStatsResponse(BaseModel):
+    """Схема ответа со счётчиками списка отозванных токенов."""
+    size: int
+    maxsize: int
+    hits: int
+    misses: int
+    evictions: int
+    hit_ratio: float
@@ -3,7 +3,7 @@ from enum import Enum
 from typing import List, Optional
 from uuid import UUID
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, computed_field
 
 
 class OrderState(str, Enum):
@@ -12,29 +12,67 @@ class OrderState(str, Enum):
     ACCEPTED = "ACCEPTED"
     IN_TRANSIT = "IN_TRANSIT"
     DELIVERED = "DELIVERED"
+    EXPIRED = "EXPIRED"
 
 
 class OrderBase(BaseModel):
     user_id: UUID
 
 
-class OrderCreate(OrderBase):
+class OrderItemCreate(BaseModel):
+    """Позиция создаваемого заказа."""
+    product_id: UUID
+    quantity: int = Field(1, ge=1)
+
+
+class OrderCreate(BaseModel):
     """Схема для создания заказа."""
-    products: List[int]
+    items: List[OrderItemCreate] = Field(..., min_length=1, max_length=1000)
 
 
 class OrderUpdate(BaseModel):
-    """Схема для обновления заказа."""
-    status: Optional[OrderState]
-    products: Optional[List[int]]
+    """Схема для смены статуса заказа."""
+    status: OrderState
+    # Версия, которую видел клиент; если заказ успели изменить, вернётся 409
+    version: Optional[int] = None
+
+
+class OrderStatusBulkUpdate(BaseModel):
+    """Схема для смены статуса нескольких заказов."""
+    order_ids: List[UUID] = Field(..., min_length=1, max_length=10000)
+    status: OrderState
+
+
+class OrderStatusBulkResult(BaseModel):
+    """Результат массовой смены статуса."""
+    updated: List[UUID]
+    failed: List[UUID]
+
+
+class OrderItemResponse(BaseModel):
+    """Позиция заказа с ценой на момент оформления."""
+    product_id: UUID
+    quantity: int
+    price: int
+
+    @computed_field
+    @property
+    def total(self) -> int:
+        return self.price * self.quantity
 
 
 class OrderResponse(OrderBase):
     """Схема для ответа при запросе заказа."""
-    id: int
+    id: UUID
     status: OrderState
+    version: int
     created_at: datetime
-    products: List[int]
+    items: List[OrderItemResponse]
+
+    @computed_field
+    @property
+    def total(self) -> int:
+        return sum(item.total for item in self.items)
 
     class Config:
         orm_mode = True
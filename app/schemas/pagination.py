@@ -0,0 +1,16 @@
+from typing import Generic, List, Optional, TypeVar
+
+from pydantic import BaseModel, computed_field
+
+T = TypeVar("T")
+
+
+class Page(BaseModel, Generic[T]):
+    """Страница списка с курсором для запроса следующей страницы."""
+    items: List[T]
+    next_cursor: Optional[str] = None
+
+    @computed_field
+    @property
+    def has_more(self) -> bool:
+        return self.next_cursor is not None
@@ -19,13 +19,21 @@ class ProductBase(BaseModel):
 
 class ProductCreate(ProductBase):
     """Схема для создания продукта."""
+    stock: Optional[int] = Field(None, ge=0)
+
+
+class ProductStockUpdate(BaseModel):
+    """Схема для установки остатка продукта."""
+    stock: int = Field(..., ge=0)
+    # Для товаров с очень высоким спросом остаток раскладывается на части
+    shards: int = Field(0, ge=0, le=256)
 
 
 class ProductUpdate(BaseModel):
     """Схема для обновления продукта."""
     title: Optional[str] = Field(None, max_length=255)
-    description: Optional[str]
-    price: Optional[int]
+    description: Optional[str] = None
+    price: Optional[int] = None
 
 
 class ProductSearchRequest(BaseModel):
@@ -42,6 +50,7 @@ class ProductResponse(ProductBase):
     """Схема для ответа при запросе продукта."""
     id: uuid.UUID
     status: ProductState
+    stock: Optional[int] = None
 
     class Config:
         orm_mode = True
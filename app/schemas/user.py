@@ -2,7 +2,7 @@ from datetime import datetime
 from typing import Optional
 from uuid import UUID
 
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict, Field
 
 
 class UserBase(BaseModel):
@@ -22,3 +22,13 @@ class UserUpdate(BaseModel):
     email: Optional[str] = None
     avatar: Optional[str] = None
     phone: Optional[str] = None
+
+
+class UserProfileUpdate(BaseModel):
+    """Схема для изменения профиля текущим пользователем, email и телефон так не меняются."""
+    model_config = ConfigDict(extra="forbid")
+
+    # Поля можно пропустить, но не обнулить: явный null не проходит проверку типа
+    first_name: str = Field(None, min_length=1, max_length=255)
+    last_name: str = Field(None, min_length=1, max_length=255)
+    avatar: str = Field(None, max_length=2048)
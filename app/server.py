@@ -1,14 +1,22 @@
-from contextlib import asynccontextmanager
+import asyncio
+from contextlib import asynccontextmanager, suppress
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from starlette.middleware.base import BaseHTTPMiddleware
 
+from app.config import settings as app_settings
 from app.elastic import index_settings
-from app.middleware.deps import add_dependencies
-from app.routers import users, auth, orders, products
-from libs.database import init_db, get_session
+from app.middleware.admission import AdmissionMiddleware
+from app.middleware.deps import DependenciesMiddleware
+from app.middleware.timing import TimingMiddleware
+from app.routers import users, auth, orders, products, metrics
+from app.utils.password import password_hasher
+from app.utils.revocation import revocation_list
+from libs.database import init_db, get_session, replicas
+from libs.database.reaper import run_reaper
 from libs.elastic.client import es_client, sync_elasticsearch
+from libs.elastic.writer import bulk_writer
+from libs.metrics import registry
 
 
 @asynccontextmanager
@@ -17,19 +25,51 @@ async def lifespan(app: FastAPI):
     async for session in get_session():
         for name, settings in index_settings.items():
             await sync_elasticsearch(session, name, settings)
+    if app_settings.elastic_write_behind:
+        await bulk_writer.start(es_client)
+    await revocation_list.start_listener()
+    replica_checks = None
+    if replicas.replicas:
+        await replicas.check()
+        replica_checks = asyncio.create_task(replicas.run_health_checks(app_settings.db_replica_check_interval))
+    metrics_flusher = asyncio.create_task(registry.run_flusher(app_settings.metrics_flush_interval))
+
+    reaper = None
+    if app_settings.reaper_enabled:
+        reaper = asyncio.create_task(run_reaper(
+            app_settings.reaper_interval,
+            app_settings.reaper_batch_size,
+            app_settings.reaper_batch_pause,
+            list(index_settings),
+        ))
 
     yield
+    for task in (reaper, metrics_flusher, replica_checks):
+        if task is None:
+            continue
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+
+    await revocation_list.stop_listener()
+    await replicas.dispose()
+    password_hasher.shutdown()
+    await bulk_writer.stop()
     await es_client.close()
 
 
 def create_app() -> FastAPI:
     app = FastAPI(lifespan=lifespan)
-    app.add_middleware(BaseHTTPMiddleware, dispatch=add_dependencies)
+    app.add_middleware(DependenciesMiddleware)
+    if app_settings.admission_enabled:
+        app.add_middleware(AdmissionMiddleware)
+    app.add_middleware(TimingMiddleware)
 
     app.include_router(users.router)
     app.include_router(auth.router)
     app.include_router(orders.router)
     app.include_router(products.router)
+    app.include_router(metrics.router)
 
     origins = [
         "http://localhost",
@@ -1,13 +1,31 @@
+import base64
+import binascii
 import hashlib
 import hmac
+import json
 import secrets
+import time
 import uuid
+from dataclasses import dataclass
 from datetime import datetime, timedelta
+from typing import Optional
 
 from app.config import settings
-from libs.database.models import Session
+from libs.database.models import Session, User
 from libs.database.repositories import SessionRepository
 
+_access_token_key = hmac.new(settings.secret_key.encode(), b"access-token", hashlib.sha256).digest()
+
+
+@dataclass(frozen=True)
+class CurrentUser:
+    """Данные пользователя, подписанные в access-токене."""
+    id: uuid.UUID
+    session_id: uuid.UUID
+    flags: int
+    issued_at: int
+    expire_at: int
+
 
 def hash_token(token: str) -> str:
     """Хэширует токен с использованием hmac.
@@ -28,23 +46,87 @@ def verify_token(token: str, hashed_token: str) -> bool:
     return hmac.compare_digest(hash_token(token), hashed_token)
 
 
-async def create_session(user_id: uuid.UUID, session_repo: SessionRepository) -> (str, str):
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def issue_access_token(user: User, session_id: uuid.UUID) -> str:
+    """Выпускает короткоживущий access-токен, подписанный секретным ключом.
+
+    Токен имеет вид `<payload>.<signature>`, где payload - JSON с идентификаторами
+    пользователя и сессии, флагами и временем жизни.
+
+    :param user: Пользователь, для которого выпускается токен.
+    :param session_id: Идентификатор сессии, к которой относится токен.
+    :return: Access-токен.
+    """
+    issued_at = int(time.time())
+    payload = json.dumps({
+        "sub": str(user.id),
+        "sid": str(session_id),
+        "flg": user.flags,
+        "iat": issued_at,
+        "exp": issued_at + settings.access_token_ttl,
+    }, separators=(",", ":")).encode()
+
+    signature = hmac.new(_access_token_key, payload, hashlib.sha256).digest()
+    return f"{_b64encode(payload)}.{_b64encode(signature)}"
+
+
+def decode_access_token(token: str, verify_expiry: bool = True) -> Optional[CurrentUser]:
+    """Проверяет подпись access-токена и возвращает его содержимое.
+
+    :param token: Access-токен.
+    :param verify_expiry: Проверять ли срок действия токена.
+    :return: Данные пользователя или None, если токен повреждён, подделан или истёк.
+    """
+    payload_part, _, signature_part = token.partition(".")
+    try:
+        payload = _b64decode(payload_part)
+        signature = _b64decode(signature_part)
+    except (binascii.Error, ValueError):
+        return None
+
+    expected = hmac.new(_access_token_key, payload, hashlib.sha256).digest()
+    if not hmac.compare_digest(expected, signature):
+        return None
+
+    claims = json.loads(payload)
+    if verify_expiry and claims["exp"] <= time.time():
+        return None
+
+    return CurrentUser(
+        id=uuid.UUID(claims["sub"]),
+        session_id=uuid.UUID(claims["sid"]),
+        flags=claims["flg"],
+        issued_at=claims["iat"],
+        expire_at=claims["exp"],
+    )
+
+
+async def create_session(user: User, session_repo: SessionRepository) -> (str, str):
     """Создаёт новую сессию с хэшированным токеном и сроком действия.
 
-    :param user_id: Идентификатор пользователя, для которого создается сессия.
+    :param user: Пользователь, для которого создается сессия.
     :param session_repo: Репозиторий для работы с сессиями.
     :return: Токен и refresh-токен для новой сессии.
     """
-    token = secrets.token_urlsafe(32)
+    session_id = uuid.uuid4()
+    token = issue_access_token(user, session_id)
     refresh_token = secrets.token_urlsafe(32)
 
     hashed_token = hash_token(token)
     hashed_refresh_token = hash_token(refresh_token)
 
     new_session = Session(
+        id=session_id,
         access_token=hashed_token,
         refresh_token=hashed_refresh_token,
-        user_id=user_id,
+        user_id=user.id,
         created_at=datetime.now(),
         expire_at=datetime.now() + timedelta(days=7)
     )
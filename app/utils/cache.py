@@ -0,0 +1,120 @@
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Generic, TypeVar, Hashable, Optional, Callable, Tuple
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+@dataclass
+class CacheStats:
+    """Счётчики работы кэша."""
+    size: int
+    maxsize: int
+    hits: int
+    misses: int
+    evictions: int
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class TTLCache(Generic[K, V]):
+    """
+    Ограниченный по размеру LRU-кэш с временем жизни записей.
+
+    Кэш живёт в памяти одного процесса и не является потокобезопасным,
+    он рассчитан на работу внутри одного event loop.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, on_evict: Optional[Callable[[K, V], None]] = None):
+        """
+        :param maxsize: Максимальное количество записей.
+        :param ttl: Время жизни записи по умолчанию в секундах.
+        :param on_evict: Функция, вызываемая при удалении записи из кэша.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self._data: OrderedDict[K, Tuple[float, V]] = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: K) -> bool:
+        return self.get(key, count=False) is not None
+
+    def get(self, key: K, count: bool = True) -> Optional[V]:
+        """
+        Возвращает значение по ключу, если запись есть и не устарела.
+
+        :param key: Ключ записи.
+        :param count: Учитывать ли обращение в счётчиках попаданий и промахов.
+        :return: Значение или None.
+        """
+        item = self._data.get(key)
+        if item is not None:
+            expire_at, value = item
+            if expire_at > time.monotonic():
+                self._data.move_to_end(key)
+                if count:
+                    self.hits += 1
+                return value
+            self._remove(key)
+
+        if count:
+            self.misses += 1
+        return None
+
+    def set(self, key: K, value: V, ttl: Optional[float] = None) -> None:
+        """
+        Сохраняет значение, вытесняя самые старые записи при переполнении.
+
+        :param key: Ключ записи.
+        :param value: Значение.
+        :param ttl: Время жизни записи в секундах, по умолчанию используется ttl кэша.
+        """
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            self.pop(key)
+            return
+
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+
+        while len(self._data) > self.maxsize:
+            oldest = next(iter(self._data))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def pop(self, key: K) -> Optional[V]:
+        """Удаляет запись из кэша и возвращает её значение."""
+        if key not in self._data:
+            return None
+        return self._remove(key)
+
+    def clear(self) -> None:
+        for key in list(self._data):
+            self._remove(key)
+
+    def stats(self) -> CacheStats:
+        return CacheStats(
+            size=len(self._data),
+            maxsize=self.maxsize,
+            hits=self.hits,
+            misses=self.misses,
+            evictions=self.evictions,
+        )
+
+    def _remove(self, key: K) -> V:
+        _, value = self._data.pop(key)
+        if self.on_evict:
+            self.on_evict(key, value)
+        return value
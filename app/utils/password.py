@@ -0,0 +1,127 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import secrets
+from concurrent.futures import ThreadPoolExecutor
+from typing import Tuple
+
+from fastapi import HTTPException, status
+
+from app.config import settings
+from app.utils.auth import verify_token
+
+SCHEME = "scrypt"
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.b64encode(data).decode()
+
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r * p, dklen=32)
+
+
+def _hash(password: str, n: int, r: int, p: int) -> str:
+    salt = secrets.token_bytes(16)
+    digest = _scrypt(password, salt, n, r, p)
+    return f"{SCHEME}${n}${r}${p}${_b64encode(salt)}${_b64encode(digest)}"
+
+
+def _verify(password: str, hashed_password: str) -> bool:
+    _, n, r, p, salt, digest = hashed_password.split("$")
+    expected = _scrypt(password, base64.b64decode(salt), int(n), int(r), int(p))
+    return hmac.compare_digest(expected, base64.b64decode(digest))
+
+
+class PasswordHasher:
+    """
+    Хэширование паролей через scrypt в отдельном пуле потоков.
+
+    scrypt отпускает GIL, поэтому пул потоков не блокирует event loop. Количество
+    ожидающих задач ограничено, при переполнении запрос отклоняется с кодом 503.
+    """
+
+    def __init__(self, workers: int, queue_size: int, n: int, r: int, p: int):
+        """
+        :param workers: Количество потоков для хэширования.
+        :param queue_size: Максимальное количество задач, ожидающих свободный поток.
+        :param n: Параметр стоимости scrypt (степень двойки).
+        :param r: Размер блока scrypt.
+        :param p: Параллелизм scrypt.
+        """
+        self.n = n
+        self.r = r
+        self.p = p
+        self.limit = workers + queue_size
+        self.pending = 0
+        self._dummy_hash = None
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password")
+
+    async def hash(self, password: str) -> str:
+        """
+        Хэширует пароль с текущими параметрами стоимости.
+
+        :param password: Пароль в открытом виде.
+        :return: Строка хэша вида `scrypt$n$r$p$salt$hash`.
+        """
+        return await self._run(_hash, password, self.n, self.r, self.p)
+
+    async def verify(self, password: str, hashed_password: str) -> Tuple[bool, bool]:
+        """
+        Проверяет пароль по сохранённому хэшу.
+
+        :param password: Пароль в открытом виде.
+        :param hashed_password: Сохранённый хэш.
+        :return: Совпадает ли пароль и нужно ли пересчитать хэш с текущими параметрами.
+        """
+        if not hashed_password.startswith(f"{SCHEME}$"):
+            # Хэши до перехода на scrypt - это hmac-sha256 от пароля
+            return verify_token(password, hashed_password), True
+
+        valid = await self._run(_verify, password, hashed_password)
+        return valid, valid and self.needs_rehash(hashed_password)
+
+    async def verify_dummy(self, password: str) -> None:
+        """
+        Проверяет пароль по хэшу, которому не соответствует ни один пароль.
+
+        Вызывается, когда пользователь не найден: ответ занимает столько же времени, сколько
+        проверка пароля существующего пользователя, и не выдаёт, зарегистрирован ли email.
+
+        :param password: Пароль в открытом виде.
+        """
+        if self._dummy_hash is None:
+            self._dummy_hash = await self._run(_hash, secrets.token_urlsafe(32), self.n, self.r, self.p)
+        await self._run(_verify, password, self._dummy_hash)
+
+    def needs_rehash(self, hashed_password: str) -> bool:
+        """Проверяет, посчитан ли хэш с параметрами, отличными от текущих."""
+        _, n, r, p, _, _ = hashed_password.split("$")
+        return (int(n), int(r), int(p)) != (self.n, self.r, self.p)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _run(self, func, *args):
+        if self.pending >= self.limit:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Server is busy, try again later",
+                headers={"Retry-After": "1"},
+            )
+
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+        finally:
+            self.pending -= 1
+
+
+password_hasher = PasswordHasher(
+    workers=settings.password_hash_workers,
+    queue_size=settings.password_hash_queue_size,
+    n=settings.password_scrypt_n,
+    r=settings.password_scrypt_r,
+    p=settings.password_scrypt_p,
+)
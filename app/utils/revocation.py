@@ -0,0 +1,57 @@
+import uuid
+from typing import Optional
+
+import asyncpg
+
+from app.config import settings
+from app.utils.auth import CurrentUser
+from app.utils.cache import TTLCache, CacheStats
+from libs.database.events import publish, listen
+
+REVOCATION_CHANNEL = "auth_revoke"
+
+
+class RevocationList:
+    """
+    Список отозванных access-токенов в памяти процесса.
+
+    Хранит идентификаторы отозванных сессий. Запись нужна только пока могут
+    существовать выпущенные до отзыва токены, поэтому живёт не дольше времени
+    жизни access-токена. Отзыв рассылается остальным воркерам через Postgres NOTIFY.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self._sessions: TTLCache[uuid.UUID, bool] = TTLCache(maxsize, ttl)
+        self._listener: Optional[asyncpg.Connection] = None
+
+    def is_revoked(self, user: CurrentUser) -> bool:
+        """
+        Проверяет, отозван ли токен.
+
+        :param user: Данные из проверенного access-токена.
+        :return: True, если сессия токена отозвана.
+        """
+        return self._sessions.get(user.session_id) is not None
+
+    async def revoke_session(self, session_id: uuid.UUID) -> None:
+        """Отзывает токены сессии во всех воркерах."""
+        self._sessions.set(session_id, True)
+        await publish(REVOCATION_CHANNEL, str(session_id))
+
+    def stats(self) -> CacheStats:
+        return self._sessions.stats()
+
+    async def start_listener(self) -> None:
+        """Подписывается на отзывы от других воркеров."""
+        self._listener = await listen(REVOCATION_CHANNEL, self._on_notification)
+
+    async def stop_listener(self) -> None:
+        if self._listener is not None:
+            await self._listener.close()
+            self._listener = None
+
+    def _on_notification(self, payload: str) -> None:
+        self._sessions.set(uuid.UUID(payload), True)
+
+
+revocation_list = RevocationList(settings.auth_revocation_size, settings.access_token_ttl)
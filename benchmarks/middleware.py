@@ -0,0 +1,92 @@
+"""
+Сравнение пропускной способности middleware зависимостей на маршруте без обращения к базе.
+
+Запросы отправляются напрямую в ASGI-приложение без сети, поэтому измеряются только
+накладные расходы middleware. Postgres и Elasticsearch для запуска не нужны.
+
+    python -m benchmarks.middleware --requests 20000
+"""
+import argparse
+import asyncio
+import time
+
+from fastapi import FastAPI, Request
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from app.middleware.deps import DependenciesMiddleware
+from libs.database import get_session
+from libs.elastic.client import get_es_client
+
+
+async def add_dependencies(request: Request, call_next):
+    """Прежняя реализация на BaseHTTPMiddleware, оставлена для сравнения."""
+    session_gen = get_session()
+    client_gen = get_es_client()
+
+    try:
+        request.state.db = await anext(session_gen)
+        request.state.elastic = await anext(client_gen)
+
+        response = await call_next(request)
+    finally:
+        await session_gen.aclose()
+        await client_gen.aclose()
+
+    return response
+
+
+def build_app(middleware: str) -> FastAPI:
+    app = FastAPI()
+    if middleware == "base":
+        app.add_middleware(BaseHTTPMiddleware, dispatch=add_dependencies)
+    else:
+        app.add_middleware(DependenciesMiddleware)
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    return app
+
+
+async def run(app: FastAPI, requests: int) -> float:
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/ping",
+        "raw_path": b"/ping",
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"host", b"localhost")],
+        "client": ("127.0.0.1", 1234),
+        "server": ("localhost", 8000),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    start = time.perf_counter()
+    for _ in range(requests):
+        await app(dict(scope), receive, send)
+    return requests / (time.perf_counter() - start)
+
+
+async def main(requests: int) -> None:
+    for name in ("base", "asgi"):
+        app = build_app(name)
+        await run(app, requests // 10)
+        rps = await run(app, requests)
+        print(f"{name:>5}: {rps:,.0f} req/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests))
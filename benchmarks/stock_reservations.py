@@ -0,0 +1,79 @@
+"""
+Пропускная способность резервирования остатка одного товара при конкурентных заказах.
+
+Каждый резерв - отдельная транзакция с условным списанием остатка и записью резерва.
+Сравниваются остаток одним числом и остаток, разложенный по частям. Нужна база данных
+из настроек приложения с применёнными миграциями; временные пользователь и товар
+удаляются после замера. Размер пула соединений должен быть не меньше числа воркеров.
+
+    python -m benchmarks.stock_reservations --workers 32 --reservations 5000 --shards 16
+"""
+import argparse
+import asyncio
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from sqlmodel import delete
+
+from libs.database.engine import async_session, engine
+from libs.database.models import Product, User
+from libs.database.repositories import StockRepository, OutOfStock
+
+
+async def create_product(user_id: uuid.UUID, stock: int, shards: int) -> uuid.UUID:
+    async with async_session() as session:
+        product = Product(user_id=user_id, title="benchmark", description="", price=1)
+        session.add(product)
+        await session.commit()
+        await StockRepository(session).set_stock(product.id, stock, shards)
+        return product.id
+
+
+async def run(product_id: uuid.UUID, shards: int, workers: int, reservations: int) -> float:
+    remaining = reservations
+    expire_at = datetime.now() + timedelta(hours=1)
+    shard_counts = {product_id: shards}
+
+    async def worker() -> None:
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            async with async_session() as session:
+                await StockRepository(session).reserve({product_id: 1}, shard_counts, expire_at=expire_at)
+                await session.commit()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(workers)))
+    return reservations / (time.perf_counter() - start)
+
+
+async def main(workers: int, reservations: int, shards: int) -> None:
+    async with async_session() as session:
+        user = User(email=f"{uuid.uuid4()}@benchmark", password="", first_name="", last_name="")
+        session.add(user)
+        await session.commit()
+
+    try:
+        for shard_count in (0, shards):
+            product_id = await create_product(user.id, reservations, shard_count)
+            try:
+                rate = await run(product_id, shard_count, workers, reservations)
+                print(f"shards={shard_count:>3}: {rate:,.0f} reservations/s")
+            except OutOfStock:
+                print(f"shards={shard_count:>3}: ran out of stock")
+    finally:
+        async with async_session() as session:
+            await session.exec(delete(Product).where(Product.user_id == user.id))
+            await session.exec(delete(User).where(User.id == user.id))
+            await session.commit()
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--reservations", type=int, default=5000)
+    parser.add_argument("--shards", type=int, default=16)
+    args = parser.parse_args()
+    asyncio.run(main(args.workers, args.reservations, args.shards))
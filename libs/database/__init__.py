@@ -1,7 +1,10 @@
-from libs.database.engine import init_db, get_session, SessionDep
+from libs.database.engine import init_db, get_session, SessionDep, replicas
+from libs.database.replicas import use_primary
 
 __all__ = [
     "init_db",
     "get_session",
-    "SessionDep"
+    "SessionDep",
+    "replicas",
+    "use_primary",
 ]
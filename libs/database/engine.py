@@ -1,23 +1,28 @@
 from typing import Annotated
 
 from fastapi import Depends
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
-from sqlmodel import SQLModel
+from sqlalchemy.ext.asyncio import async_sessionmaker
 from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app.config import settings
+from libs.database.migrations import MIGRATIONS, verify_schema
+from libs.database.pool import create_engine
+from libs.database.replicas import ReplicaSet, RoutingSession
 
-engine = create_async_engine(str(settings.db_url))
+engine = create_engine(str(settings.db_url), "primary")
+replicas = ReplicaSet(settings.db_replica_urls, settings.db_replica_max_lag)
 async_session = async_sessionmaker(
     engine,
     class_=AsyncSession,
-    expire_on_commit=False
+    sync_session_class=RoutingSession,
+    expire_on_commit=False,
+    info={"replicas": replicas} if replicas.replicas else {},
 )
 
 
 async def init_db():
-    async with engine.begin() as conn:
-        await conn.run_sync(SQLModel.metadata.create_all)
+    """Проверяет, что схема базы данных применена. Сами миграции запускаются отдельно."""
+    await verify_schema(engine, MIGRATIONS)
 
 
 async def get_session():
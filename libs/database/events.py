@@ -0,0 +1,47 @@
+import logging
+from typing import Callable
+
+import asyncpg
+from sqlalchemy import select, func
+
+from app.config import settings
+from libs.database.engine import engine
+
+logger = logging.getLogger(__name__)
+
+
+async def publish(channel: str, payload: str) -> None:
+    """
+    Отправляет уведомление через Postgres NOTIFY всем процессам, подписанным на канал.
+
+    Уведомление отправляется в отдельном соединении, поэтому не зависит от
+    транзакции текущего запроса.
+
+    :param channel: Имя канала.
+    :param payload: Текст уведомления.
+    """
+    async with engine.connect() as conn:
+        await conn.execute(select(func.pg_notify(channel, payload)))
+        await conn.commit()
+
+
+async def listen(channel: str, callback: Callable[[str], None]) -> asyncpg.Connection:
+    """
+    Подписывается на уведомления канала Postgres LISTEN.
+
+    Для подписки открывается отдельное соединение вне пула, его нужно закрыть при остановке.
+
+    :param channel: Имя канала.
+    :param callback: Функция, которая вызывается с текстом каждого уведомления.
+    :return: Соединение, которое держит подписку.
+    """
+
+    def handler(_connection, _pid, _channel, payload: str) -> None:
+        try:
+            callback(payload)
+        except Exception:
+            logger.exception("Failed to handle notification on channel %s", channel)
+
+    connection = await asyncpg.connect(str(settings.db_url.with_scheme("postgresql")))
+    await connection.add_listener(channel, handler)
+    return connection
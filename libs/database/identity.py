@@ -0,0 +1,71 @@
+from typing import Any, Dict, Optional, Tuple, Type
+
+from sqlalchemy import event
+from sqlmodel import SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from libs.database.replicas import RoutingSession
+from libs.database.tracker import current_stats
+from libs.metrics import registry
+
+identity_map_hits = registry.counter(
+    "db_identity_map_hits_total",
+    "Lookups served from the request identity map instead of the database.",
+    ["model"],
+)
+
+
+class IdentityMap:
+    """
+    Записи, загруженные через репозитории в рамках одной сессии.
+
+    Сессия живёт один запрос, поэтому все репозитории, созданные от `request.state.db`,
+    видят одни и те же записи. Ключ - модель, имя поля и значение: по первичному ключу
+    и по полям, которые репозиторий искал через `get_by_field`. Любая запись в таблицу
+    модели сбрасывает её записи целиком, чтобы не держать ключи по изменившимся полям.
+
+    В отличие от identity map самой SQLAlchemy, объекты удерживаются сильными ссылками
+    и не пропадают, если обработчик перестал на них ссылаться.
+    """
+
+    def __init__(self):
+        self._entries: Dict[Type[SQLModel], Dict[Tuple[str, Any], SQLModel]] = {}
+
+    def get(self, model: Type[SQLModel], field_name: str, value: Any) -> Optional[SQLModel]:
+        return self._entries.get(model, {}).get((field_name, value))
+
+    @staticmethod
+    def hit(model: Type[SQLModel]) -> None:
+        """Учитывает запрос к базе, который не понадобился."""
+        identity_map_hits.inc(model=model.__name__)
+        stats = current_stats()
+        if stats is not None:
+            stats.record_saved()
+
+    def put(self, entity: SQLModel, *field_names: str) -> None:
+        entries = self._entries.setdefault(type(entity), {})
+        entries[("id", entity.id)] = entity
+        for field_name in field_names:
+            entries[(field_name, getattr(entity, field_name))] = entity
+
+    def invalidate(self, model: Type[SQLModel]) -> None:
+        self._entries.pop(model, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+def get_identity_map(session: AsyncSession) -> IdentityMap:
+    """Возвращает identity map сессии, создавая её при первом обращении."""
+    identity_map = session.info.get("identity_map")
+    if identity_map is None:
+        identity_map = session.info["identity_map"] = IdentityMap()
+    return identity_map
+
+
+@event.listens_for(RoutingSession, "after_soft_rollback")
+def _clear_after_rollback(session, previous_transaction):
+    # После отката объекты сессии устаревают, отдавать их из кэша нельзя
+    identity_map = session.info.get("identity_map")
+    if identity_map is not None:
+        identity_map.clear()
@@ -0,0 +1,19 @@
+from libs.database.migrations.runner import (
+    Migration,
+    SchemaVersionError,
+    get_schema_version,
+    latest_version,
+    migrate,
+    verify_schema,
+)
+from libs.database.migrations.versions import MIGRATIONS
+
+__all__ = [
+    "Migration",
+    "MIGRATIONS",
+    "SchemaVersionError",
+    "get_schema_version",
+    "latest_version",
+    "migrate",
+    "verify_schema",
+]
@@ -0,0 +1,50 @@
+import argparse
+import asyncio
+import logging
+import sys
+
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+
+from app.config import settings
+from libs.database.migrations import MIGRATIONS, migrate, latest_version, get_schema_version
+from libs.database.migrations.checks import check_query_plans
+
+
+async def status() -> None:
+    engine = create_async_engine(str(settings.db_url), poolclass=NullPool)
+    try:
+        async with engine.connect() as conn:
+            current = await get_schema_version(conn)
+    finally:
+        await engine.dispose()
+    print(f"current: {current}, latest: {latest_version(MIGRATIONS)}")
+
+
+async def check() -> int:
+    failures = await check_query_plans()
+    for failure in failures:
+        print(f"FAIL {failure}")
+    if not failures:
+        print("All hot queries use their indexes")
+    return 1 if failures else 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog="python -m libs.database.migrations")
+    parser.add_argument("command", choices=["upgrade", "status", "check"])
+    args = parser.parse_args()
+
+    logging.basicConfig(level=settings.log_level.value)
+    if args.command == "upgrade":
+        version = asyncio.run(migrate(MIGRATIONS))
+        print(f"Schema is at version {version}")
+    elif args.command == "status":
+        asyncio.run(status())
+    else:
+        return asyncio.run(check())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,62 @@
+import json
+from typing import List, Tuple, Optional, Set, Dict, Any
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+
+from app.config import settings
+
+NIL_UUID = "00000000-0000-0000-0000-000000000000"
+
+# Горячие запросы и индексы, которыми они должны обслуживаться
+HOT_QUERIES: List[Tuple[str, str]] = [
+    ("ix_sessions_access_token", "SELECT * FROM sessions WHERE access_token = 'token'"),
+    ("ix_sessions_refresh_token", "SELECT * FROM sessions WHERE refresh_token = 'token'"),
+    ("ix_sessions_expire_at", "SELECT id FROM sessions WHERE expire_at < now() LIMIT 1000"),
+    ("ix_verification_expire_at", "SELECT id FROM verification WHERE expire_at < now() LIMIT 1000"),
+    ("ix_orders_user_id_created_at_id", f"""
+        SELECT * FROM orders
+        WHERE user_id = '{NIL_UUID}' AND (created_at, id) < (now(), '{NIL_UUID}')
+        ORDER BY created_at DESC, id DESC LIMIT 21
+    """),
+    ("ix_products_user_id", f"SELECT * FROM products WHERE user_id = '{NIL_UUID}'"),
+    ("ix_order_products_product_id", f"SELECT * FROM order_products WHERE product_id = '{NIL_UUID}'"),
+]
+
+
+def _used_indexes(plan: Dict[str, Any]) -> Set[str]:
+    indexes = {plan["Index Name"]} if "Index Name" in plan else set()
+    for child in plan.get("Plans", []):
+        indexes |= _used_indexes(child)
+    return indexes
+
+
+async def check_query_plans(url: Optional[str] = None) -> List[str]:
+    """
+    Проверяет через EXPLAIN, что горячие запросы могут использовать свои индексы.
+
+    Последовательное сканирование отключается, иначе на маленьких таблицах планировщик
+    всегда выбирает его и проверка ничего не покажет.
+
+    :param url: Адрес базы данных, по умолчанию из настроек.
+    :return: Список описаний запросов, которые не используют ожидаемый индекс.
+    """
+    engine = create_async_engine(url or str(settings.db_url), poolclass=NullPool)
+    failures = []
+    try:
+        async with engine.begin() as conn:
+            await conn.execute(text("SET LOCAL enable_seqscan = off"))
+            for index, query in HOT_QUERIES:
+                plan = await conn.scalar(text(f"EXPLAIN (FORMAT JSON) {query}"))
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+
+                used = _used_indexes(plan[0]["Plan"])
+                if index not in used:
+                    failures.append(f"{query!r} uses {sorted(used) or 'no index'} instead of {index}")
+            await conn.rollback()
+    finally:
+        await engine.dispose()
+
+    return failures
@@ -0,0 +1,164 @@
+import logging
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Callable, Awaitable, List, Optional, AsyncIterator
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Произвольный ключ advisory-блокировки, чтобы миграции не запускались параллельно
+MIGRATION_LOCK_KEY = 7_311_024_001
+
+
+@dataclass(frozen=True)
+class Migration:
+    """
+    Версия схемы базы данных.
+
+    :param version: Номер версии, версии применяются по возрастанию.
+    :param name: Краткое описание изменения.
+    :param upgrade: Функция, которая применяет изменение.
+    :param transactional: Выполнять ли изменение в транзакции. Для `CREATE INDEX CONCURRENTLY`
+        нужно False, такие миграции должны быть идемпотентными.
+    """
+    version: int
+    name: str
+    upgrade: Callable[[AsyncConnection], Awaitable[None]]
+    transactional: bool = True
+
+
+class SchemaVersionError(RuntimeError):
+    """Версия схемы базы данных не совпадает с ожидаемой приложением."""
+
+
+def latest_version(migrations: List[Migration]) -> int:
+    return max(migration.version for migration in migrations)
+
+
+async def _ensure_version_table(conn: AsyncConnection) -> None:
+    await conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP NOT NULL DEFAULT now()
+        )
+    """))
+
+
+async def get_schema_version(conn: AsyncConnection) -> Optional[int]:
+    """
+    Возвращает текущую версию схемы.
+
+    :return: Номер последней применённой миграции или None, если миграции не применялись.
+    """
+    exists = await conn.scalar(text("SELECT to_regclass('schema_version') IS NOT NULL"))
+    if not exists:
+        return None
+    return await conn.scalar(text("SELECT max(version) FROM schema_version"))
+
+
+async def migrate(migrations: List[Migration], url: Optional[str] = None) -> int:
+    """
+    Применяет все ещё не применённые миграции.
+
+    Миграции выполняются под advisory-блокировкой, поэтому одновременный
+    запуск из нескольких процессов безопасен.
+
+    :param migrations: Список миграций.
+    :param url: Адрес базы данных, по умолчанию из настроек.
+    :return: Версия схемы после применения миграций.
+    """
+    engine = create_async_engine(url or str(settings.db_url), poolclass=NullPool)
+    try:
+        async with _autocommit(engine) as lock_conn:
+            await lock_conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+            try:
+                await _ensure_version_table(lock_conn)
+                current = await get_schema_version(lock_conn) or 0
+
+                for migration in sorted(migrations, key=lambda m: m.version):
+                    if migration.version <= current:
+                        continue
+
+                    logger.info("Applying migration %s: %s", migration.version, migration.name)
+                    connection = engine.begin() if migration.transactional else _autocommit(engine)
+                    async with connection as conn:
+                        await migration.upgrade(conn)
+                        await _record(conn, migration)
+                    current = migration.version
+            finally:
+                await lock_conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATION_LOCK_KEY})
+
+        return current
+    finally:
+        await engine.dispose()
+
+
+async def verify_schema(engine: AsyncEngine, migrations: List[Migration]) -> None:
+    """
+    Проверяет, что база данных находится на последней известной версии схемы.
+
+    :raises SchemaVersionError: Если миграции не применены.
+    """
+    expected = latest_version(migrations)
+    async with engine.connect() as conn:
+        current = await get_schema_version(conn)
+
+    if current is None or current < expected:
+        raise SchemaVersionError(
+            f"Database schema is at version {current}, expected {expected}. "
+            f"Run `python -m libs.database.migrations upgrade`."
+        )
+    if current > expected:
+        logger.warning("Database schema version %s is newer than the application (%s)", current, expected)
+
+
+@asynccontextmanager
+async def _autocommit(engine: AsyncEngine) -> AsyncIterator[AsyncConnection]:
+    async with engine.connect() as conn:
+        yield await conn.execution_options(isolation_level="AUTOCOMMIT")
+
+
+async def _record(conn: AsyncConnection, migration: Migration) -> None:
+    await conn.execute(
+        text("INSERT INTO schema_version (version, name) VALUES (:version, :name) ON CONFLICT DO NOTHING"),
+        {"version": migration.version, "name": migration.name},
+    )
+
+
+async def create_index_concurrently(
+        conn: AsyncConnection,
+        name: str,
+        table: str,
+        columns: str,
+        unique: bool = False
+) -> None:
+    """
+    Создаёт индекс без блокировки записи в таблицу.
+
+    Если прошлая попытка оборвалась и оставила невалидный индекс, он пересоздаётся.
+    Соединение должно быть в режиме AUTOCOMMIT.
+
+    :param conn: Соединение с базой данных.
+    :param name: Имя индекса.
+    :param table: Имя таблицы.
+    :param columns: Список колонок индекса в синтаксисе SQL.
+    :param unique: Создать ли уникальный индекс.
+    """
+    invalid = await conn.scalar(text("""
+        SELECT NOT i.indisvalid
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE c.relname = :name
+    """), {"name": name})
+    if invalid:
+        await conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS "{name}"'))
+
+    await conn.execute(text(
+        f'CREATE {"UNIQUE " if unique else ""}INDEX CONCURRENTLY IF NOT EXISTS "{name}" ON "{table}" ({columns})'
+    ))
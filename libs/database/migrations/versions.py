@@ -0,0 +1,125 @@
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+from sqlmodel import SQLModel
+
+import libs.database.models  # noqa: F401 - регистрирует таблицы в метаданных
+from libs.database.models import ProductStockShard, StockReservation, ProductTombstone, SearchSyncState
+from libs.database.migrations.runner import Migration, create_index_concurrently
+
+
+async def create_tables(conn: AsyncConnection) -> None:
+    # Базовая версия: создаёт отсутствующие таблицы, существующие базы не меняются
+    await conn.run_sync(SQLModel.metadata.create_all)
+
+
+async def add_lookup_indexes(conn: AsyncConnection) -> None:
+    await create_index_concurrently(conn, "ix_sessions_access_token", "sessions", "access_token")
+    await create_index_concurrently(conn, "ix_sessions_refresh_token", "sessions", "refresh_token")
+    await create_index_concurrently(conn, "ix_sessions_expire_at", "sessions", "expire_at")
+    await create_index_concurrently(conn, "ix_verification_expire_at", "verification", "expire_at")
+    await create_index_concurrently(conn, "ix_orders_user_id", "orders", "user_id")
+    await create_index_concurrently(conn, "ix_products_user_id", "products", "user_id")
+    await create_index_concurrently(conn, "ix_order_products_product_id", "order_products", "product_id")
+
+
+async def cascade_order_products(conn: AsyncConnection) -> None:
+    # Позиции заказа удаляются вместе с заказом одним DELETE
+    await conn.execute(text(
+        "ALTER TABLE order_products "
+        "DROP CONSTRAINT IF EXISTS order_products_order_id_fkey, "
+        "ADD CONSTRAINT order_products_order_id_fkey "
+        "FOREIGN KEY (order_id) REFERENCES orders (id) ON DELETE CASCADE"
+    ))
+
+
+async def add_order_item_details(conn: AsyncConnection) -> None:
+    await conn.execute(text(
+        "ALTER TABLE order_products "
+        "ADD COLUMN IF NOT EXISTS quantity INTEGER NOT NULL DEFAULT 1, "
+        "ADD COLUMN IF NOT EXISTS price INTEGER NOT NULL DEFAULT 0"
+    ))
+
+
+async def add_order_history_index(conn: AsyncConnection) -> None:
+    await create_index_concurrently(
+        conn, "ix_orders_user_id_created_at_id", "orders", "user_id, created_at, id"
+    )
+    # Поиск по user_id обслуживается префиксом составного индекса
+    await conn.execute(text('DROP INDEX CONCURRENTLY IF EXISTS "ix_orders_user_id"'))
+
+
+async def add_order_version(conn: AsyncConnection) -> None:
+    await conn.execute(text("ALTER TABLE orders ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1"))
+
+
+async def add_stock(conn: AsyncConnection) -> None:
+    await conn.execute(text(
+        "ALTER TABLE products "
+        "ADD COLUMN IF NOT EXISTS stock INTEGER, "
+        "ADD COLUMN IF NOT EXISTS stock_shards INTEGER NOT NULL DEFAULT 0"
+    ))
+    await conn.execute(text("ALTER TABLE orders ADD COLUMN IF NOT EXISTS reserved_until TIMESTAMP WITHOUT TIME ZONE"))
+    await conn.run_sync(lambda sync_conn: SQLModel.metadata.create_all(
+        sync_conn, tables=[ProductStockShard.__table__, StockReservation.__table__]
+    ))
+
+
+async def track_product_changes(conn: AsyncConnection) -> None:
+    await conn.execute(text("ALTER TABLE products ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITHOUT TIME ZONE"))
+    await conn.execute(text("UPDATE products SET updated_at = created_at WHERE updated_at IS NULL"))
+    await conn.run_sync(lambda sync_conn: SQLModel.metadata.create_all(
+        sync_conn, tables=[ProductTombstone.__table__, SearchSyncState.__table__]
+    ))
+
+    # Отметки ставит база, чтобы их не пропустил ни один путь записи: UPDATE из репозиториев,
+    # списание остатка, каскадное удаление вместе с пользователем
+    await conn.execute(text(
+        "CREATE OR REPLACE FUNCTION products_touch_updated_at() RETURNS trigger AS $$ "
+        "BEGIN NEW.updated_at := clock_timestamp()::timestamp; RETURN NEW; END; "
+        "$$ LANGUAGE plpgsql"
+    ))
+    await conn.execute(text("DROP TRIGGER IF EXISTS products_touch_updated_at ON products"))
+    await conn.execute(text(
+        "CREATE TRIGGER products_touch_updated_at BEFORE INSERT OR UPDATE ON products "
+        "FOR EACH ROW EXECUTE FUNCTION products_touch_updated_at()"
+    ))
+
+    await conn.execute(text(
+        "CREATE OR REPLACE FUNCTION products_write_tombstones() RETURNS trigger AS $$ "
+        "BEGIN "
+        "INSERT INTO product_tombstones (product_id, deleted_at) "
+        "SELECT id, clock_timestamp()::timestamp FROM deleted_products "
+        "ON CONFLICT (product_id) DO UPDATE SET deleted_at = EXCLUDED.deleted_at; "
+        "RETURN NULL; "
+        "END; "
+        "$$ LANGUAGE plpgsql"
+    ))
+    await conn.execute(text("DROP TRIGGER IF EXISTS products_write_tombstones ON products"))
+    # Триггер на уровне оператора: одна вставка отметок на весь DELETE, а не на каждую строку
+    await conn.execute(text(
+        "CREATE TRIGGER products_write_tombstones AFTER DELETE ON products "
+        "REFERENCING OLD TABLE AS deleted_products "
+        "FOR EACH STATEMENT EXECUTE FUNCTION products_write_tombstones()"
+    ))
+
+
+async def add_product_changes_index(conn: AsyncConnection) -> None:
+    await create_index_concurrently(conn, "ix_products_updated_at_id", "products", "updated_at, id")
+
+
+async def add_expired_order_state(conn: AsyncConnection) -> None:
+    await conn.execute(text("ALTER TYPE orderstate ADD VALUE IF NOT EXISTS 'EXPIRED'"))
+
+
+MIGRATIONS = [
+    Migration(1, "create tables", create_tables),
+    Migration(2, "add lookup indexes", add_lookup_indexes, transactional=False),
+    Migration(3, "cascade order products", cascade_order_products),
+    Migration(4, "add order item details", add_order_item_details),
+    Migration(5, "add order history index", add_order_history_index, transactional=False),
+    Migration(6, "add order version", add_order_version),
+    Migration(7, "add stock", add_stock),
+    Migration(8, "track product changes", track_product_changes),
+    Migration(9, "add product changes index", add_product_changes_index, transactional=False),
+    Migration(10, "add expired order state", add_expired_order_state),
+]
@@ -1,6 +1,8 @@
-from .order import Order, OrderProductLink, OrderState
+from .order import Order, OrderProductLink, OrderState, ORDER_TRANSITIONS, transition_sources
 from .product import Product, ProductState
+from .search import ProductTombstone, SearchSyncState
 from .session import Session
+from .stock import ProductStockShard, StockReservation
 from .user import User, UserFlag
 from .verify import Verification, VerificationType
 
@@ -10,9 +12,15 @@ __all__ = [
     "Order",
     "OrderProductLink",
     "OrderState",
+    "ORDER_TRANSITIONS",
+    "transition_sources",
     "Product",
     "ProductState",
+    "ProductTombstone",
+    "SearchSyncState",
     "Session",
+    "ProductStockShard",
+    "StockReservation",
     "Verification",
     "VerificationType"
 ]
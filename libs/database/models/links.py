@@ -6,5 +6,9 @@ from sqlmodel import SQLModel, Field
 
 class OrderProductLink(SQLModel, table=True):
     __tablename__ = 'order_products'
-    order_id: Optional[uuid.UUID] = Field(default=None, foreign_key="orders.id", primary_key=True)
-    product_id: Optional[uuid.UUID] = Field(default=None, foreign_key="products.id", primary_key=True)
+    order_id: Optional[uuid.UUID] = Field(default=None, foreign_key="orders.id", primary_key=True, ondelete="CASCADE")
+    product_id: Optional[uuid.UUID] = Field(default=None, foreign_key="products.id", primary_key=True, index=True)
+
+    quantity: int = Field(default=1)
+    # Цена единицы товара на момент оформления заказа
+    price: int = Field(default=0)
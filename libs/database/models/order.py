@@ -1,8 +1,9 @@
 import uuid
 from datetime import datetime
 from enum import Enum
-from typing import List, Optional, TYPE_CHECKING
+from typing import List, Optional, TYPE_CHECKING, Dict, Set
 
+from sqlalchemy import Index
 from sqlmodel import SQLModel, Field, Relationship
 
 from .links import OrderProductLink
@@ -18,16 +19,44 @@ class OrderState(str, Enum):
     ACCEPTED = "ACCEPTED"
     IN_TRANSIT = "IN_TRANSIT"
     DELIVERED = "DELIVERED"
+    EXPIRED = "EXPIRED"
+
+
+# Допустимые переходы между статусами заказа. В EXPIRED заказ переводит только сборщик
+# просроченных резервов, когда истекает reserved_until
+ORDER_TRANSITIONS: Dict[OrderState, Set[OrderState]] = {
+    OrderState.PENDING: {OrderState.CREATED},
+    OrderState.CREATED: {OrderState.ACCEPTED},
+    OrderState.ACCEPTED: {OrderState.IN_TRANSIT},
+    OrderState.IN_TRANSIT: {OrderState.DELIVERED},
+    OrderState.DELIVERED: set(),
+    OrderState.EXPIRED: set(),
+}
+
+
+def transition_sources(target: OrderState) -> List[OrderState]:
+    """Статусы, из которых заказ можно перевести в target."""
+    return [source for source, targets in ORDER_TRANSITIONS.items() if target in targets]
 
 
 class Order(SQLModel, table=True):
     __tablename__ = 'orders'
+    __table_args__ = (
+        # История заказов пользователя: фильтр по user_id и пагинация по (created_at, id)
+        Index("ix_orders_user_id_created_at_id", "user_id", "created_at", "id"),
+    )
 
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     user_id: uuid.UUID = Field(foreign_key="users.id")
 
     status: OrderState = Field(default=OrderState.CREATED)
+    # Увеличивается при каждой смене статуса, используется для compare-and-swap
+    version: int = Field(default=1)
+    # До какого момента за заказом держится остаток, None - резервов нет
+    reserved_until: Optional[datetime] = None
     created_at: datetime = Field(default_factory=datetime.now)
 
     user: Optional["User"] = Relationship(back_populates="orders")
     products: List["Product"] = Relationship(back_populates="orders", link_model=OrderProductLink)
+    # Позиции заказа с количеством и ценой, только для чтения: создаются одним INSERT в OrderRepository
+    items: List[OrderProductLink] = Relationship(sa_relationship_kwargs={"viewonly": True})
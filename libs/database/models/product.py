@@ -3,6 +3,7 @@ from datetime import datetime
 from enum import Enum
 from typing import List, Optional, TYPE_CHECKING
 
+from sqlalchemy import FetchedValue, Index
 from sqlmodel import SQLModel, Field, Relationship
 
 from .links import OrderProductLink
@@ -20,15 +21,27 @@ class ProductState(str, Enum):
 
 class Product(SQLModel, table=True):
     __tablename__ = 'products'
+    __table_args__ = (
+        # Инкрементальная синхронизация поиска читает изменения по (updated_at, id)
+        Index("ix_products_updated_at_id", "updated_at", "id"),
+    )
 
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
-    user_id: uuid.UUID = Field(foreign_key="users.id")
+    user_id: uuid.UUID = Field(foreign_key="users.id", index=True)
 
     title: str
     description: str
     price: int
     status: ProductState = Field(default=ProductState.ACTIVE)
+    # Остаток на складе, None - остаток не учитывается
+    stock: Optional[int] = None
+    # Количество частей в product_stock_shards, 0 - остаток хранится в stock
+    stock_shards: int = Field(default=0)
     created_at: datetime = Field(default_factory=datetime.now)
+    # Время последнего изменения строки, его ставит триггер на любую вставку и обновление
+    updated_at: Optional[datetime] = Field(
+        default=None, sa_column_kwargs={"server_default": FetchedValue(), "server_onupdate": FetchedValue()}
+    )
 
     user: Optional["User"] = Relationship(back_populates="products")
     orders: List["Order"] = Relationship(back_populates="products", link_model=OrderProductLink)
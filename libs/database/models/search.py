@@ -0,0 +1,26 @@
+import uuid
+from datetime import datetime
+from typing import Optional
+
+from sqlmodel import SQLModel, Field
+
+
+class ProductTombstone(SQLModel, table=True):
+    """
+    Отметка об удалённом продукте для инкрементальной синхронизации поиска.
+
+    Строки пишет триггер на удаление из products, поэтому удаления любым путём,
+    включая каскадные, доходят до индекса.
+    """
+    __tablename__ = 'product_tombstones'
+
+    product_id: uuid.UUID = Field(primary_key=True)
+    deleted_at: datetime = Field(index=True)
+
+
+class SearchSyncState(SQLModel, table=True):
+    """До какого момента изменения уже отправлены в поисковый индекс."""
+    __tablename__ = 'search_sync_state'
+
+    index_name: str = Field(primary_key=True)
+    synced_until: Optional[datetime] = None
@@ -14,10 +14,10 @@ class Session(SQLModel, table=True):
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     user_id: uuid.UUID = Field(foreign_key="users.id")
 
-    access_token: str
-    refresh_token: str
+    access_token: str = Field(index=True)
+    refresh_token: str = Field(index=True)
 
     created_at: datetime = Field(default_factory=datetime.now)
-    expire_at: datetime
+    expire_at: datetime = Field(index=True)
 
     user: Optional["User"] = Relationship(back_populates="sessions")
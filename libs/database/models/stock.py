@@ -0,0 +1,34 @@
+import uuid
+from datetime import datetime
+from typing import Optional
+
+from sqlmodel import SQLModel, Field
+
+
+class ProductStockShard(SQLModel, table=True):
+    """
+    Часть остатка товара с очень высоким спросом.
+
+    Остаток такого товара разложен по нескольким строкам, чтобы одновременные
+    заказы списывали его из разных строк и не ждали блокировку одной.
+    """
+    __tablename__ = 'product_stock_shards'
+
+    product_id: uuid.UUID = Field(foreign_key="products.id", primary_key=True, ondelete="CASCADE")
+    shard: int = Field(primary_key=True)
+    stock: int = Field(default=0)
+
+
+class StockReservation(SQLModel, table=True):
+    """Списанный под заказ остаток, который вернётся на склад, если заказ не подтвердят вовремя."""
+    __tablename__ = 'stock_reservations'
+
+    id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
+    order_id: Optional[uuid.UUID] = Field(default=None, foreign_key="orders.id", index=True, ondelete="SET NULL")
+    product_id: uuid.UUID = Field(foreign_key="products.id", ondelete="CASCADE")
+    # Номер части остатка, если остаток товара разложен по частям
+    shard: Optional[int] = None
+    quantity: int
+
+    created_at: datetime = Field(default_factory=datetime.now)
+    expire_at: datetime = Field(index=True)
@@ -22,6 +22,6 @@ class Verification(SQLModel, table=True):
     verification_code: str
 
     created_at: datetime = Field(default_factory=datetime.now)
-    expire_at: datetime
+    expire_at: datetime = Field(index=True)
 
     user: Optional["User"] = Relationship(back_populates="verifications")
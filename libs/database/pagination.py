@@ -0,0 +1,63 @@
+import base64
+import binascii
+import json
+import uuid
+from datetime import datetime
+from typing import Any, Callable, List
+
+
+class InvalidCursor(ValueError):
+    """Курсор повреждён или не относится к этому списку."""
+
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _decode_value(value: Any, kind: Callable[[Any], Any]) -> Any:
+    if kind is uuid.UUID or kind is datetime:
+        # UUID и время кодируются строками, остальное - признак подделанного курсора
+        if not isinstance(value, str):
+            raise InvalidCursor("Invalid cursor")
+    if kind is datetime:
+        decoded = datetime.fromisoformat(value)
+        # Колонки времени хранятся без часового пояса, сравнение с aware-значением упадёт в базе
+        if decoded.tzinfo is not None:
+            raise InvalidCursor("Invalid cursor")
+        return decoded
+    return kind(value)
+
+
+def encode_cursor(*values: Any) -> str:
+    """
+    Кодирует значения ключа последней записи страницы в непрозрачный курсор.
+
+    :param values: Значения колонок сортировки последней записи.
+    :return: Курсор для запроса следующей страницы.
+    """
+    payload = json.dumps([_encode_value(value) for value in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str, *kinds: Callable[[Any], Any]) -> List[Any]:
+    """
+    Раскодирует курсор, полученный от `encode_cursor`.
+
+    :param cursor: Курсор из запроса клиента.
+    :param kinds: Типы значений ключа в порядке колонок сортировки.
+    :return: Значения ключа, после которого начинается страница.
+    :raises InvalidCursor: Если курсор повреждён.
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if not isinstance(values, list) or len(values) != len(kinds):
+            raise InvalidCursor("Invalid cursor")
+        return [_decode_value(value, kind) for value, kind in zip(values, kinds)]
+    except InvalidCursor:
+        raise
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError, AttributeError) as e:
+        raise InvalidCursor("Invalid cursor") from e
@@ -0,0 +1,92 @@
+import time
+from typing import Dict, Any
+
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from app.config import settings
+from libs.database.tracker import install_tracker
+from libs.metrics import registry
+
+pool_checkout_wait = registry.histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time spent waiting for a connection from the pool.",
+    ["pool"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0, 30.0),
+)
+pool_timeouts = registry.counter(
+    "db_pool_timeouts_total",
+    "Connection checkouts that timed out waiting for the pool.",
+    ["pool"],
+)
+pool_checked_out = registry.gauge(
+    "db_pool_checked_out",
+    "Connections currently checked out of the pool.",
+    ["pool"],
+)
+pool_saturation = registry.gauge(
+    "db_pool_saturation",
+    "Share of the pool capacity (size + overflow) currently checked out.",
+    ["pool"],
+)
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """Пул соединений, который замеряет время ожидания свободного соединения."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            pool_timeouts.inc(pool=self.logging_name)
+            raise
+        finally:
+            pool_checkout_wait.observe(time.perf_counter() - start, pool=self.logging_name)
+
+
+def _connect_args() -> Dict[str, Any]:
+    server_settings = {}
+    if settings.db_statement_timeout:
+        server_settings["statement_timeout"] = str(settings.db_statement_timeout)
+    if settings.db_lock_timeout:
+        server_settings["lock_timeout"] = str(settings.db_lock_timeout)
+
+    return {
+        "statement_cache_size": settings.db_statement_cache_size,
+        "prepared_statement_cache_size": settings.db_prepared_statement_cache_size,
+        "server_settings": server_settings,
+    }
+
+
+def create_engine(url: str, name: str) -> AsyncEngine:
+    """
+    Создаёт движок с настройками пула из конфигурации.
+
+    :param url: Адрес базы данных.
+    :param name: Имя пула для метрик.
+    :return: Асинхронный движок.
+    """
+    new_engine = create_async_engine(
+        url,
+        echo=settings.db_echo,
+        poolclass=InstrumentedPool,
+        pool_logging_name=name,
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=settings.db_pool_timeout,
+        pool_recycle=settings.db_pool_recycle,
+        pool_pre_ping=settings.db_pool_pre_ping,
+        connect_args=_connect_args(),
+    )
+
+    def collect() -> None:
+        pool = new_engine.pool
+        checked_out = pool.checkedout()
+        pool_checked_out.set(checked_out, pool=name)
+        pool_saturation.set(checked_out / (settings.db_pool_size + settings.db_max_overflow), pool=name)
+
+    registry.add_collector(collect)
+    install_tracker(new_engine)
+    return new_engine
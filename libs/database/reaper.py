@@ -0,0 +1,121 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Type, Dict, Union, Sequence
+
+from sqlmodel import select, delete
+
+from libs.database.engine import async_session
+from libs.database.models import Session, Verification
+from libs.database.repositories.order import OrderRepository
+from libs.database.repositories.search import SearchSyncRepository
+from libs.database.repositories.stock import StockRepository
+from libs.elastic.client import es_client, sync_changes
+
+logger = logging.getLogger(__name__)
+
+ExpiringModel = Union[Type[Session], Type[Verification]]
+
+
+async def purge_expired(model: ExpiringModel, batch_size: int) -> int:
+    """
+    Удаляет одну пачку просроченных записей в отдельной транзакции.
+
+    Строки выбираются через `FOR UPDATE SKIP LOCKED`, поэтому несколько воркеров
+    могут чистить таблицу одновременно, не блокируя друг друга.
+
+    :param model: Модель с полем expire_at.
+    :param batch_size: Максимальное количество удаляемых записей.
+    :return: Количество удалённых записей.
+    """
+    expired_ids = (
+        select(model.id)
+        .where(model.expire_at < datetime.now())
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+
+    async with async_session() as session:
+        result = await session.exec(delete(model).where(model.id.in_(expired_ids)))
+        await session.commit()
+        return result.rowcount
+
+
+async def release_reservations(batch_size: int) -> int:
+    """Возвращает на склад одну пачку просроченных резервов в отдельной транзакции и переиндексирует продукты."""
+    async with async_session() as session:
+        return await StockRepository(session, es_client).release_expired(batch_size)
+
+
+async def expire_orders(batch_size: int) -> int:
+    """Переводит в EXPIRED одну пачку заказов с истёкшим резервом в отдельной транзакции."""
+    async with async_session() as session:
+        return await OrderRepository(session).expire_reserved(batch_size)
+
+
+async def sync_search(index_names: Sequence[str]) -> None:
+    """Отправляет в поисковые индексы изменения из ленты базы данных, ошибка одного индекса не мешает остальным."""
+    for index_name in index_names:
+        try:
+            async with async_session() as session:
+                await sync_changes(session, index_name)
+        except Exception:
+            logger.exception("Elasticsearch index %s sync failed", index_name)
+
+
+async def purge_tombstones(batch_size: int) -> int:
+    """Удаляет одну пачку отметок об удалении продуктов, уже отправленных в поиск."""
+    async with async_session() as session:
+        return await SearchSyncRepository(session).purge_tombstones(batch_size)
+
+
+async def reap(batch_size: int, batch_pause: float, search_indices: Sequence[str] = ()) -> Dict[str, int]:
+    """
+    Удаляет все просроченные сессии, коды подтверждения и отправленные в поиск отметки об удалении,
+    освобождает просроченные резервы и переводит их заказы в EXPIRED пачками.
+
+    Перед удалением отметок об удалении в поисковые индексы отправляются изменения из ленты
+    базы данных, в том числе те, что не записала очередь отложенной записи.
+
+    :param batch_size: Размер пачки.
+    :param batch_pause: Пауза между пачками в секундах.
+    :param search_indices: Алиасы поисковых индексов, которые нужно синхронизировать.
+    :return: Количество удалённых записей по таблицам.
+    """
+    purged = {}
+    for model in (Session, Verification):
+        purged[model.__tablename__] = await _drain(lambda: purge_expired(model, batch_size), batch_size, batch_pause)
+    purged["stock_reservations"] = await _drain(lambda: release_reservations(batch_size), batch_size, batch_pause)
+    purged["orders"] = await _drain(lambda: expire_orders(batch_size), batch_size, batch_pause)
+    await sync_search(search_indices)
+    purged["product_tombstones"] = await _drain(lambda: purge_tombstones(batch_size), batch_size, batch_pause)
+    return purged
+
+
+async def _drain(purge_batch, batch_size: int, batch_pause: float) -> int:
+    total = 0
+    while True:
+        count = await purge_batch()
+        total += count
+        if count < batch_size:
+            return total
+        await asyncio.sleep(batch_pause)
+
+
+async def run_reaper(interval: float, batch_size: int, batch_pause: float, search_indices: Sequence[str] = ()) -> None:
+    """
+    Периодически удаляет просроченные записи, пока задача не будет отменена.
+
+    :param interval: Интервал между запусками в секундах.
+    :param batch_size: Размер пачки.
+    :param batch_pause: Пауза между пачками в секундах.
+    :param search_indices: Алиасы поисковых индексов, которые нужно синхронизировать.
+    """
+    while True:
+        try:
+            purged = await reap(batch_size, batch_pause, search_indices)
+            logger.info("Reaper purged expired rows: %s", purged)
+        except Exception:
+            logger.exception("Reaper run failed")
+
+        await asyncio.sleep(interval)
@@ -0,0 +1,129 @@
+import asyncio
+import itertools
+import logging
+from typing import List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlmodel import Session
+
+from libs.database.pool import create_engine
+from libs.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+REPLICA_LAG_QUERY = text("""
+    SELECT CASE
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+""")
+
+replica_lag = registry.gauge(
+    "db_replica_lag_seconds",
+    "Replication lag of each read replica.",
+    ["pool"],
+)
+replica_healthy = registry.gauge(
+    "db_replica_healthy",
+    "Whether the read replica is in rotation (1) or not (0).",
+    ["pool"],
+)
+
+
+class Replica:
+    def __init__(self, name: str, url: str):
+        self.name = name
+        self.engine: AsyncEngine = create_engine(url, name)
+        self.healthy = False
+        self.lag: Optional[float] = None
+
+
+class ReplicaSet:
+    """
+    Набор реплик для чтения с проверкой отставания.
+
+    Реплика выводится из ротации, если она недоступна или отстаёт больше допустимого.
+    """
+
+    def __init__(self, urls: List[str], max_lag: float):
+        """
+        :param urls: Адреса реплик.
+        :param max_lag: Максимально допустимое отставание реплики в секундах.
+        """
+        self.replicas = [Replica(f"replica-{number}", url) for number, url in enumerate(urls, start=1)]
+        self.max_lag = max_lag
+        self._counter = itertools.count()
+
+    def choose(self) -> Optional[Replica]:
+        """Выбирает следующую исправную реплику по кругу или None, если таких нет."""
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if not healthy:
+            return None
+        return healthy[next(self._counter) % len(healthy)]
+
+    async def check(self) -> None:
+        """Проверяет доступность и отставание каждой реплики."""
+        for replica in self.replicas:
+            try:
+                async with replica.engine.connect() as conn:
+                    replica.lag = float((await conn.execute(REPLICA_LAG_QUERY)).scalar_one())
+                healthy = replica.lag <= self.max_lag
+            except Exception:
+                logger.exception("Replica %s health check failed", replica.name)
+                replica.lag = None
+                healthy = False
+
+            if healthy != replica.healthy:
+                logger.warning("Replica %s is %s rotation (lag: %s)",
+                               replica.name, "back in" if healthy else "out of", replica.lag)
+            replica.healthy = healthy
+
+            replica_healthy.set(int(healthy), pool=replica.name)
+            if replica.lag is not None:
+                replica_lag.set(replica.lag, pool=replica.name)
+
+    async def run_health_checks(self, interval: float) -> None:
+        """Периодически проверяет реплики, пока задача не будет отменена."""
+        while True:
+            await asyncio.sleep(interval)
+            await self.check()
+
+    async def dispose(self) -> None:
+        for replica in self.replicas:
+            await replica.engine.dispose()
+
+
+class RoutingSession(Session):
+    """
+    Сессия, которая направляет чтение на реплики, а запись - на основную базу.
+
+    После первой записи все последующие запросы сессии идут в основную базу,
+    чтобы в рамках запроса читались собственные изменения. Того же можно добиться
+    явно через `use_primary`.
+    """
+
+    def get_bind(self, mapper=None, *, clause=None, **kw):
+        replicas: Optional[ReplicaSet] = self.info.get("replicas")
+        if replicas is None or self.info.get("use_primary"):
+            return super().get_bind(mapper, clause=clause, **kw)
+
+        is_read = (
+            not self._flushing
+            and clause is not None
+            and clause.is_select
+            and getattr(clause, "_for_update_arg", None) is None
+        )
+        if not is_read:
+            self.info["use_primary"] = True
+            return super().get_bind(mapper, clause=clause, **kw)
+
+        replica = replicas.choose()
+        if replica is None:
+            return super().get_bind(mapper, clause=clause, **kw)
+        return replica.engine.sync_engine
+
+
+def use_primary(session) -> None:
+    """Направляет все последующие запросы сессии в основную базу."""
+    session.info["use_primary"] = True
@@ -1,7 +1,9 @@
 from .base import BaseRepository
-from .order import OrderRepository
+from .order import OrderRepository, ProductsUnavailable
 from .product import ProductRepository
+from .search import SearchSyncRepository
 from .session import SessionRepository
+from .stock import StockRepository, OutOfStock, StockContention
 from .user import UserRepository
 from .verify import VerificationRepository
 
@@ -9,7 +11,12 @@ __all__ = [
     "BaseRepository",
     "UserRepository",
     "OrderRepository",
+    "ProductsUnavailable",
     "ProductRepository",
+    "SearchSyncRepository",
     "SessionRepository",
+    "StockRepository",
+    "OutOfStock",
+    "StockContention",
     "VerificationRepository",
 ]
@@ -1,12 +1,39 @@
-from typing import Type, TypeVar, Generic, Dict, Any, Optional, List, Union
+from typing import (
+    Type, TypeVar, Generic, Dict, Any, Optional, List, Union, Sequence, Iterator, Iterable, AsyncIterator, Tuple
+)
 from uuid import UUID
 
+from sqlalchemy import any_, literal, insert, inspect
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import selectinload
 from sqlmodel import SQLModel, select, update, delete
 from sqlmodel.ext.asyncio.session import AsyncSession
 
+from app.config import settings
+from libs.database.identity import get_identity_map
+from libs.database.pagination import encode_cursor, decode_cursor
+from libs.database.uow import commit
+from libs.metrics import timed, phase
+
 T = TypeVar("T", bound=SQLModel)
+E = TypeVar("E")
+
+
+def batched(items: Sequence[E], size: int) -> Iterator[Sequence[E]]:
+    """Делит последовательность на части не больше size элементов."""
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def any_of(column, values: Iterable[Any]):
+    """
+    Условие `column = ANY(:values)`.
+
+    Весь список передаётся одним параметром-массивом, поэтому текст запроса не зависит
+    от количества значений и не упирается в лимит параметров Postgres.
+    """
+    return column == any_(literal(list(values), ARRAY(column.type)))
 
 
 class BaseRepository(Generic[T]):
@@ -23,20 +50,24 @@ class BaseRepository(Generic[T]):
         """
         self.model = model
         self.session = session
+        self.identity = get_identity_map(session)
 
+    @timed("db")
     async def add(self, entity: T) -> None:
         """
-        Добавляет новую запись в базу данных и выполняет коммит.
+        Добавляет новую запись в базу данных и выполняет коммит (в единице работы - только flush).
 
         :param entity: Экземпляр модели, который нужно сохранить.
         """
         try:
             self.session.add(entity)
-            await self.session.commit()
+            await commit(self.session)
         except IntegrityError:
             await self.session.rollback()
             raise IntegrityError
+        self.identity.put(entity)
 
+    @timed("db")
     async def get(self, entity_id: Union[int, UUID], relations: Optional[List[str]] = None) -> Optional[T]:
         """
         Получает запись из базы данных по ID.
@@ -45,6 +76,10 @@ class BaseRepository(Generic[T]):
         :param relations: Список имен связанных сущностей для предварительной загрузки.
         :return: Объект модели или None, если запись не найдена.
         """
+        cached = self._cached("id", entity_id, relations)
+        if cached is not None:
+            return cached
+
         query = select(self.model).where(self.model.id == entity_id)
 
         if relations:
@@ -52,8 +87,12 @@ class BaseRepository(Generic[T]):
                 query = query.options(selectinload(getattr(self.model, relation)))
 
         result = await self.session.exec(query)
-        return result.one_or_none()
+        entity = result.one_or_none()
+        if entity is not None:
+            self.identity.put(entity)
+        return entity
 
+    @timed("db")
     async def get_all(
             self,
             filters: Optional[Dict[str, Any]] = None,
@@ -89,6 +128,107 @@ class BaseRepository(Generic[T]):
         result = await self.session.exec(query)
         return result.all()
 
+    @timed("db")
+    async def get_page(
+            self,
+            filters: Optional[Dict[str, Any]] = None,
+            relations: Optional[List[str]] = None,
+            limit: int = 20,
+            cursor: Optional[str] = None
+    ) -> Tuple[List[T], Optional[str]]:
+        """
+        Получает страницу записей, упорядоченных по ID, с пагинацией по ключу.
+
+        В отличие от OFFSET, стоимость запроса не растёт с номером страницы:
+        Postgres сразу переходит по индексу первичного ключа к записи после курсора.
+
+        :param filters: Словарь с полями и значениями для фильтрации записей.
+        :param relations: Список имен связанных сущностей для предварительной загрузки.
+        :param limit: Количество записей на странице.
+        :param cursor: Курсор из предыдущей страницы.
+        :return: Записи страницы и курсор следующей страницы или None, если это последняя страница.
+        :raises InvalidCursor: Если курсор повреждён.
+        """
+        query = select(self.model)
+
+        if filters:
+            for field_name, value in filters.items():
+                query = query.where(getattr(self.model, field_name) == value)
+
+        if relations:
+            for relation in relations:
+                query = query.options(selectinload(getattr(self.model, relation)))
+
+        if cursor:
+            last_id, = decode_cursor(cursor, self.model.id.type.python_type)
+            query = query.where(self.model.id > last_id)
+
+        # Лишняя запись показывает, есть ли следующая страница
+        result = await self.session.exec(query.order_by(self.model.id).limit(limit + 1))
+        entities = result.all()
+        if len(entities) <= limit:
+            return entities, None
+
+        entities = entities[:limit]
+        return entities, encode_cursor(entities[-1].id)
+
+    async def iter_chunks(
+            self,
+            filters: Optional[Dict[str, Any]] = None,
+            chunk_size: Optional[int] = None
+    ) -> AsyncIterator[List[T]]:
+        """
+        Перебирает все записи частями, упорядоченными по ID.
+
+        Каждая часть выбирается отдельным запросом по ключу и после обработки убирается
+        из сессии, поэтому потребление памяти не зависит от размера таблицы.
+
+        :param filters: Словарь с полями и значениями для фильтрации записей.
+        :param chunk_size: Размер части, по умолчанию `db_chunk_size` из настроек.
+        :return: Асинхронный итератор списков записей.
+        """
+        chunk_size = chunk_size or settings.db_chunk_size
+        query = select(self.model).order_by(self.model.id).limit(chunk_size)
+
+        if filters:
+            for field_name, value in filters.items():
+                query = query.where(getattr(self.model, field_name) == value)
+
+        last_id = None
+        while True:
+            chunk_query = query if last_id is None else query.where(self.model.id > last_id)
+            with phase("db"):
+                result = await self.session.exec(chunk_query)
+                chunk = result.all()
+            if not chunk:
+                return
+
+            last_id = chunk[-1].id
+            yield chunk
+
+            for entity in chunk:
+                self.session.expunge(entity)
+
+            if len(chunk) < chunk_size:
+                return
+
+    async def iter_all(
+            self,
+            filters: Optional[Dict[str, Any]] = None,
+            chunk_size: Optional[int] = None
+    ) -> AsyncIterator[T]:
+        """
+        Перебирает все записи по одной, загружая их частями через `iter_chunks`.
+
+        :param filters: Словарь с полями и значениями для фильтрации записей.
+        :param chunk_size: Размер части, по умолчанию `db_chunk_size` из настроек.
+        :return: Асинхронный итератор записей.
+        """
+        async for chunk in self.iter_chunks(filters, chunk_size):
+            for entity in chunk:
+                yield entity
+
+    @timed("db")
     async def get_by_field(self, field_name: str, value: Any, relations: Optional[List[str]] = None) -> Optional[T]:
         """
         Получает запись из базы данных по произвольному полю и значению.
@@ -98,6 +238,10 @@ class BaseRepository(Generic[T]):
         :param relations: Список имен связанных сущностей для предварительной загрузки.
         :return: Объект модели или None, если запись не найдена.
         """
+        cached = self._cached(field_name, value, relations)
+        if cached is not None:
+            return cached
+
         query = select(self.model).where(getattr(self.model, field_name) == value)
 
         if relations:
@@ -105,8 +249,12 @@ class BaseRepository(Generic[T]):
                 query = query.options(selectinload(getattr(self.model, relation)))
 
         result = await self.session.exec(query)
-        return result.one_or_none()
+        entity = result.one_or_none()
+        if entity is not None:
+            self.identity.put(entity, field_name)
+        return entity
 
+    @timed("db")
     async def update(self, entity_id: Union[int, UUID], data: Union[T, Dict[str, Any]]) -> None:
         """
         Обновляет запись в базе данных по ID, изменяя указанные поля.
@@ -117,10 +265,50 @@ class BaseRepository(Generic[T]):
         await self.session.exec(
             update(self.model)
             .where(self.model.id == entity_id)
-            .values(**data)
+            .values(**self._values(data))
         )
-        await self.session.commit()
+        self.identity.invalidate(self.model)
+        await commit(self.session)
 
+    @timed("db")
+    async def update_returning(
+            self,
+            entity_id: Union[int, UUID],
+            data: Union[T, Dict[str, Any]],
+            owner_id: Optional[UUID] = None,
+            relations: Optional[List[str]] = None
+    ) -> Optional[T]:
+        """
+        Обновляет запись и возвращает её новое состояние одним запросом `UPDATE ... RETURNING`.
+
+        :param entity_id: Идентификатор записи, которую нужно обновить.
+        :param data: Словарь с данными для обновления или изменённая модель.
+        :param owner_id: Если указан, запись обновляется только при совпадении `user_id`.
+        :param relations: Список имен связанных сущностей для предварительной загрузки.
+        :return: Обновлённая запись или None, если запись не найдена или принадлежит другому пользователю.
+        """
+        options = [selectinload(getattr(self.model, relation)) for relation in relations or []]
+        values = self._values(data)
+        if not values:
+            query = select(self.model).where(*self._owned(entity_id, owner_id)).options(*options)
+            return (await self.session.exec(query)).one_or_none()
+
+        result = await self.session.exec(
+            update(self.model)
+            .where(*self._owned(entity_id, owner_id))
+            .values(**values)
+            .returning(self.model)
+            .options(*options)
+            .execution_options(populate_existing=True)
+        )
+        entity = result.scalars().one_or_none()
+        self.identity.invalidate(self.model)
+        await commit(self.session)
+        if entity is not None:
+            self.identity.put(entity)
+        return entity
+
+    @timed("db")
     async def delete(self, entity_id: Union[int, UUID]) -> None:
         """
         Удаляет запись из базы данных по ID.
@@ -130,4 +318,96 @@ class BaseRepository(Generic[T]):
         await self.session.exec(
             delete(self.model).where(self.model.id == entity_id)
         )
-        await self.session.commit()
+        self.identity.invalidate(self.model)
+        await commit(self.session)
+
+    @timed("db")
+    async def delete_returning(self, entity_id: Union[int, UUID], owner_id: Optional[UUID] = None) -> Optional[T]:
+        """
+        Удаляет запись одним запросом `DELETE ... RETURNING`.
+
+        :param entity_id: Идентификатор записи, которую нужно удалить.
+        :param owner_id: Если указан, запись удаляется только при совпадении `user_id`.
+        :return: Удалённая запись или None, если запись не найдена или принадлежит другому пользователю.
+        """
+        result = await self.session.exec(
+            delete(self.model).where(*self._owned(entity_id, owner_id)).returning(self.model)
+        )
+        entity = result.scalars().one_or_none()
+        self.identity.invalidate(self.model)
+        await commit(self.session)
+        return entity
+
+    @timed("db")
+    async def add_many(self, entities: Sequence[T], batch_size: Optional[int] = None) -> List[T]:
+        """
+        Добавляет записи многострочным INSERT ... RETURNING.
+
+        Каждая пачка выполняется в отдельной транзакции: при ошибке откатывается только
+        текущая пачка, уже сохранённые пачки остаются в базе.
+
+        :param entities: Экземпляры модели, которые нужно сохранить.
+        :param batch_size: Размер пачки, по умолчанию `db_batch_size` из настроек.
+        :return: Сохранённые записи в том же порядке.
+        """
+        created = []
+        for batch in batched(entities, batch_size or settings.db_batch_size):
+            try:
+                result = await self.session.exec(
+                    insert(self.model).returning(self.model),
+                    params=[entity.model_dump() for entity in batch],
+                )
+                created.extend(result.scalars().all())
+                await commit(self.session)
+            except IntegrityError:
+                await self.session.rollback()
+                raise
+        return created
+
+    @timed("db")
+    async def update_many(self, rows: Sequence[Dict[str, Any]], batch_size: Optional[int] = None) -> None:
+        """
+        Обновляет записи по первичному ключу через executemany.
+
+        :param rows: Словари с полем `id` и новыми значениями полей. Наборы полей могут отличаться.
+        :param batch_size: Размер пачки, по умолчанию `db_batch_size` из настроек.
+        """
+        for batch in batched(rows, batch_size or settings.db_batch_size):
+            await self.session.exec(update(self.model), params=batch)
+            self.identity.invalidate(self.model)
+            await commit(self.session)
+
+    @timed("db")
+    async def delete_many(self, entity_ids: Sequence[Union[int, UUID]], batch_size: Optional[int] = None) -> int:
+        """
+        Удаляет записи запросом `WHERE id = ANY(...)`.
+
+        :param entity_ids: Идентификаторы записей, которые нужно удалить.
+        :param batch_size: Размер пачки, по умолчанию `db_batch_size` из настроек.
+        :return: Количество удалённых записей.
+        """
+        deleted = 0
+        for batch in batched(entity_ids, batch_size or settings.db_batch_size):
+            result = await self.session.exec(delete(self.model).where(any_of(self.model.id, batch)))
+            deleted += result.rowcount
+            self.identity.invalidate(self.model)
+            await commit(self.session)
+        return deleted
+
+    def _cached(self, field_name: str, value: Any, relations: Optional[List[str]]) -> Optional[T]:
+        entity = self.identity.get(self.model, field_name, value)
+        if entity is None or (relations and inspect(entity).unloaded.intersection(relations)):
+            return None
+        self.identity.hit(self.model)
+        return entity
+
+    def _owned(self, entity_id: Union[int, UUID], owner_id: Optional[UUID]) -> List[Any]:
+        conditions = [self.model.id == entity_id]
+        if owner_id is not None:
+            conditions.append(self.model.user_id == owner_id)
+        return conditions
+
+    def _values(self, data: Union[T, Dict[str, Any]]) -> Dict[str, Any]:
+        if isinstance(data, SQLModel):
+            return data.model_dump(exclude={"id"})
+        return data
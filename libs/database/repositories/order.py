@@ -1,12 +1,237 @@
+from datetime import datetime, timedelta
+from typing import Optional, List, Tuple, Dict, Iterable, Sequence
+from uuid import UUID
+
+from sqlalchemy import insert, tuple_, or_
+from sqlalchemy.orm import selectinload
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlmodel import select, update
+from elasticsearch import AsyncElasticsearch
 from sqlmodel.ext.asyncio.session import AsyncSession
 
-from libs.database.models import Order
-from libs.database.repositories import BaseRepository
+from libs.database.models import Order, OrderProductLink, OrderState, Product, ProductState, transition_sources
+from libs.database.pagination import encode_cursor, decode_cursor
+from app.config import settings
+from libs.database.repositories.base import BaseRepository, any_of
+from libs.database.repositories.stock import StockRepository, RELEASE_GRACE
+from libs.database.uow import commit
+from libs.metrics import timed
+
+
+class ProductsUnavailable(ValueError):
+    """Часть товаров заказа не существует или недоступна для покупки."""
+
+    def __init__(self, product_ids: Iterable[UUID]):
+        self.product_ids = sorted(product_ids)
+        super().__init__(f"Products are unavailable: {', '.join(map(str, self.product_ids))}")
 
 
 class OrderRepository(BaseRepository[Order]):
-    def __init__(self, session: AsyncSession):
+    def __init__(self, session: AsyncSession, es_client: Optional[AsyncElasticsearch] = None):
+        """
+        :param session: Сессия базы данных.
+        :param es_client: Клиент Elasticsearch для переиндексации продуктов, у которых заказ изменил остаток.
+        """
         super().__init__(Order, session)
+        self.es_client = es_client
+
+    @timed("db")
+    async def create_order(self, user_id: UUID, lines: Iterable[Tuple[UUID, int]]) -> Order:
+        """
+        Создаёт заказ с позициями.
+
+        Товары проверяются одним запросом `WHERE id = ANY(...)`, позиции сохраняются
+        одним многострочным INSERT, поэтому количество запросов не зависит от размера корзины.
+        Цена каждой позиции фиксируется на момент заказа. Остаток товаров, у которых он
+        учитывается, резервируется до подтверждения заказа.
+
+        :param user_id: Идентификатор покупателя.
+        :param lines: Пары (идентификатор товара, количество). Повторы одного товара суммируются.
+        :return: Созданный заказ с загруженными позициями.
+        :raises ProductsUnavailable: Если какие-то товары не найдены или не активны.
+        :raises OutOfStock: Если остатка каких-то товаров не хватает.
+        """
+        quantities: Dict[UUID, int] = {}
+        for product_id, quantity in lines:
+            quantities[product_id] = quantities.get(product_id, 0) + quantity
+
+        result = await self.session.exec(
+            select(Product.id, Product.price, Product.stock, Product.stock_shards)
+            .where(any_of(Product.id, quantities), Product.status == ProductState.ACTIVE)
+        )
+        products = result.all()
+        prices = {product_id: price for product_id, price, _, _ in products}
+        missing = quantities.keys() - prices.keys()
+        if missing:
+            raise ProductsUnavailable(missing)
+
+        shards = {product_id: stock_shards for product_id, _, stock, stock_shards in products}
+        tracked = {
+            product_id: quantities[product_id]
+            for product_id, _, stock, stock_shards in products
+            if stock is not None or stock_shards
+        }
+        reserved_until = datetime.now() + timedelta(seconds=settings.stock_reservation_ttl) if tracked else None
+
+        order = Order(user_id=user_id, status=OrderState.CREATED, reserved_until=reserved_until)
+        self.session.add(order)
+        await self.session.flush()
+        stock_repo = StockRepository(self.session, self.es_client)
+        changed = await stock_repo.reserve(tracked, shards, order.id, reserved_until)
+
+        items = [
+            OrderProductLink(order_id=order.id, product_id=product_id, quantity=quantity, price=prices[product_id])
+            for product_id, quantity in quantities.items()
+        ]
+        await self.session.exec(insert(OrderProductLink).values([item.model_dump() for item in items]))
+        await commit(self.session)
+        await stock_repo.reindex(changed)
+
+        set_committed_value(order, "items", items)
+        self.identity.put(order)
+        return order
+
+    @timed("db")
+    async def transition(
+            self,
+            order_id: UUID,
+            target: OrderState,
+            owner_id: Optional[UUID] = None,
+            version: Optional[int] = None
+    ) -> Optional[Order]:
+        """
+        Переводит заказ в новый статус одним условным UPDATE.
+
+        Допустимость перехода и версия проверяются в WHERE, поэтому блокировки строк не
+        держатся между чтением и записью: из двух конкурентных изменений применится одно,
+        второе не найдёт строку с ожидаемыми статусом и версией.
+
+        :param order_id: Идентификатор заказа.
+        :param target: Новый статус.
+        :param owner_id: Если указан, заказ меняется только у этого пользователя.
+        :param version: Если указана, заказ меняется только если его версия совпадает.
+        :return: Обновлённый заказ или None, если заказ не найден, переход недопустим, версия устарела
+            или резерв остатков истёк.
+        """
+        query = (
+            self._transition_query(target)
+            .where(*self._owned(order_id, owner_id))
+            .returning(Order)
+            .options(selectinload(Order.items))
+            .execution_options(populate_existing=True)
+        )
+        if version is not None:
+            query = query.where(Order.version == version)
+
+        result = await self.session.exec(query)
+        order = result.scalars().one_or_none()
+        if order is not None and target == OrderState.ACCEPTED:
+            await StockRepository(self.session).confirm([order.id])
+        self.identity.invalidate(Order)
+        await commit(self.session)
+        return order
+
+    @timed("db")
+    async def bulk_transition(self, order_ids: Sequence[UUID], target: OrderState) -> List[UUID]:
+        """
+        Переводит заказы в новый статус одним запросом `WHERE id = ANY(...)`.
+
+        :param order_ids: Идентификаторы заказов.
+        :param target: Новый статус.
+        :return: Идентификаторы заказов, статус которых изменился. Остальные не найдены
+            или находятся в статусе, из которого переход в target недопустим.
+        """
+        result = await self.session.exec(
+            self._transition_query(target)
+            .where(any_of(Order.id, order_ids))
+            .returning(Order.id)
+            .execution_options(synchronize_session=False)
+        )
+        updated = result.scalars().all()
+        if updated and target == OrderState.ACCEPTED:
+            await StockRepository(self.session).confirm(updated)
+        self.identity.invalidate(Order)
+        await commit(self.session)
+        return updated
+
+    @timed("db")
+    async def expire_reserved(self, batch_size: int) -> int:
+        """
+        Переводит в EXPIRED одну пачку неподтверждённых заказов, резерв которых истёк.
+
+        Срок отсчитывается с тем же запасом, что и освобождение резервов, поэтому заказ
+        истекает вместе с возвратом его остатка на склад.
+
+        :param batch_size: Максимальное количество заказов.
+        :return: Количество заказов, переведённых в EXPIRED.
+        """
+        expired_ids = (
+            select(Order.id)
+            .where(Order.status == OrderState.CREATED, Order.reserved_until < datetime.now() - RELEASE_GRACE)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        result = await self.session.exec(
+            update(Order)
+            .where(Order.id.in_(expired_ids))
+            .values(status=OrderState.EXPIRED, version=Order.version + 1)
+            .execution_options(synchronize_session=False)
+        )
+        self.identity.invalidate(Order)
+        await self.session.commit()
+        return result.rowcount
+
+    @staticmethod
+    def _transition_query(target: OrderState):
+        query = update(Order).where(Order.status.in_(transition_sources(target)))
+        if target != OrderState.ACCEPTED:
+            return query.values(status=target, version=Order.version + 1)
+
+        # Подтвердить можно только заказ, остатки которого ещё зарезервированы
+        return (
+            query
+            .where(or_(Order.reserved_until.is_(None), Order.reserved_until > datetime.now()))
+            .values(status=target, version=Order.version + 1, reserved_until=None)
+        )
+
+    @timed("db")
+    async def get_user_orders(
+            self,
+            user_id: UUID,
+            limit: int = 20,
+            cursor: Optional[str] = None,
+            statuses: Optional[List[OrderState]] = None
+    ) -> Tuple[List[Order], Optional[str]]:
+        """
+        Получает страницу заказов пользователя, начиная с последних.
+
+        Страница выбирается по ключу (created_at, id) из индекса ix_orders_user_id_created_at_id,
+        поэтому время запроса не зависит ни от номера страницы, ни от размера истории.
+        Позиции всех заказов страницы загружаются одним дополнительным запросом.
+
+        :param user_id: Идентификатор пользователя.
+        :param limit: Количество заказов на странице.
+        :param cursor: Курсор из предыдущей страницы.
+        :param statuses: Если указаны, возвращаются только заказы в этих статусах.
+        :return: Заказы и курсор следующей страницы или None, если это последняя страница.
+        :raises InvalidCursor: Если курсор повреждён.
+        """
+        query = select(Order).where(Order.user_id == user_id).options(selectinload(Order.items))
+
+        if statuses:
+            query = query.where(Order.status.in_(statuses))
+
+        if cursor:
+            created_at, order_id = decode_cursor(cursor, datetime, UUID)
+            query = query.where(tuple_(Order.created_at, Order.id) < tuple_(created_at, order_id))
+
+        # Лишняя запись показывает, есть ли следующая страница, без COUNT(*)
+        result = await self.session.exec(
+            query.order_by(Order.created_at.desc(), Order.id.desc()).limit(limit + 1)
+        )
+        orders = result.all()
+        if len(orders) <= limit:
+            return orders, None
 
-    async def get_user_orders(self, user_id: int):
-        return await self.session.exec(self.model.select().where(self.model.user_id == user_id))
+        orders = orders[:limit]
+        return orders, encode_cursor(orders[-1].created_at, orders[-1].id)
@@ -1,18 +1,21 @@
-from typing import Union, Dict, Any, Optional
+from typing import Union, Dict, Any, Optional, Sequence, List
 from uuid import UUID
 
 from elasticsearch import AsyncElasticsearch
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlmodel import select
 
+from app.config import settings
 from libs.database.models import Product
-from libs.database.repositories.base import BaseRepository
+from libs.database.repositories.base import BaseRepository, any_of, batched
+from libs.database.uow import after_commit
 from libs.elastic.repository import ElasticRepository
 
 
 class ProductRepository(BaseRepository[Product], ElasticRepository[Product]):
     def __init__(self, session: AsyncSession, es_client: AsyncElasticsearch):
         BaseRepository.__init__(self, Product, session)
-        ElasticRepository.__init__(self, Product, es_client, index_name="products")
+        ElasticRepository.__init__(self, Product, es_client, index_name="products", version_field="updated_at")
 
     async def add(self, entity: Product):
         """
@@ -21,7 +24,7 @@ class ProductRepository(BaseRepository[Product], ElasticRepository[Product]):
         :param entity: Модель продукта.
         """
         await super().add(entity)
-        await self.index_entity(entity)
+        await after_commit(self.session, self.index_entity, entity)
 
     async def update(self, entity_id: Union[int, UUID], data: Union[Product, Dict[str, Any]]):
         """
@@ -30,10 +33,28 @@ class ProductRepository(BaseRepository[Product], ElasticRepository[Product]):
         :param entity_id: Идентификатор записи, которую нужно обновить.
         :param data: Словарь с данными для обновления (имена полей и новые значения) или изменённая модель.
         """
-        await super().update(entity_id, data)
-        updated_product = await self.get(entity_id)
+        await self.update_returning(entity_id, data)
+
+    async def update_returning(
+            self,
+            entity_id: Union[int, UUID],
+            data: Union[Product, Dict[str, Any]],
+            owner_id: Optional[UUID] = None,
+            relations: Optional[List[str]] = None
+    ) -> Optional[Product]:
+        """
+        Обновляет продукт одним запросом и индексирует его новое состояние в Elastic.
+
+        :param entity_id: Идентификатор продукта.
+        :param data: Словарь с данными для обновления или изменённая модель.
+        :param owner_id: Если указан, продукт обновляется только у этого владельца.
+        :param relations: Список имен связанных сущностей для предварительной загрузки.
+        :return: Обновлённый продукт или None, если он не найден.
+        """
+        updated_product = await super().update_returning(entity_id, data, owner_id, relations)
         if updated_product:
-            await self.index_entity(updated_product)
+            await after_commit(self.session, self.index_entity, updated_product)
+        return updated_product
 
     async def delete(self, entity_id: Union[int, UUID]):
         """
@@ -42,7 +63,61 @@ class ProductRepository(BaseRepository[Product], ElasticRepository[Product]):
         :param entity_id: Идентификатор записи, которую нужно удалить.
         """
         await super().delete(entity_id)
-        await self.delete_entity(entity_id)
+        await after_commit(self.session, self.delete_entity, entity_id)
+
+    async def delete_returning(self, entity_id: Union[int, UUID], owner_id: Optional[UUID] = None) -> Optional[Product]:
+        """
+        Удаляет продукт одним запросом и его документ в Elastic.
+
+        :param entity_id: Идентификатор продукта.
+        :param owner_id: Если указан, продукт удаляется только у этого владельца.
+        :return: Удалённый продукт или None, если он не найден.
+        """
+        deleted_product = await super().delete_returning(entity_id, owner_id)
+        if deleted_product:
+            await after_commit(self.session, self.delete_entity, entity_id)
+        return deleted_product
+
+    async def add_many(self, entities: Sequence[Product], batch_size: Optional[int] = None) -> List[Product]:
+        """
+        Добавляет продукты пачками и индексирует каждую пачку одним bulk-запросом.
+
+        :param entities: Модели продуктов.
+        :param batch_size: Размер пачки, по умолчанию `db_batch_size` из настроек.
+        :return: Сохранённые продукты.
+        """
+        created = await super().add_many(entities, batch_size)
+        for batch in batched(created, batch_size or settings.db_batch_size):
+            await after_commit(self.session, self.index_entities, batch)
+        return created
+
+    async def update_many(self, rows: Sequence[Dict[str, Any]], batch_size: Optional[int] = None) -> None:
+        """
+        Обновляет продукты пачками и переиндексирует их bulk-запросами.
+
+        :param rows: Словари с полем `id` и новыми значениями полей.
+        :param batch_size: Размер пачки, по умолчанию `db_batch_size` из настроек.
+        """
+        await super().update_many(rows, batch_size)
+        for batch in batched(rows, batch_size or settings.db_batch_size):
+            result = await self.session.exec(
+                select(Product).where(any_of(Product.id, [row["id"] for row in batch]))
+                .execution_options(populate_existing=True)
+            )
+            await after_commit(self.session, self.index_entities, result.all())
+
+    async def delete_many(self, entity_ids: Sequence[Union[int, UUID]], batch_size: Optional[int] = None) -> int:
+        """
+        Удаляет продукты пачками вместе с их документами в Elastic.
+
+        :param entity_ids: Идентификаторы продуктов.
+        :param batch_size: Размер пачки, по умолчанию `db_batch_size` из настроек.
+        :return: Количество удалённых продуктов.
+        """
+        deleted = await super().delete_many(entity_ids, batch_size)
+        for batch in batched(entity_ids, batch_size or settings.db_batch_size):
+            await after_commit(self.session, self.delete_entities, batch)
+        return deleted
 
     async def search_products(self, query: str, limit: int, filters: Dict[str, Any] = None, sort: Optional[str] = None,
                               cursor: Optional[str] = None):
@@ -0,0 +1,161 @@
+from datetime import datetime, timedelta
+from typing import AsyncIterator, List, Optional
+
+from sqlalchemy import func, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import select, delete
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.config import settings
+from libs.database.models import Product, ProductTombstone, SearchSyncState
+from libs.database.uow import commit
+from libs.metrics import timed, phase
+
+
+class SearchSyncRepository:
+    """
+    Лента изменений продуктов для инкрементальной синхронизации поискового индекса.
+
+    updated_at продукта и отметки об удалении проставляют триггеры базы данных, поэтому
+    в ленту попадают изменения любым путём: через репозитории, резервы остатка или каскадные
+    удаления. Отметка времени ставится до коммита, поэтому изменения читаются с перекрытием
+    `elastic_sync_overlap` секунд от сохранённой отметки, а повторная индексация безвредна.
+    """
+
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    @timed("db")
+    async def now(self) -> datetime:
+        """Текущее время по часам базы данных, в которых записаны отметки изменений."""
+        return await self.session.scalar(select(func.localtimestamp()))
+
+    @timed("db")
+    async def get_watermark(self, index_name: str) -> Optional[datetime]:
+        """
+        Возвращает момент, до которого изменения уже отправлены в индекс.
+
+        :param index_name: Имя индекса.
+        :return: Отметка или None, если индекс ещё ни разу не синхронизировался.
+        """
+        return await self.session.scalar(
+            select(SearchSyncState.synced_until).where(SearchSyncState.index_name == index_name)
+        )
+
+    @timed("db")
+    async def save_watermark(self, index_name: str, synced_until: datetime) -> None:
+        """
+        Сохраняет момент, до которого изменения отправлены в индекс.
+
+        :param index_name: Имя индекса.
+        :param synced_until: Отметка времени последнего отправленного изменения.
+        """
+        query = insert(SearchSyncState).values(index_name=index_name, synced_until=synced_until)
+        await self.session.exec(query.on_conflict_do_update(
+            index_elements=[SearchSyncState.index_name],
+            set_={"synced_until": query.excluded.synced_until},
+        ))
+        await commit(self.session)
+
+    async def iter_changed_products(
+            self,
+            since: Optional[datetime],
+            chunk_size: Optional[int] = None
+    ) -> AsyncIterator[List[Product]]:
+        """
+        Перебирает продукты, изменённые начиная с отметки, частями по (updated_at, id).
+
+        :param since: Отметка времени с учётом перекрытия, None - все продукты.
+        :param chunk_size: Размер части, по умолчанию `db_chunk_size` из настроек.
+        :return: Асинхронный итератор списков продуктов.
+        """
+        chunk_size = chunk_size or settings.db_chunk_size
+        query = select(Product).order_by(Product.updated_at, Product.id).limit(chunk_size)
+        if since is not None:
+            query = query.where(Product.updated_at >= since)
+
+        last_key = None
+        while True:
+            chunk_query = query
+            if last_key is not None:
+                chunk_query = query.where(tuple_(Product.updated_at, Product.id) > tuple_(*last_key))
+            with phase("db"):
+                result = await self.session.exec(chunk_query)
+                chunk = result.all()
+            if not chunk:
+                return
+
+            last_key = (chunk[-1].updated_at, chunk[-1].id)
+            yield chunk
+
+            for product in chunk:
+                self.session.expunge(product)
+
+            if len(chunk) < chunk_size:
+                return
+
+    async def iter_deleted_products(
+            self,
+            since: datetime,
+            chunk_size: Optional[int] = None
+    ) -> AsyncIterator[List[ProductTombstone]]:
+        """
+        Перебирает отметки об удалении продуктов начиная с отметки времени.
+
+        :param since: Отметка времени с учётом перекрытия.
+        :param chunk_size: Размер части, по умолчанию `db_chunk_size` из настроек.
+        :return: Асинхронный итератор списков отметок об удалении.
+        """
+        chunk_size = chunk_size or settings.db_chunk_size
+        query = (
+            select(ProductTombstone)
+            .where(ProductTombstone.deleted_at >= since)
+            .order_by(ProductTombstone.deleted_at, ProductTombstone.product_id)
+            .limit(chunk_size)
+        )
+
+        last_key = None
+        while True:
+            chunk_query = query
+            if last_key is not None:
+                chunk_query = query.where(
+                    tuple_(ProductTombstone.deleted_at, ProductTombstone.product_id) > tuple_(*last_key)
+                )
+            with phase("db"):
+                result = await self.session.exec(chunk_query)
+                chunk = result.all()
+            if not chunk:
+                return
+
+            last_key = (chunk[-1].deleted_at, chunk[-1].product_id)
+            yield chunk
+
+            for tombstone in chunk:
+                self.session.expunge(tombstone)
+
+            if len(chunk) < chunk_size:
+                return
+
+    @timed("db")
+    async def purge_tombstones(self, batch_size: int) -> int:
+        """
+        Удаляет одну пачку отметок об удалении, которые уже отправлены во все индексы.
+
+        :param batch_size: Максимальное количество удаляемых отметок.
+        :return: Количество удалённых отметок.
+        """
+        synced_until = await self.session.scalar(select(func.min(SearchSyncState.synced_until)))
+        if synced_until is None:
+            return 0
+
+        shipped_ids = (
+            select(ProductTombstone.product_id)
+            .where(ProductTombstone.deleted_at < synced_until - timedelta(seconds=settings.elastic_sync_overlap))
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        result = await self.session.exec(
+            delete(ProductTombstone).where(ProductTombstone.product_id.in_(shipped_ids))
+        )
+        await self.session.commit()
+        return result.rowcount
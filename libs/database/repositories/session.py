@@ -23,7 +23,7 @@ class SessionRepository(BaseRepository[Session]):
         :param relations: Список имен связанных сущностей для предварительной загрузки.
         :return: Объект Session или None, если запись не найдена.
         """
-        return await self.get_by_field("refresh", refresh_token, relations)
+        return await self.get_by_field("refresh_token", refresh_token, relations)
 
     async def get_by_access_token(self, token: str, relations: Optional[List[str]] = None) -> Optional[Session]:
         """
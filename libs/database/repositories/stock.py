@@ -0,0 +1,452 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from uuid import UUID
+
+from sqlalchemy import Integer, case, func, insert, literal
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlmodel import select, update, delete
+from elasticsearch import AsyncElasticsearch
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from libs.database.models import Product, ProductState, ProductStockShard, StockReservation
+from libs.database.repositories.base import any_of
+from libs.database.repositories.product import ProductRepository
+from libs.database.uow import commit, after_commit
+from libs.metrics import timed
+
+# Сколько раз пробовать списать остаток из части, последняя попытка ждёт блокировку
+SHARD_ATTEMPTS = 3
+# deadlock_detected, serialization_failure, lock_not_available (lock_timeout)
+CONTENTION_ERRORS = {"40P01", "40001", "55P03"}
+# Резерв освобождается с запасом после истечения, чтобы не гоняться с подтверждением заказа
+RELEASE_GRACE = timedelta(minutes=1)
+
+
+class OutOfStock(ValueError):
+    """Остатка части товаров не хватает для заказа."""
+
+    def __init__(self, product_ids: Iterable[UUID]):
+        self.product_ids = sorted(product_ids)
+        super().__init__(f"Products are out of stock: {', '.join(map(str, self.product_ids))}")
+
+
+class StockContention(Exception):
+    """Остаток не удалось списать из-за конкурирующих транзакций, заказ можно повторить."""
+
+    def __init__(self, product_ids: Iterable[UUID]):
+        self.product_ids = sorted(product_ids)
+        super().__init__(f"Stock is locked by concurrent orders: {', '.join(map(str, self.product_ids))}")
+
+
+def _unnest(ids: Sequence[UUID], quantities: Sequence[int], shards: Optional[Sequence[int]] = None):
+    """Подзапрос из массивов-параметров: по строке на элемент, без отдельного параметра на значение."""
+    columns = [
+        func.unnest(literal(list(ids), ARRAY(Product.id.type))).label("product_id"),
+        func.unnest(literal(list(quantities), ARRAY(Integer))).label("quantity"),
+    ]
+    if shards is not None:
+        columns.append(func.unnest(literal(list(shards), ARRAY(Integer))).label("shard"))
+    return select(*columns).subquery()
+
+
+def _group_released(
+        released: Sequence[Tuple[UUID, Optional[int], int]],
+        layouts: Dict[UUID, int]
+) -> Tuple[Dict[UUID, int], Dict[Tuple[UUID, int], int]]:
+    """Раскладывает освобождённые резервы по общему остатку и частям текущей раскладки товаров."""
+    plain: Dict[UUID, int] = defaultdict(int)
+    sharded: Dict[Tuple[UUID, int], int] = defaultdict(int)
+    for product_id, shard, quantity in released:
+        shards = layouts.get(product_id)
+        if not shards:
+            plain[product_id] += quantity
+        else:
+            sharded[(product_id, (shard or 0) % shards)] += quantity
+    return plain, dict(sorted(sharded.items()))
+
+
+def _status_after(stock_expression):
+    """Статус товара после изменения остатка: OUT_OF_STOCK на нуле, ACTIVE после пополнения."""
+    return case(
+        (stock_expression <= 0, literal(ProductState.OUT_OF_STOCK, Product.status.type)),
+        (Product.status == ProductState.OUT_OF_STOCK, literal(ProductState.ACTIVE, Product.status.type)),
+        else_=Product.status,
+    )
+
+
+class StockRepository:
+    """
+    Остатки товаров и резервы под заказы.
+
+    Остаток списывается условным UPDATE (`stock >= :quantity`), поэтому проверка и списание
+    атомарны и не требуют блокировок на время запроса. Остаток товаров с очень высоким
+    спросом раскладывается по частям в product_stock_shards: каждое списание выбирает
+    случайную свободную часть через `FOR UPDATE SKIP LOCKED` и ждёт соседние транзакции,
+    только если все подходящие части заняты. Позиция, которая не помещается ни в одну часть,
+    списывается из нескольких частей по порядку номеров.
+
+    Все операции берут блокировки в одном порядке: сначала части остатка по (товар, номер),
+    затем строки товаров по идентификатору. Статус OUT_OF_STOCK у товара с частями ставится
+    только под блокировкой строки товара, поэтому из двух транзакций, опустошивших последние
+    части, вторая видит изменения первой.
+
+    Остаток и статус входят в документ поиска, поэтому изменённые продукты переиндексируются
+    после коммита, если репозиторию передан клиент Elasticsearch.
+    """
+
+    def __init__(self, session: AsyncSession, es_client: Optional[AsyncElasticsearch] = None):
+        self.session = session
+        self.es_client = es_client
+
+    @timed("db")
+    async def reserve(
+            self,
+            quantities: Dict[UUID, int],
+            shards: Dict[UUID, int],
+            order_id: Optional[UUID] = None,
+            expire_at: Optional[datetime] = None
+    ) -> List[Product]:
+        """
+        Списывает остаток товаров и записывает резервы.
+
+        Изменения не коммитятся: если какого-то товара не хватит, вызывающий откатывает
+        транзакцию, и уже списанные остатки возвращаются. После коммита вызывающий передаёт
+        изменённые продукты в `reindex`.
+
+        Сначала списываются части остатка товаров с частями в порядке идентификаторов, затем
+        блокируются строки товаров, поэтому корзины с общими товарами в разном порядке не
+        взаимоблокируются. Если база всё же прервала транзакцию из-за блокировок, это
+        сообщается как StockContention, и транзакцию нужно откатить.
+
+        :param quantities: Количество по идентификаторам товаров с учитываемым остатком.
+        :param shards: Количество частей остатка по идентификаторам товаров, 0 - остаток не разложен.
+        :param order_id: Заказ, к которому относятся резервы.
+        :param expire_at: Когда резервы вернутся на склад, None - остаток списывается без резерва.
+        :return: Продукты, у которых изменились остаток или статус в документе поиска.
+        :raises OutOfStock: Если остатка не хватает.
+        :raises StockContention: Если транзакция прервана взаимоблокировкой или таймаутом блокировки.
+        """
+        if not quantities:
+            return []
+
+        try:
+            return await self._reserve(quantities, shards, order_id, expire_at)
+        except DBAPIError as e:
+            if getattr(e.orig, "sqlstate", None) in CONTENTION_ERRORS:
+                raise StockContention(quantities) from e
+            raise
+
+    async def _reserve(
+            self,
+            quantities: Dict[UUID, int],
+            shards: Dict[UUID, int],
+            order_id: Optional[UUID],
+            expire_at: Optional[datetime]
+    ) -> List[Product]:
+        plain = {product_id: quantity for product_id, quantity in quantities.items() if not shards.get(product_id)}
+        reserved: List[Tuple[UUID, Optional[int], int]] = []
+        changed: List[Product] = []
+
+        emptied = set()
+        for product_id in sorted(quantities.keys() - plain.keys()):
+            taken, empty = await self._take_from_shards(product_id, quantities[product_id])
+            reserved.extend((product_id, shard, quantity) for shard, quantity in taken)
+            if empty:
+                emptied.add(product_id)
+
+        if plain or emptied:
+            await self._lock_products(plain.keys() | emptied)
+
+        if plain:
+            values = _unnest(list(plain), list(plain.values()))
+            new_stock = Product.stock - values.c.quantity
+            result = await self.session.exec(
+                update(Product)
+                .where(
+                    Product.id == values.c.product_id,
+                    Product.status == ProductState.ACTIVE,
+                    Product.stock >= values.c.quantity,
+                )
+                .values(stock=new_stock, status=_status_after(new_stock))
+                .returning(Product)
+                .execution_options(synchronize_session=False, populate_existing=True)
+            )
+            changed.extend(result.scalars().all())
+            updated = {product.id for product in changed}
+            if len(updated) < len(plain):
+                raise OutOfStock(plain.keys() - updated)
+            reserved.extend((product_id, None, quantity) for product_id, quantity in plain.items())
+
+        for product_id in sorted(emptied):
+            flipped = await self._mark_out_of_stock(product_id)
+            if flipped is not None:
+                changed.append(flipped)
+
+        if expire_at is None:
+            return changed
+
+        await self.session.exec(insert(StockReservation).values([
+            StockReservation(
+                order_id=order_id, product_id=product_id, shard=shard, quantity=quantity, expire_at=expire_at
+            ).model_dump()
+            for product_id, shard, quantity in reserved
+        ]))
+        return changed
+
+    async def reindex(self, products: Sequence[Product]) -> None:
+        """
+        Переиндексирует продукты после коммита сессии.
+
+        Вызывается после коммита: вне единицы работы индексация выполняется сразу.
+
+        :param products: Продукты с изменённым остатком или статусом.
+        """
+        if self.es_client is None or not products:
+            return
+        product_repo = ProductRepository(self.session, self.es_client)
+        await after_commit(self.session, product_repo.index_entities, list(products))
+
+    async def _lock_products(self, product_ids: Iterable[UUID]) -> Dict[UUID, int]:
+        """Блокирует строки товаров и возвращает количество частей остатка каждого из них."""
+        # Порядок блокировки задаёт ORDER BY, а не план следующего UPDATE ... FROM unnest
+        result = await self.session.exec(
+            select(Product.id, Product.stock_shards)
+            .where(any_of(Product.id, list(product_ids)))
+            .order_by(Product.id)
+            .with_for_update()
+        )
+        return dict(result.all())
+
+    async def _lock_shards(self, product_ids: Sequence[UUID], shards: Sequence[int]) -> None:
+        """Блокирует части остатка в порядке (товар, номер части)."""
+        values = _unnest(product_ids, [0] * len(product_ids), shards)
+        await self.session.exec(
+            select(ProductStockShard.product_id)
+            .where(ProductStockShard.product_id == values.c.product_id, ProductStockShard.shard == values.c.shard)
+            .order_by(ProductStockShard.product_id, ProductStockShard.shard)
+            .with_for_update(of=ProductStockShard)
+        )
+
+    async def _take_from_shards(self, product_id: UUID, quantity: int) -> Tuple[List[Tuple[int, int]], bool]:
+        """
+        Списывает количество из частей остатка товара.
+
+        :return: Пары (номер части, списанное количество) и признак, что какая-то часть опустела.
+        :raises OutOfStock: Если во всех частях вместе не хватает остатка.
+        """
+        # Сначала занятые части пропускаются, последняя попытка ждёт освобождения части
+        for attempt in range(SHARD_ATTEMPTS):
+            free_shard = (
+                select(ProductStockShard.shard)
+                .where(ProductStockShard.product_id == product_id, ProductStockShard.stock >= quantity)
+                .order_by(func.random())
+                .limit(1)
+                .with_for_update(skip_locked=attempt < SHARD_ATTEMPTS - 1)
+                .scalar_subquery()
+            )
+            result = await self.session.exec(
+                update(ProductStockShard)
+                .where(
+                    ProductStockShard.product_id == product_id,
+                    ProductStockShard.shard == free_shard,
+                    ProductStockShard.stock >= quantity,
+                )
+                .values(stock=ProductStockShard.stock - quantity)
+                .returning(ProductStockShard.shard, ProductStockShard.stock)
+                .execution_options(synchronize_session=False)
+            )
+            taken = result.one_or_none()
+            if taken is not None:
+                shard, left = taken
+                return [(shard, quantity)], left == 0
+
+            # Подходящей части нет совсем или все подходящие заняты другими транзакциями
+            largest = await self.session.scalar(
+                select(func.max(ProductStockShard.stock)).where(ProductStockShard.product_id == product_id)
+            )
+            if largest is None or largest < quantity:
+                break
+
+        return await self._take_from_several_shards(product_id, quantity)
+
+    async def _take_from_several_shards(self, product_id: UUID, quantity: int) -> Tuple[List[Tuple[int, int]], bool]:
+        # Части блокируются по порядку номеров, поэтому конкурирующие списания не взаимоблокируются
+        result = await self.session.exec(
+            select(ProductStockShard.shard, ProductStockShard.stock)
+            .where(ProductStockShard.product_id == product_id, ProductStockShard.stock > 0)
+            .order_by(ProductStockShard.shard)
+            .with_for_update()
+        )
+        available = result.all()
+        if sum(stock for _, stock in available) < quantity:
+            raise OutOfStock([product_id])
+
+        taken: List[Tuple[int, int]] = []
+        remaining = quantity
+        for shard, stock in available:
+            take = min(stock, remaining)
+            taken.append((shard, take))
+            remaining -= take
+            if not remaining:
+                break
+        empty = any(take == stock for (_, take), (_, stock) in zip(taken, available))
+
+        values = _unnest([product_id] * len(taken), [part for _, part in taken], [shard for shard, _ in taken])
+        await self.session.exec(
+            update(ProductStockShard)
+            .where(ProductStockShard.product_id == values.c.product_id, ProductStockShard.shard == values.c.shard)
+            .values(stock=ProductStockShard.stock - values.c.quantity)
+            .execution_options(synchronize_session=False)
+        )
+        return taken, empty
+
+    async def _mark_out_of_stock(self, product_id: UUID) -> Optional[Product]:
+        # Строка товара уже заблокирована: проверка идёт отдельным запросом после блокировки
+        # и видит части, которые опустошили и закоммитили конкурирующие транзакции
+        has_stock = select(ProductStockShard.shard).where(
+            ProductStockShard.product_id == product_id, ProductStockShard.stock > 0
+        ).exists()
+        result = await self.session.exec(
+            update(Product)
+            .where(Product.id == product_id, Product.status == ProductState.ACTIVE, ~has_stock)
+            .values(status=ProductState.OUT_OF_STOCK)
+            .returning(Product)
+            .execution_options(synchronize_session=False, populate_existing=True)
+        )
+        return result.scalars().one_or_none()
+
+    @timed("db")
+    async def confirm(self, order_ids: Sequence[UUID]) -> None:
+        """
+        Подтверждает резервы заказов: остаток остаётся списанным, резервы удаляются.
+
+        :param order_ids: Идентификаторы подтверждённых заказов.
+        """
+        await self.session.exec(delete(StockReservation).where(any_of(StockReservation.order_id, order_ids)))
+
+    @timed("db")
+    async def set_stock(self, product_id: UUID, stock: int, shards: int = 0, owner_id: Optional[UUID] = None
+                        ) -> Optional[Product]:
+        """
+        Устанавливает остаток товара и, если нужно, раскладывает его по частям.
+
+        Действующие резервы не входят в новый остаток и остаются списанными. Части остатка
+        пересоздаются, поэтому резервы не хранят ссылку на них: при освобождении резерв
+        возвращается в раскладку, действующую в этот момент, - в общий остаток, если товар
+        больше не разложен по частям, или в часть с номером `shard % shards`.
+
+        :param product_id: Идентификатор товара.
+        :param stock: Доступный остаток.
+        :param shards: Количество частей, 0 - хранить остаток одним числом.
+        :param owner_id: Если указан, остаток меняется только у товара этого владельца.
+        :return: Обновлённый товар или None, если он не найден.
+        """
+        conditions = [Product.id == product_id]
+        if owner_id is not None:
+            conditions.append(Product.user_id == owner_id)
+
+        await self.session.exec(
+            select(ProductStockShard.shard)
+            .where(ProductStockShard.product_id == product_id)
+            .order_by(ProductStockShard.shard)
+            .with_for_update()
+        )
+        result = await self.session.exec(
+            update(Product)
+            .where(*conditions, Product.status != ProductState.DISABLED)
+            .values(stock=stock if not shards else None, stock_shards=shards, status=_status_after(literal(stock)))
+            .returning(Product)
+            .execution_options(populate_existing=True)
+        )
+        product = result.scalars().one_or_none()
+        if product is None:
+            return None
+
+        await self.session.exec(delete(ProductStockShard).where(ProductStockShard.product_id == product_id))
+        if shards:
+            # Остаток делится поровну, остаток от деления достаётся первым частям
+            await self.session.exec(insert(ProductStockShard).values([
+                {"product_id": product_id, "shard": shard, "stock": stock // shards + (shard < stock % shards)}
+                for shard in range(shards)
+            ]))
+
+        await commit(self.session)
+        return product
+
+    @timed("db")
+    async def release_expired(self, batch_size: int) -> int:
+        """
+        Возвращает на склад одну пачку просроченных резервов и удаляет их.
+
+        Резерв возвращается в текущую раскладку, а не в ту, что была при списании: её могли
+        поменять через `set_stock`. Раскладка читается до блокировок, чтобы заблокировать
+        части раньше строк товаров, и проверяется ещё раз под блокировкой строк товаров.
+
+        :param batch_size: Максимальное количество резервов.
+        :return: Количество освобождённых резервов.
+        """
+        expired_ids = (
+            select(StockReservation.id)
+            .where(StockReservation.expire_at < datetime.now() - RELEASE_GRACE)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        result = await self.session.exec(
+            delete(StockReservation)
+            .where(StockReservation.id.in_(expired_ids))
+            .returning(StockReservation.product_id, StockReservation.shard, StockReservation.quantity)
+        )
+        released = result.all()
+
+        product_ids = {product_id for product_id, _, _ in released}
+        layouts = {}
+        if product_ids:
+            result = await self.session.exec(
+                select(Product.id, Product.stock_shards).where(any_of(Product.id, list(product_ids)))
+            )
+            layouts = dict(result.all())
+        plain, sharded = _group_released(released, layouts)
+        if sharded:
+            await self._lock_shards([key[0] for key in sharded], [key[1] for key in sharded])
+        if product_ids:
+            locked = await self._lock_products(product_ids)
+            if locked != layouts:
+                # set_stock успел сменить раскладку, остаток возвращается по новой
+                plain, sharded = _group_released(released, locked)
+
+        changed: List[Product] = []
+        if plain:
+            values = _unnest(list(plain), list(plain.values()))
+            new_stock = Product.stock + values.c.quantity
+            result = await self.session.exec(
+                update(Product)
+                .where(Product.id == values.c.product_id, Product.stock.is_not(None))
+                .values(stock=new_stock, status=_status_after(new_stock))
+                .returning(Product)
+                .execution_options(synchronize_session=False, populate_existing=True)
+            )
+            changed.extend(result.scalars().all())
+
+        if sharded:
+            keys = list(sharded)
+            values = _unnest([key[0] for key in keys], list(sharded.values()), [key[1] for key in keys])
+            await self.session.exec(
+                update(ProductStockShard)
+                .where(ProductStockShard.product_id == values.c.product_id, ProductStockShard.shard == values.c.shard)
+                .values(stock=ProductStockShard.stock + values.c.quantity)
+                .execution_options(synchronize_session=False)
+            )
+            result = await self.session.exec(
+                update(Product)
+                .where(any_of(Product.id, {key[0] for key in keys}), Product.status == ProductState.OUT_OF_STOCK)
+                .values(status=ProductState.ACTIVE)
+                .returning(Product)
+                .execution_options(synchronize_session=False, populate_existing=True)
+            )
+            changed.extend(result.scalars().all())
+
+        await self.session.commit()
+        await self.reindex(changed)
+        return len(released)
@@ -0,0 +1,121 @@
+import logging
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional, List, Tuple, Iterator
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+logger = logging.getLogger(__name__)
+
+_stats: ContextVar[Optional["QueryStats"]] = ContextVar("query_stats", default=None)
+
+
+class QueryBudgetExceeded(RuntimeError):
+    """Запрос к API выполнил слишком много SQL-запросов или повторяющиеся запросы (N+1)."""
+
+
+class QueryStats:
+    """Статистика SQL-запросов, выполненных внутри `track_queries`."""
+
+    def __init__(self, parent: Optional["QueryStats"] = None):
+        self.parent = parent
+        self.count = 0
+        self.duration = 0.0
+        self.saved = 0
+        self.shapes: Counter[str] = Counter()
+
+    def record(self, statement: str, duration: float) -> None:
+        stats = self
+        while stats is not None:
+            stats.count += 1
+            stats.duration += duration
+            stats.shapes[statement] += 1
+            stats = stats.parent
+
+    def record_saved(self) -> None:
+        """Учитывает запрос, который не пришлось выполнять благодаря кэшу сессии."""
+        stats = self
+        while stats is not None:
+            stats.saved += 1
+            stats = stats.parent
+
+    def repeated(self, threshold: int) -> List[Tuple[str, int]]:
+        """Возвращает запросы одного вида, выполненные не меньше threshold раз."""
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+    def problems(self, max_queries: int, repeat_threshold: int) -> List[str]:
+        """
+        Описывает нарушения бюджета запросов.
+
+        :param max_queries: Максимальное количество запросов.
+        :param repeat_threshold: Сколько раз может повториться запрос одного вида до признания его N+1.
+        :return: Список описаний нарушений, пустой если их нет.
+        """
+        problems = []
+        if self.count > max_queries:
+            problems.append(f"{self.count} queries executed, limit is {max_queries}")
+        for shape, count in self.repeated(repeat_threshold):
+            problems.append(f"possible N+1: executed {count} times: {shape}")
+        return problems
+
+
+@contextmanager
+def track_queries() -> Iterator[QueryStats]:
+    """
+    Считает SQL-запросы, выполненные в текущем контексте.
+
+    Вложенные трекеры учитывают запросы и во всех внешних трекерах.
+    """
+    stats = QueryStats(parent=_stats.get())
+    token = _stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _stats.reset(token)
+
+
+def current_stats() -> Optional[QueryStats]:
+    return _stats.get()
+
+
+@contextmanager
+def assert_max_queries(limit: int, repeat_threshold: Optional[int] = None) -> Iterator[QueryStats]:
+    """
+    Проверяет в тестах, что блок кода выполнил не больше limit SQL-запросов.
+
+        with assert_max_queries(2):
+            await client.get("/orders/")
+
+    :param limit: Максимальное количество запросов.
+    :param repeat_threshold: Если указан, запросы одного вида не должны повторяться столько раз.
+    :raises AssertionError: Если ограничение нарушено.
+    """
+    with track_queries() as stats:
+        yield stats
+
+    problems = stats.problems(limit, repeat_threshold or stats.count + 1)
+    if problems:
+        raise AssertionError("\n".join(problems))
+
+
+def install_tracker(engine: AsyncEngine) -> None:
+    """Подключает подсчёт запросов к событиям движка."""
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started_at", []).append(time.perf_counter())
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started_at = conn.info["query_started_at"].pop()
+        stats = _stats.get()
+        if stats is not None:
+            stats.record(statement, time.perf_counter() - started_at)
+
+    @event.listens_for(engine.sync_engine, "handle_error")
+    def handle_error(context):
+        if context.connection is not None and context.connection.info.get("query_started_at"):
+            context.connection.info["query_started_at"].pop()
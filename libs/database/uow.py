@@ -0,0 +1,77 @@
+import logging
+from typing import Any, Awaitable, Callable
+
+from sqlalchemy import event
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from libs.database.replicas import RoutingSession
+
+logger = logging.getLogger(__name__)
+
+
+def begin_unit_of_work(session: AsyncSession) -> None:
+    """
+    Переводит сессию в режим единицы работы.
+
+    Репозитории перестают коммитить сами и только отправляют изменения в базу (flush),
+    а побочные эффекты откладывают до коммита. Коммит выполняет владелец сессии
+    через `complete_unit_of_work`.
+    """
+    session.info["unit_of_work"] = True
+
+
+def in_unit_of_work(session: AsyncSession) -> bool:
+    return session.info.get("unit_of_work", False)
+
+
+async def commit(session: AsyncSession) -> None:
+    """Коммитит сессию, а в режиме единицы работы только отправляет изменения в базу."""
+    if in_unit_of_work(session):
+        await session.flush()
+        return
+
+    await session.commit()
+    await _run_after_commit(session)
+
+
+async def after_commit(session: AsyncSession, func: Callable[..., Awaitable[Any]], *args: Any) -> None:
+    """
+    Выполняет действие после успешного коммита сессии.
+
+    Вне единицы работы изменения уже закоммичены, и действие выполняется сразу.
+    Внутри - откладывается до `complete_unit_of_work` и отменяется при откате.
+
+    :param session: Сессия, после коммита которой нужно выполнить действие.
+    :param func: Асинхронная функция.
+    :param args: Аргументы функции.
+    """
+    if in_unit_of_work(session):
+        session.info.setdefault("after_commit", []).append((func, args))
+        return
+
+    await func(*args)
+
+
+async def complete_unit_of_work(session: AsyncSession) -> None:
+    """
+    Коммитит единицу работы и выполняет отложенные действия.
+
+    Ошибка коммита пробрасывается. Ошибки отложенных действий только логируются:
+    данные уже сохранены, и откатить их нельзя.
+    """
+    await session.commit()
+    await _run_after_commit(session)
+
+
+async def _run_after_commit(session: AsyncSession) -> None:
+    callbacks = session.info.pop("after_commit", [])
+    for func, args in callbacks:
+        try:
+            await func(*args)
+        except Exception:
+            logger.exception("After-commit action %s failed", getattr(func, "__qualname__", func))
+
+
+@event.listens_for(RoutingSession, "after_soft_rollback")
+def _discard_after_rollback(session, previous_transaction):
+    session.info.pop("after_commit", None)
@@ -0,0 +1,40 @@
+import argparse
+import asyncio
+import logging
+import sys
+
+from app.config import settings
+from app.elastic import index_settings
+from libs.database.engine import async_session, engine
+from libs.elastic.client import es_client, sync_elasticsearch, reindex_elasticsearch
+
+
+async def sync(rebuild: bool) -> None:
+    try:
+        async with async_session() as session:
+            for name, body in index_settings.items():
+                if rebuild:
+                    await reindex_elasticsearch(session, name, body)
+                else:
+                    await sync_elasticsearch(session, name, body)
+    finally:
+        await es_client.close()
+        await engine.dispose()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog="python -m libs.elastic")
+    parser.add_argument(
+        "command", choices=["sync", "rebuild"],
+        help="sync - отправить изменения после последней синхронизации, "
+             "rebuild - собрать новый индекс и переключить на него алиас"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=settings.log_level.value)
+    asyncio.run(sync(rebuild=args.command == "rebuild"))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterable, AsyncIterator, Callable, Collection, Dict, List, Optional, Sequence, Tuple, TypeVar
+
+from elasticsearch import AsyncElasticsearch
+from elasticsearch.helpers import async_streaming_bulk
+from elasticsearch.serializer import JsonSerializer
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Строка действия bulk-запроса и уже сериализованный документ, None для удаления
+PreparedAction = Tuple[Dict[str, Any], Optional[bytes]]
+
+_serializer = JsonSerializer()
+
+
+def prepare_index_actions(
+        index_name: str,
+        entities: Sequence[Any],
+        map_document: Callable[[Any], Dict[str, Any]],
+        map_version: Optional[Callable[[Any], Optional[int]]] = None
+) -> List[PreparedAction]:
+    """
+    Готовит действия индексации с документами, сериализованными в JSON.
+
+    Выполняется в пуле потоков: сериализация - самая тяжёлая по CPU часть индексации.
+
+    :param index_name: Имя индекса.
+    :param entities: Сущности с полем id.
+    :param map_document: Преобразование сущности в документ.
+    :param map_version: Внешняя версия документа, None - без версии.
+    :return: Подготовленные действия.
+    """
+    prepared = []
+    for entity in entities:
+        header = {"_index": index_name, "_id": str(entity.id)}
+        version = map_version(entity) if map_version else None
+        if version is not None:
+            header.update(version=version, version_type="external_gte")
+        prepared.append(({"index": header}, _serializer.dumps(map_document(entity))))
+    return prepared
+
+
+def prepare_delete_actions(index_name: str, entity_ids: Sequence[Any]) -> List[PreparedAction]:
+    """Готовит действия удаления документов по идентификаторам."""
+    return [({"delete": {"_index": index_name, "_id": str(entity_id)}}, None) for entity_id in entity_ids]
+
+
+async def stream_bulk(
+        es_client: AsyncElasticsearch,
+        batches: AsyncIterable[Sequence[T]],
+        prepare: Callable[[Sequence[T]], List[PreparedAction]],
+        ignore_status: Collection[int] = (),
+        name: str = "bulk"
+) -> int:
+    """
+    Отправляет в Elasticsearch поток пачек с ограниченной памятью.
+
+    Пачки читаются по одной, действия для них готовятся в пуле потоков, не занимая цикл
+    событий, и отправляются `elastic_bulk_parallelism` параллельными потоками
+    `async_streaming_bulk`. Между чтением и отправкой ждёт не больше двух пачек на поток,
+    поэтому память не зависит от общего объёма. Документы, отклонённые с кодом 429,
+    отправляются повторно с экспоненциальной паузой.
+
+    :param es_client: Клиент Elasticsearch.
+    :param batches: Асинхронный поток пачек, например частей таблицы из базы данных.
+    :param prepare: Подготовка действий для пачки, выполняется в пуле потоков.
+    :param ignore_status: Коды ответа по документам, которые не считаются ошибкой.
+    :param name: Имя операции для журнала.
+    :return: Количество отправленных действий.
+    """
+    parallelism = settings.elastic_bulk_parallelism
+    queue: asyncio.Queue[Optional[List[PreparedAction]]] = asyncio.Queue(maxsize=parallelism * 2)
+    sent = 0
+    started = time.perf_counter()
+
+    async def produce(executor: ThreadPoolExecutor) -> None:
+        loop = asyncio.get_running_loop()
+        async for batch in batches:
+            await queue.put(await loop.run_in_executor(executor, prepare, batch))
+        for _ in range(parallelism):
+            await queue.put(None)
+
+    async def actions() -> AsyncIterator[PreparedAction]:
+        while (prepared := await queue.get()) is not None:
+            for action in prepared:
+                yield action
+
+    async def send() -> None:
+        nonlocal sent
+        async for _, _ in async_streaming_bulk(
+                es_client,
+                actions(),
+                chunk_size=settings.elastic_bulk_chunk_size,
+                max_chunk_bytes=settings.elastic_bulk_max_bytes,
+                max_retries=settings.elastic_bulk_max_retries,
+                initial_backoff=settings.elastic_bulk_initial_backoff,
+                ignore_status=ignore_status,
+                # Действия уже разобраны на строку действия и тело в prepare
+                expand_action_callback=lambda action: action,
+        ):
+            sent += 1
+
+    with ThreadPoolExecutor(max_workers=parallelism, thread_name_prefix="es-bulk") as executor:
+        async with asyncio.TaskGroup() as group:
+            group.create_task(produce(executor))
+            for _ in range(parallelism):
+                group.create_task(send())
+
+    elapsed = time.perf_counter() - started
+    if sent:
+        logger.info("%s: %d docs in %.1fs, %.0f docs/s", name, sent, elapsed, sent / elapsed)
+    return sent
@@ -1,15 +1,23 @@
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
-from typing import Annotated, List, Set, Any
+import logging
+from datetime import datetime, timedelta
+from typing import Annotated, Set, Any, AsyncIterator, List
+from uuid import UUID
 
 from elasticsearch import AsyncElasticsearch
-from elasticsearch.helpers import async_bulk
 from fastapi import Depends
 from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app.config import settings
 from libs.database.models import Product
-from libs.database.repositories import ProductRepository
+from libs.database.repositories import ProductRepository, SearchSyncRepository
+from libs.database.repositories.base import batched
+from libs.elastic.indices import ensure_index, create_index, finish_bulk_load, swap_alias
+
+logger = logging.getLogger(__name__)
+
+# Сколько живёт point-in-time между запросами страниц при обходе индекса
+PIT_KEEP_ALIVE = "1m"
 
 es_client = AsyncElasticsearch(str(settings.elastic_url))
 
@@ -17,73 +25,202 @@ es_client = AsyncElasticsearch(str(settings.elastic_url))
 async def get_es_client():
     yield es_client
 
+
 async def sync_elasticsearch(db_session: AsyncSession, index_name: str, index_settings: dict[str, Any]) -> None:
     """
-    Синхронизирует продукты из базы данных с Elasticsearch,
-    добавляя или обновляя новые записи и удаляя записи, которых нет в базе данных.
-    Также проверяет и создает индекс, если его нет.
+    Синхронизирует продукты из базы данных с Elasticsearch.
+
+    Если индекс уже синхронизировался, в него отправляются только продукты, изменённые
+    после сохранённой отметки, и удаляются продукты по отметкам об удалении. Иначе индекс
+    заполняется целиком. Если алиаса нет, за ним создаётся новый индекс.
+
+    :param db_session: Сессия базы данных.
+    :param index_name: Имя алиаса индекса.
+    :param index_settings: Настройки и маппинг для создания индекса.
+    """
+    created = await ensure_index(es_client, index_name, index_settings)
+
+    sync_repo = SearchSyncRepository(db_session)
+    synced_until = await sync_repo.get_watermark(index_name)
+    if created or synced_until is None:
+        await rebuild_index(db_session, index_name)
+    else:
+        latest = await ship_changes(db_session, index_name, synced_until)
+        await sync_repo.save_watermark(index_name, latest)
+
+
+async def sync_changes(db_session: AsyncSession, index_name: str) -> None:
+    """
+    Отправляет в индекс изменения после сохранённой отметки и сдвигает отметку.
+
+    Запускается периодически: так в поиск доходят изменения, которые отбросила очередь
+    отложенной записи. Индекс, который ещё ни разу не синхронизировался, пропускается,
+    его заполняет `sync_elasticsearch` при запуске приложения.
+
+    :param db_session: Сессия базы данных.
+    :param index_name: Имя алиаса индекса.
+    """
+    sync_repo = SearchSyncRepository(db_session)
+    synced_until = await sync_repo.get_watermark(index_name)
+    if synced_until is None:
+        return
+    latest = await ship_changes(db_session, index_name, synced_until)
+    await sync_repo.save_watermark(index_name, latest)
+
+
+async def reindex_elasticsearch(db_session: AsyncSession, index_name: str, index_settings: dict[str, Any]) -> None:
     """
+    Перестраивает индекс без простоя: собирает новый физический индекс и переключает на него алиас.
 
-    if not await es_client.indices.exists(index=index_name):
-        await es_client.indices.create(index=index_name, body=index_settings)
+    Новый индекс заполняется без обновления поиска и без реплик, потом они возвращаются.
+    Приложение всё это время пишет в старый индекс через алиас, а его изменения доходят до
+    нового индекса из ленты изменений базы данных: до переключения алиаса и ещё раз после
+    него, чтобы захватить записи, пришедшие в старый индекс в промежутке. Внешние версии
+    документов не дают догоняющей синхронизации затереть более новую запись приложения.
 
+    :param db_session: Сессия базы данных.
+    :param index_name: Имя алиаса индекса.
+    :param index_settings: Настройки и маппинг нового индекса.
+    """
+    sync_repo = SearchSyncRepository(db_session)
     product_repo = ProductRepository(db_session, es_client)
-    products: List[Product] = await product_repo.get_all()
+    started = await sync_repo.now()
+    new_index = await create_index(es_client, index_name, index_settings, bulk_load=True)
+    product_repo.index_name = new_index
+
+    try:
+        await product_repo.index_stream(product_repo.iter_chunks())
+        caught_up = await ship_changes(db_session, new_index, started)
+        await finish_bulk_load(es_client, new_index, index_settings)
+    except BaseException:
+        await es_client.indices.delete(index=new_index)
+        raise
+
+    previous = await swap_alias(es_client, index_name, new_index)
+    latest = await ship_changes(db_session, new_index, caught_up)
+    await sync_repo.save_watermark(index_name, latest)
+
+    if previous:
+        await es_client.indices.delete(index=",".join(previous))
+    logger.info("Elasticsearch alias %s switched to %s from %s", index_name, new_index, previous or "index")
 
-    db_product_ids: Set[str] = {str(product.id) for product in products}
-    es_product_ids = await get_all_indexed_ids(es_client, index_name=index_name)
 
-    products_to_index = []
-    products_to_delete = []
+async def ship_changes(db_session: AsyncSession, index_name: str, synced_until: datetime) -> datetime:
+    """
+    Отправляет в индекс изменения продуктов после отметки.
 
-    for product in products:
-        products_to_index.append({
-            "_op_type": "index",
-            "_index": index_name,
-            "_id": str(product.id),
-            "_source": product.model_dump(exclude={"id"})
-        })
+    :param db_session: Сессия базы данных.
+    :param index_name: Имя индекса или алиаса.
+    :param synced_until: Отметка последней синхронизации.
+    :return: Новая отметка, которую можно сохранить.
+    """
+    sync_repo = SearchSyncRepository(db_session)
+    product_repo = ProductRepository(db_session, es_client)
+    product_repo.index_name = index_name
+    since = synced_until - timedelta(seconds=settings.elastic_sync_overlap)
+    latest = synced_until
 
-    for product_id in es_product_ids - db_product_ids:
-        products_to_delete.append({
-            "_op_type": "delete",
-            "_index": index_name,
-            "_id": product_id
-        })
+    async def changed() -> AsyncIterator[List[Product]]:
+        nonlocal latest
+        async for products in sync_repo.iter_changed_products(since):
+            latest = max(latest, products[-1].updated_at)
+            yield products
 
-    tasks = []
+    async def deleted() -> AsyncIterator[List[UUID]]:
+        nonlocal latest
+        async for tombstones in sync_repo.iter_deleted_products(since):
+            latest = max(latest, tombstones[-1].deleted_at)
+            yield [tombstone.product_id for tombstone in tombstones]
 
-    if products_to_index:
-        tasks.append(async_bulk(es_client, products_to_index))
+    indexed = await product_repo.index_stream(changed())
+    removed = await product_repo.delete_stream(deleted())
 
-    if products_to_delete:
-        tasks.append(async_bulk(es_client, products_to_delete))
+    logger.info("Elasticsearch index %s synced: %d indexed, %d deleted", index_name, indexed, removed)
+    return latest
 
-    if tasks:
-        await asyncio.gather(*tasks)
 
+async def rebuild_index(db_session: AsyncSession, index_name: str) -> None:
+    """
+    Переиндексирует все продукты и удаляет из индекса документы, которых нет в базе данных.
 
-async def get_all_indexed_ids(es_client: AsyncElasticsearch, index_name: str) -> Set[str]:
-    query = {
-        "query": {
-            "match_all": {}
-        },
-        "size": 1000
-    }
+    Продукты читаются из базы частями и отправляются потоковым bulk, в памяти держатся
+    только их идентификаторы.
 
-    all_ids = set()
-    response = await es_client.search(index=index_name, body=query)
+    :param db_session: Сессия базы данных.
+    :param index_name: Имя индекса.
+    """
+    sync_repo = SearchSyncRepository(db_session)
+    product_repo = ProductRepository(db_session, es_client)
+    product_repo.index_name = index_name
+    # Изменения во время перестройки попадут в следующую синхронизацию
+    started = await sync_repo.now()
+    db_product_ids: Set[str] = set()
 
-    while True:
-        all_ids.update(hit["_id"] for hit in response["hits"]["hits"])
+    async def products() -> AsyncIterator[List[Product]]:
+        async for chunk in product_repo.iter_chunks():
+            db_product_ids.update(str(product.id) for product in chunk)
+            yield chunk
+
+    async def stale() -> AsyncIterator[List[str]]:
+        for batch in batched(list(es_product_ids - db_product_ids), settings.db_batch_size):
+            yield batch
 
-        if len(response["hits"]["hits"]) < 1000:
-            break
+    indexed = await product_repo.index_stream(products())
+    es_product_ids = await get_all_indexed_ids(es_client, index_name=index_name)
+    removed = await product_repo.delete_stream(stale())
+
+    await sync_repo.save_watermark(index_name, started)
+    logger.info("Elasticsearch index %s rebuilt: %d indexed, %d deleted", index_name, indexed, removed)
+
+
+async def get_all_indexed_ids(es_client: AsyncElasticsearch, index_name: str) -> Set[str]:
+    """
+    Возвращает идентификаторы всех документов индекса.
 
-        query["search_after"] = response["hits"]["hits"][-1]["sort"]
-        response = await es_client.search(index=index_name, body=query)
+    Документы перебираются в point-in-time, поэтому снимок согласован, даже если индекс
+    меняется во время обхода. Сортировка `_shard_doc` - самый дешёвый порядок для
+    `search_after`, `_source` не загружается, из ответа остаются только `_id` и ключ
+    сортировки. Снимок делится на `elastic_scan_slices` частей, которые читаются параллельно.
 
-    return all_ids
+    :param es_client: Клиент Elasticsearch.
+    :param index_name: Имя индекса.
+    :return: Множество идентификаторов документов.
+    """
+    slices = settings.elastic_scan_slices
+    pit = await es_client.open_point_in_time(index=index_name, keep_alive=PIT_KEEP_ALIVE)
+    try:
+        parts = await asyncio.gather(*(
+            _scan_slice_ids(es_client, pit["id"], slice_id, slices) for slice_id in range(slices)
+        ))
+    finally:
+        await es_client.close_point_in_time(id=pit["id"])
+
+    return set().union(*parts)
+
+
+async def _scan_slice_ids(es_client: AsyncElasticsearch, pit_id: str, slice_id: int, slices: int) -> Set[str]:
+    page_size = settings.elastic_scan_page_size
+    query: dict[str, Any] = {
+        "size": page_size,
+        "_source": False,
+        "track_total_hits": False,
+        "pit": {"id": pit_id, "keep_alive": PIT_KEEP_ALIVE},
+        "sort": ["_shard_doc"],
+    }
+    if slices > 1:
+        query["slice"] = {"id": slice_id, "max": slices}
+
+    ids: Set[str] = set()
+    while True:
+        response = await es_client.search(body=query, filter_path="pit_id,hits.hits._id,hits.hits.sort")
+        hits = response.get("hits", {}).get("hits", [])
+        ids.update(hit["_id"] for hit in hits)
+        if len(hits) < page_size:
+            return ids
+
+        # Идентификатор point-in-time может меняться между ответами
+        query["pit"]["id"] = response.get("pit_id", query["pit"]["id"])
+        query["search_after"] = hits[-1]["sort"]
 
 
 ElasticDep = Annotated[AsyncElasticsearch, Depends(get_es_client)]
@@ -0,0 +1,116 @@
+import copy
+import hashlib
+import json
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+from elasticsearch import AsyncElasticsearch
+
+logger = logging.getLogger(__name__)
+
+
+def settings_hash(body: Dict[str, Any]) -> str:
+    """Отпечаток настроек и маппинга индекса, по нему видно, что индекс собран по старому описанию."""
+    return hashlib.sha1(json.dumps(body, sort_keys=True).encode()).hexdigest()[:12]
+
+
+async def alias_targets(es_client: AsyncElasticsearch, alias: str) -> List[str]:
+    """
+    Возвращает физические индексы за алиасом.
+
+    :param es_client: Клиент Elasticsearch.
+    :param alias: Имя алиаса.
+    :return: Имена индексов, пустой список - алиаса нет.
+    """
+    if not await es_client.indices.exists_alias(name=alias):
+        return []
+    response = await es_client.indices.get_alias(name=alias)
+    return list(response.keys())
+
+
+async def create_index(es_client: AsyncElasticsearch, alias: str, body: Dict[str, Any], bulk_load: bool = False) -> str:
+    """
+    Создаёт новый физический индекс для алиаса с версией в имени.
+
+    :param es_client: Клиент Elasticsearch.
+    :param alias: Имя алиаса, от него образуется имя индекса.
+    :param body: Настройки и маппинг индекса.
+    :param bulk_load: Создать индекс для первичной загрузки: без обновления поиска и без реплик.
+    :return: Имя созданного индекса.
+    """
+    name = f"{alias}-{datetime.now(timezone.utc):%Y%m%d%H%M%S%f}"
+    index_body = copy.deepcopy(body)
+    index_body.setdefault("mappings", {}).setdefault("_meta", {})["settings_hash"] = settings_hash(body)
+    if bulk_load:
+        index_body.setdefault("settings", {}).update(refresh_interval="-1", number_of_replicas=0)
+
+    await es_client.indices.create(index=name, body=index_body)
+    return name
+
+
+async def finish_bulk_load(es_client: AsyncElasticsearch, index_name: str, body: Dict[str, Any]) -> None:
+    """
+    Возвращает индексу после первичной загрузки обновление поиска и реплики из описания.
+
+    Значения, не заданные в описании, сбрасываются к значениям Elasticsearch по умолчанию.
+
+    :param es_client: Клиент Elasticsearch.
+    :param index_name: Имя индекса.
+    :param body: Настройки и маппинг индекса.
+    """
+    index_settings = body.get("settings", {})
+    await es_client.indices.put_settings(index=index_name, settings={
+        "refresh_interval": index_settings.get("refresh_interval"),
+        "number_of_replicas": index_settings.get("number_of_replicas"),
+    })
+    await es_client.indices.refresh(index=index_name)
+
+
+async def ensure_index(es_client: AsyncElasticsearch, alias: str, body: Dict[str, Any]) -> bool:
+    """
+    Создаёт индекс за алиасом, если алиаса нет.
+
+    Если индекс за алиасом собран по другому описанию, об этом пишется в журнал: маппинг
+    применяется только перестройкой индекса.
+
+    :param es_client: Клиент Elasticsearch.
+    :param alias: Имя алиаса, через который приложение читает и пишет.
+    :param body: Настройки и маппинг индекса.
+    :return: True, если индекс создан и пуст.
+    """
+    if await es_client.indices.exists(index=alias):
+        mappings = await es_client.indices.get_mapping(index=alias)
+        expected = settings_hash(body)
+        for index_name, index_mapping in mappings.items():
+            if index_mapping["mappings"].get("_meta", {}).get("settings_hash") != expected:
+                logger.warning(
+                    "Elasticsearch index %s is out of date, run `python -m libs.elastic rebuild`", index_name
+                )
+        return False
+
+    index_name = await create_index(es_client, alias, body)
+    await es_client.indices.put_alias(index=index_name, name=alias, is_write_index=True)
+    return True
+
+
+async def swap_alias(es_client: AsyncElasticsearch, alias: str, index_name: str) -> List[str]:
+    """
+    Атомарно переключает алиас на новый индекс.
+
+    Индекс, созданный раньше прямо под именем алиаса, удаляется в том же запросе,
+    иначе алиас с таким именем создать нельзя.
+
+    :param es_client: Клиент Elasticsearch.
+    :param alias: Имя алиаса.
+    :param index_name: Новый индекс.
+    :return: Индексы, с которых снят алиас.
+    """
+    previous = await alias_targets(es_client, alias)
+    actions: List[Dict[str, Any]] = [{"add": {"index": index_name, "alias": alias, "is_write_index": True}}]
+    actions.extend({"remove": {"index": name, "alias": alias}} for name in previous)
+    if not previous and await es_client.indices.exists(index=alias):
+        actions.append({"remove_index": {"index": alias}})
+
+    await es_client.indices.update_aliases(actions=actions)
+    return previous
@@ -1,27 +1,126 @@
-from typing import Type, TypeVar, Generic, Dict, Any, List, Optional, Union
+from datetime import datetime, timezone
+from functools import partial
+from typing import Type, TypeVar, Generic, Dict, Any, List, Optional, Union, Sequence, AsyncIterable
 from uuid import UUID
 
 from elasticsearch import AsyncElasticsearch
+from elasticsearch.helpers import async_bulk
 from sqlmodel import SQLModel
 
+from libs.elastic.bulk import PreparedAction, stream_bulk, prepare_index_actions, prepare_delete_actions
+from libs.elastic.writer import bulk_writer
+from libs.metrics import timed
+
 T = TypeVar("T", bound=SQLModel)
 
 
 class ElasticRepository(Generic[T]):
-    def __init__(self, model: Type[T], es_client: AsyncElasticsearch, index_name: str):
+    def __init__(
+            self,
+            model: Type[T],
+            es_client: AsyncElasticsearch,
+            index_name: str,
+            version_field: Optional[str] = None
+    ):
+        """
+        :param model: Модель сущности.
+        :param es_client: Клиент Elasticsearch.
+        :param index_name: Имя индекса или алиаса.
+        :param version_field: Поле времени изменения, которое становится внешней версией документа.
+            Тогда запись более старого состояния поверх более нового отклоняется индексом, и
+            порядок, в котором запись из запроса и догоняющая синхронизация доходят до индекса, не важен.
+        """
         self.model = model
         self.es_client = es_client
         self.index_name = index_name
+        self.version_field = version_field
 
+    @timed("es")
     async def index_entity(self, entity: T):
         """Индексация сущности в Elasticsearch."""
+        if bulk_writer.running:
+            bulk_writer.enqueue(self._prepare_index([entity]))
+            return
+
         doc = self._map_to_document(entity)
-        await self.es_client.index(index=self.index_name, id=str(entity.id), body=doc)
+        version = self._map_to_version(entity)
+        if version is None:
+            await self.es_client.index(index=self.index_name, id=str(entity.id), body=doc)
+            return
+
+        # 409 - в индексе уже более новое состояние
+        await self.es_client.options(ignore_status=409).index(
+            index=self.index_name, id=str(entity.id), body=doc, version=version, version_type="external_gte"
+        )
 
+    @timed("es")
     async def delete_entity(self, entity_id: Union[int, UUID]):
         """Удаляет документ из индекса Elasticsearch по ID."""
+        if bulk_writer.running:
+            bulk_writer.enqueue(prepare_delete_actions(self.index_name, [entity_id]))
+            return
+
         await self.es_client.delete(index=self.index_name, id=str(entity_id))
 
+    @timed("es")
+    async def index_entities(self, entities: Sequence[T]):
+        """Индексирует сущности одним bulk-запросом."""
+        if bulk_writer.running:
+            bulk_writer.enqueue(self._prepare_index(entities))
+            return
+
+        actions = []
+        for entity in entities:
+            action = {"_op_type": "index", "_index": self.index_name, "_id": str(entity.id),
+                      "_source": self._map_to_document(entity)}
+            version = self._map_to_version(entity)
+            if version is not None:
+                action.update(_version=version, _version_type="external_gte")
+            actions.append(action)
+        await self._bulk(actions, ignore_status=409)
+
+    @timed("es")
+    async def delete_entities(self, entity_ids: Sequence[Union[int, UUID]]):
+        """Удаляет документы одним bulk-запросом, отсутствующие в индексе пропускаются."""
+        if bulk_writer.running:
+            bulk_writer.enqueue(prepare_delete_actions(self.index_name, entity_ids))
+            return
+
+        actions = [
+            {"_op_type": "delete", "_index": self.index_name, "_id": str(entity_id)}
+            for entity_id in entity_ids
+        ]
+        await self._bulk(actions, ignore_status=404)
+
+    async def index_stream(self, chunks: AsyncIterable[Sequence[T]]) -> int:
+        """
+        Индексирует поток частей сущностей потоковым bulk, не держа весь поток в памяти.
+
+        :param chunks: Асинхронный поток частей сущностей.
+        :return: Количество проиндексированных документов.
+        """
+        return await stream_bulk(
+            self.es_client, chunks, self._prepare_index, ignore_status=(409,), name=f"index {self.index_name}"
+        )
+
+    async def delete_stream(self, id_chunks: AsyncIterable[Sequence[Union[int, UUID]]]) -> int:
+        """
+        Удаляет документы по потоку частей идентификаторов, отсутствующие в индексе пропускаются.
+
+        :param id_chunks: Асинхронный поток частей идентификаторов.
+        :return: Количество обработанных удалений.
+        """
+        prepare = partial(prepare_delete_actions, self.index_name)
+        return await stream_bulk(
+            self.es_client, id_chunks, prepare, ignore_status=(404,), name=f"delete {self.index_name}"
+        )
+
+    async def _bulk(self, actions: List[Dict[str, Any]], **kwargs):
+        if actions:
+            # chunk_size по числу действий, чтобы helper не делил их на несколько запросов
+            await async_bulk(self.es_client, actions, chunk_size=len(actions), **kwargs)
+
+    @timed("es")
     async def search(
             self,
             fields: List[str],
@@ -68,10 +167,23 @@ class ElasticRepository(Generic[T]):
 
         return results
 
+    def _prepare_index(self, entities: Sequence[T]) -> List[PreparedAction]:
+        return prepare_index_actions(self.index_name, entities, self._map_to_document, self._map_to_version)
+
     def _map_to_document(self, entity: T) -> Dict[str, Any]:
         """Преобразует объект SQLModel в документ Elasticsearch."""
         return entity.model_dump(exclude={"id"})
 
+    def _map_to_version(self, entity: T) -> Optional[int]:
+        """Внешняя версия документа: время изменения сущности в микросекундах."""
+        if self.version_field is None:
+            return None
+        changed_at: Optional[datetime] = getattr(entity, self.version_field)
+        if changed_at is None:
+            return None
+        # Время в базе без часового пояса, для версии важна только монотонность
+        return int(changed_at.replace(tzinfo=timezone.utc).timestamp() * 1_000_000)
+
     def _map_to_entity(self, source: Dict[str, Any]) -> T:
         """Преобразует документ Elasticsearch в объект модели SQLModel."""
         return self.model(**source)
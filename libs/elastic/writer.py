@@ -0,0 +1,244 @@
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+from elasticsearch import AsyncElasticsearch, ApiError, TransportError
+from elasticsearch.serializer import JsonSerializer
+
+from app.config import settings
+from libs.elastic.bulk import PreparedAction
+from libs.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Индекс и идентификатор документа: по ним сливаются записи одного документа
+DocumentKey = Tuple[str, str]
+
+# 404 при удалении - документа уже нет, 409 - в индексе уже более новая версия
+IGNORED_STATUSES = {404, 409}
+
+es_write_behind_pending = registry.gauge(
+    "es_write_behind_pending",
+    "Documents waiting in the write-behind queue.",
+)
+es_write_behind_flushed = registry.counter(
+    "es_write_behind_flushed_total",
+    "Documents sent by the write-behind queue.",
+)
+es_write_behind_dropped = registry.counter(
+    "es_write_behind_dropped_total",
+    "Documents dropped by the write-behind queue: queue overflow, exhausted retries or shutdown timeout.",
+)
+
+_serializer = JsonSerializer()
+
+
+class BulkWriter:
+    """
+    Отложенная пакетная запись в Elasticsearch.
+
+    Запросы кладут изменения документов в очередь процесса и не ждут Elasticsearch.
+    Несколько изменений одного документа до отправки сливаются в последнее. Очередь
+    отправляется одним bulk-запросом каждые `flush_interval` секунд или сразу, как только
+    набралось `batch_size` документов. Документы, которые не удалось записать из-за
+    перегрузки или недоступности кластера, возвращаются в очередь с отметкой, раньше которой
+    их не отправлять, и пауза растёт экспоненциально. Пока они ждут, остальная очередь
+    отправляется как обычно. Более новое изменение документа заменяет ожидающий повтор.
+
+    Очередь ограничена `max_pending` документами: пока кластер не успевает, изменения новых
+    документов отбрасываются. При остановке очередь досылается не дольше `drain_timeout`
+    секунд, остаток отбрасывается. Все отброшенные изменения восстановит следующая
+    синхронизация по ленте изменений базы данных, которую периодически запускает сборщик
+    просроченных записей.
+    """
+
+    def __init__(
+            self,
+            flush_interval: float,
+            batch_size: int,
+            max_retries: int,
+            initial_backoff: float,
+            max_pending: int,
+            drain_timeout: float
+    ):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.initial_backoff = initial_backoff
+        self.max_pending = max_pending
+        self.drain_timeout = drain_timeout
+        self._pending: Dict[DocumentKey, PreparedAction] = {}
+        # Документы, ожидающие повтора: номер попытки и момент time.monotonic(), раньше которого не отправлять
+        self._retries: Dict[DocumentKey, Tuple[int, float]] = {}
+        self._full = asyncio.Event()
+        self._closing = False
+        self._es_client: Optional[AsyncElasticsearch] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def enqueue(self, actions: List[PreparedAction]) -> None:
+        """
+        Ставит действия в очередь, заменяя ещё не отправленные действия с теми же документами.
+
+        Если очередь заполнена, действия с документами, которых в ней ещё нет, отбрасываются.
+
+        :param actions: Подготовленные действия bulk-запроса.
+        """
+        dropped = 0
+        for header, body in actions:
+            (meta,) = header.values()
+            key = (meta["_index"], meta["_id"])
+            # Документ переезжает в конец очереди, чтобы порядок изменений разных документов сохранялся
+            if self._pending.pop(key, None) is None and len(self._pending) >= self.max_pending:
+                dropped += 1
+                continue
+            self._pending[key] = (header, body)
+            self._retries.pop(key, None)
+
+        if dropped:
+            es_write_behind_dropped.inc(dropped)
+            logger.warning("Elasticsearch write-behind queue is full, dropped %d documents", dropped)
+        es_write_behind_pending.set(len(self._pending))
+        if len(self._pending) >= self.batch_size:
+            self._full.set()
+
+    async def start(self, es_client: AsyncElasticsearch) -> None:
+        """Запускает фоновую отправку очереди."""
+        self._es_client = es_client
+        self._closing = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Отправляет то, что осталось в очереди, за `drain_timeout` секунд и останавливает фоновую отправку."""
+        if self._task is None:
+            return
+        self._closing = True
+        self._full.set()
+        try:
+            await asyncio.wait_for(self._task, self.drain_timeout)
+        except TimeoutError:
+            es_write_behind_dropped.inc(len(self._pending))
+            logger.error(
+                "Elasticsearch write-behind did not drain in %.1fs, dropped %d documents",
+                self.drain_timeout, len(self._pending)
+            )
+            self._pending.clear()
+            self._retries.clear()
+            es_write_behind_pending.set(0)
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._full.wait(), self._next_wait())
+            except TimeoutError:
+                pass
+            self._full.clear()
+
+            while True:
+                try:
+                    if not await self._flush():
+                        break
+                except Exception:
+                    logger.exception("Elasticsearch write-behind flush failed")
+                    break
+
+            if self._closing and not self._pending:
+                return
+
+    def _next_wait(self) -> float:
+        """Сколько ждать до следующей отправки: интервал или время до ближайшего повтора."""
+        if not self._retries:
+            return self.flush_interval
+        earliest = min(not_before for _, not_before in self._retries.values())
+        return max(0.0, min(self.flush_interval, earliest - time.monotonic()))
+
+    async def _flush(self) -> bool:
+        """Отправляет одну пачку документов, которые можно отправлять уже сейчас, и возвращает, была ли она."""
+        now = time.monotonic()
+        batch: Dict[DocumentKey, PreparedAction] = {}
+        for key, action in self._pending.items():
+            retry = self._retries.get(key)
+            if retry is None or retry[1] <= now:
+                batch[key] = action
+                if len(batch) >= self.batch_size:
+                    break
+        if not batch:
+            return False
+
+        attempts = {}
+        for key in batch:
+            del self._pending[key]
+            attempts[key] = self._retries.pop(key, (0, 0.0))[0]
+        es_write_behind_pending.set(len(self._pending))
+
+        try:
+            failed = await self._send(batch)
+        except asyncio.CancelledError:
+            # Остановка по таймауту: недоставленная пачка учитывается вместе с остатком очереди
+            for key, action in batch.items():
+                self._pending.setdefault(key, action)
+            raise
+
+        self._requeue(failed, attempts)
+        return True
+
+    def _requeue(self, failed: Dict[DocumentKey, PreparedAction], attempts: Dict[DocumentKey, int]) -> None:
+        now = time.monotonic()
+        dropped = 0
+        for key, action in failed.items():
+            # Более новое изменение документа уже в очереди
+            if key in self._pending:
+                continue
+            attempt = attempts[key] + 1
+            if attempt > self.max_retries:
+                dropped += 1
+                continue
+            self._pending[key] = action
+            self._retries[key] = (attempt, now + self.initial_backoff * 2 ** (attempt - 1))
+
+        es_write_behind_pending.set(len(self._pending))
+        if dropped:
+            es_write_behind_dropped.inc(dropped)
+            logger.error("Elasticsearch write-behind dropped %d documents after %d retries", dropped, self.max_retries)
+
+    async def _send(self, batch: Dict[DocumentKey, PreparedAction]) -> Dict[DocumentKey, PreparedAction]:
+        """Отправляет пачку одним bulk-запросом и возвращает документы, которые стоит повторить."""
+        operations: List[bytes] = []
+        for header, body in batch.values():
+            operations.append(_serializer.dumps(header))
+            if body is not None:
+                operations.append(body)
+
+        try:
+            response = await self._es_client.bulk(operations=operations)
+        except (ApiError, TransportError) as e:
+            logger.warning("Elasticsearch write-behind bulk request failed: %s", e)
+            return batch
+
+        retry = {}
+        for (key, action), item in zip(batch.items(), response["items"]):
+            (result,) = item.values()
+            status = result.get("status", 500)
+            if status < 300 or status in IGNORED_STATUSES:
+                es_write_behind_flushed.inc()
+            elif status == 429 or status >= 500:
+                retry[key] = action
+            else:
+                es_write_behind_dropped.inc()
+                logger.error("Elasticsearch rejected document %s/%s: %s", key[0], key[1], result.get("error"))
+        return retry
+
+
+bulk_writer = BulkWriter(
+    settings.elastic_write_flush_interval,
+    settings.elastic_write_batch_size,
+    settings.elastic_write_max_retries,
+    settings.elastic_write_initial_backoff,
+    settings.elastic_write_max_pending,
+    settings.elastic_write_drain_timeout,
+)
@@ -0,0 +1,18 @@
+from app.config import settings
+from libs.metrics.registry import Registry, Counter, Gauge, Histogram
+from libs.metrics.timing import RequestTimings, start_request_timings, current_timings, phase, timed
+
+registry = Registry(settings.metrics_dir)
+
+__all__ = [
+    "registry",
+    "Registry",
+    "Counter",
+    "Gauge",
+    "Histogram",
+    "RequestTimings",
+    "start_request_timings",
+    "current_timings",
+    "phase",
+    "timed",
+]
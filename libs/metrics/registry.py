@@ -0,0 +1,341 @@
+import asyncio
+import fcntl
+import json
+import logging
+import math
+import os
+from bisect import bisect_left
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Tuple, List, Any, Callable, Sequence
+
+# Счётчики и гистограммы завершившихся воркеров, чтобы суммы не уменьшались после их рестарта
+ARCHIVE_FILE = "archive.json"
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelValues = Tuple[str, ...]
+
+
+class Metric:
+    type: str = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: Dict[str, Any]) -> LabelValues:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> List[Tuple[LabelValues, Any]]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """Монотонно растущий счётчик."""
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> List[Tuple[LabelValues, Any]]:
+        return list(self._values.items())
+
+
+class Gauge(Metric):
+    """Текущее значение, которое может как расти, так и уменьшаться."""
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def set(self, value: float, **labels) -> None:
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def samples(self) -> List[Tuple[LabelValues, Any]]:
+        return list(self._values.items())
+
+
+class Histogram(Metric):
+    """Распределение значений по корзинам."""
+    type = "histogram"
+
+    def __init__(
+            self,
+            name: str,
+            documentation: str,
+            labelnames: Sequence[str] = (),
+            buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[LabelValues, Dict[str, Any]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        data = self._values.get(key)
+        if data is None:
+            data = self._values[key] = {"buckets": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0}
+
+        data["buckets"][bisect_left(self.buckets, value)] += 1
+        data["sum"] += value
+        data["count"] += 1
+
+    def samples(self) -> List[Tuple[LabelValues, Any]]:
+        return list(self._values.items())
+
+
+class Registry:
+    """
+    Реестр метрик процесса.
+
+    Каждый воркер uvicorn периодически сохраняет снимок своих метрик в общий каталог,
+    а ответ `/metrics` собирается из снимков всех воркеров: счётчики и гистограммы
+    суммируются, gauge-метрики помечаются меткой `pid`. Снимки завершившихся воркеров
+    переносятся в общий архив.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self._metrics: Dict[str, Metric] = {}
+        self._collectors: List[Callable[[], None]] = []
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+            self,
+            name: str,
+            documentation: str,
+            labelnames: Sequence[str] = (),
+            buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collector: Callable[[], None]) -> None:
+        """Регистрирует функцию, которая обновляет метрики перед снятием снимка."""
+        self._collectors.append(collector)
+
+    def snapshot(self) -> Dict[str, Any]:
+        for collector in self._collectors:
+            try:
+                collector()
+            except Exception:
+                logger.exception("Metrics collector failed")
+
+        return {
+            metric.name: {
+                "type": metric.type,
+                "help": metric.documentation,
+                "labelnames": metric.labelnames,
+                "buckets": getattr(metric, "buckets", None),
+                "samples": metric.samples(),
+            }
+            for metric in self._metrics.values()
+        }
+
+    def flush(self) -> None:
+        """Сохраняет снимок метрик текущего процесса в общий каталог."""
+        self._write(json.dumps(self.snapshot()))
+
+    def _write(self, data: str) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        _replace(self.directory / f"{os.getpid()}.json", data)
+
+    async def run_flusher(self, interval: float) -> None:
+        """Периодически сохраняет снимок метрик, пока задача не будет отменена."""
+        try:
+            while True:
+                await asyncio.sleep(interval)
+                try:
+                    self.flush()
+                except OSError:
+                    logger.exception("Failed to flush metrics")
+        finally:
+            self.flush()
+
+    def clear(self) -> None:
+        """Удаляет снимки всех процессов. Вызывается один раз до запуска воркеров."""
+        if not self.directory.exists():
+            return
+        for path in self.directory.glob("*.json"):
+            path.unlink(missing_ok=True)
+
+    async def render(self) -> str:
+        """
+        Собирает метрики всех воркеров в текстовом формате Prometheus.
+
+        Снимок текущего процесса снимается в цикле событий, а чтение и запись файлов
+        выполняются в отдельном потоке.
+        """
+        data = json.dumps(self.snapshot())
+        return await asyncio.to_thread(self._render, data)
+
+    def _render(self, data: str) -> str:
+        self._write(data)
+        with self._lock():
+            merged = self._collect()
+
+        lines = []
+        for name, metric in sorted(merged.items()):
+            labelnames = list(metric["labelnames"])
+            if metric["type"] == "gauge":
+                labelnames.append("pid")
+
+            lines.append(f"# HELP {name} {metric['help']}")
+            lines.append(f"# TYPE {name} {metric['type']}")
+            for labels, value in sorted(metric["samples"].items()):
+                pairs = list(zip(labelnames, labels))
+                if metric["type"] == "histogram":
+                    cumulative = 0
+                    for bound, count in zip([*metric["buckets"], math.inf], value["buckets"]):
+                        cumulative += count
+                        le = "+Inf" if bound == math.inf else repr(float(bound))
+                        lines.append(f"{name}_bucket{_labels([*pairs, ('le', le)])} {cumulative}")
+                    lines.append(f"{name}_sum{_labels(pairs)} {value['sum']}")
+                    lines.append(f"{name}_count{_labels(pairs)} {value['count']}")
+                else:
+                    lines.append(f"{name}{_labels(pairs)} {value}")
+
+        return "\n".join(lines) + "\n"
+
+    def _register(self, metric: Metric) -> Any:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    @contextmanager
+    def _lock(self):
+        # Снимки завершившихся воркеров переносятся в архив только одним процессом
+        with open(self.directory / ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
+    def _collect(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Объединяет снимки живых воркеров и архив.
+
+        Снимки завершившихся воркеров добавляются в архив и удаляются: их gauge-метрики
+        больше не актуальны, а счётчики и гистограммы продолжают учитываться через архив.
+        """
+        archive_path = self.directory / ARCHIVE_FILE
+        archived: Dict[str, Dict[str, Any]] = {}
+        _merge(archived, _read(archive_path))
+
+        merged: Dict[str, Dict[str, Any]] = {}
+        dead = []
+        for path in self.directory.glob("*.json"):
+            if path == archive_path:
+                continue
+            snapshot = _read(path)
+            if _is_alive(int(path.stem)):
+                _merge(merged, snapshot, path.stem)
+            else:
+                _merge(archived, snapshot)
+                dead.append(path)
+
+        archive = _unmerge(archived)
+        if dead:
+            _replace(archive_path, json.dumps(archive))
+            for path in dead:
+                path.unlink(missing_ok=True)
+
+        _merge(merged, archive)
+        return merged
+
+
+
+def _labels(pairs: List[Tuple[str, str]]) -> str:
+    if not pairs:
+        return ""
+    escaped = (
+        f'{name}="{_escape(value)}"'
+        for name, value in pairs
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _is_alive(pid: int) -> bool:
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _read(path: Path) -> Dict[str, Any]:
+    """Читает снимок; недописанный или удалённый файл считается пустым."""
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def _replace(path: Path, data: str) -> None:
+    tmp_path = path.with_suffix(".tmp")
+    tmp_path.write_text(data)
+    os.replace(tmp_path, path)
+
+
+def _merge(merged: Dict[str, Dict[str, Any]], snapshot: Dict[str, Any], pid: str = "") -> None:
+    """
+    Добавляет снимок к объединённым метрикам.
+
+    :param pid: воркер, которому принадлежит снимок; без него снимок архивный и gauge-метрики пропускаются
+    """
+    for name, metric in snapshot.items():
+        if metric["type"] == "gauge" and not pid:
+            continue
+
+        target = merged.setdefault(name, {**metric, "samples": {}})
+        for labels, value in metric["samples"]:
+            if metric["type"] == "gauge":
+                target["samples"][(*labels, pid)] = value
+                continue
+
+            key = tuple(labels)
+            current = target["samples"].get(key)
+            if current is None:
+                target["samples"][key] = dict(value) if metric["type"] == "histogram" else value
+            elif metric["type"] == "histogram":
+                current["buckets"] = [a + b for a, b in zip(current["buckets"], value["buckets"])]
+                current["sum"] += value["sum"]
+                current["count"] += value["count"]
+            else:
+                target["samples"][key] = current + value
+
+
+def _unmerge(merged: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """Переводит объединённые метрики обратно в формат снимка."""
+    return {
+        name: {**metric, "samples": [[list(labels), value] for labels, value in metric["samples"].items()]}
+        for name, metric in merged.items()
+    }
@@ -0,0 +1,69 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Dict, Optional, Callable, Iterator
+
+_timings: ContextVar[Optional["RequestTimings"]] = ContextVar("request_timings", default=None)
+
+
+class RequestTimings:
+    """Длительности фаз обработки одного запроса в секундах."""
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+
+    def add(self, phase: str, duration: float) -> None:
+        self.phases[phase] = self.phases.get(phase, 0.0) + duration
+
+    def get(self, phase: str) -> float:
+        return self.phases.get(phase, 0.0)
+
+    @property
+    def total(self) -> float:
+        return time.perf_counter() - self.started_at
+
+
+def start_request_timings() -> RequestTimings:
+    """Начинает сбор фаз для текущего запроса."""
+    timings = RequestTimings()
+    _timings.set(timings)
+    return timings
+
+
+def current_timings() -> Optional[RequestTimings]:
+    return _timings.get()
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    """
+    Замеряет время выполнения блока и добавляет его к фазе текущего запроса.
+
+    Вне запроса ничего не делает.
+    """
+    timings = _timings.get()
+    if timings is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - start)
+
+
+def timed(name: str) -> Callable:
+    """Декоратор асинхронной функции, который добавляет время её выполнения к фазе запроса."""
+
+    def decorator(func: Callable):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            with phase(name):
+                return await func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
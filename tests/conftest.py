@@ -0,0 +1,61 @@
+import os
+import uuid
+from typing import List
+
+import httpx
+import pytest
+from pytest_asyncio import is_async_test
+
+
+def pytest_collection_modifyitems(items):
+    # Движок базы данных и его пул общие для всех тестов, поэтому и цикл событий один на сессию
+    session_loop = pytest.mark.asyncio(loop_scope="session")
+    for item in items:
+        if is_async_test(item):
+            item.add_marker(session_loop, append=False)
+
+
+@pytest.fixture(scope="session")
+def database():
+    """Пропускает тест, если база данных не настроена: адрес задаётся переменными DB_HOST и остальными DB_*."""
+    if "DB_HOST" not in os.environ:
+        pytest.skip("database is not configured, set DB_HOST")
+
+
+@pytest.fixture(scope="session")
+async def app(database):
+    from app.server import create_app
+    from libs.database import init_db
+
+    await init_db()
+    return create_app()
+
+
+@pytest.fixture
+async def client(app):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="https://testserver") as client:
+        yield client
+
+
+@pytest.fixture
+async def user(client) -> dict:
+    """Регистрирует нового пользователя, клиент получает его cookies."""
+    credentials = {"email": f"{uuid.uuid4().hex}@example.com", "password": "password"}
+    response = await client.post("/auth/register", json={**credentials, "first_name": "Test", "last_name": "User"})
+    assert response.status_code == 200
+
+    response = await client.get("/users/me")
+    return {**credentials, "id": uuid.UUID(response.json()["id"])}
+
+
+@pytest.fixture
+async def products(user) -> List[uuid.UUID]:
+    """Товары пользователя без учёта остатка."""
+    from libs.database.engine import async_session
+    from libs.database.models import Product
+
+    async with async_session() as session:
+        items = [Product(user_id=user["id"], title=f"Product {i}", description="", price=100 + i) for i in range(20)]
+        session.add_all(items)
+        await session.commit()
+        return [product.id for product in items]
@@ -0,0 +1,37 @@
+import json
+import os
+import subprocess
+import sys
+
+from libs.metrics import Registry
+
+
+def _dead_pid() -> int:
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def _worker_snapshot(directory, requests: int, in_flight: int) -> dict:
+    worker = Registry(directory)
+    worker.counter("requests_total", "Requests").inc(requests)
+    worker.gauge("in_flight", "Requests in flight").set(in_flight)
+    worker.histogram("latency_seconds", "Latency", buckets=(1.0,)).observe(0.5)
+    return worker.snapshot()
+
+
+async def test_render_keeps_counters_of_dead_workers(tmp_path):
+    registry = Registry(tmp_path)
+    registry.counter("requests_total", "Requests").inc(2)
+    for _ in range(2):
+        pid = _dead_pid()
+        (tmp_path / f"{pid}.json").write_text(json.dumps(_worker_snapshot(tmp_path, requests=3, in_flight=7)))
+
+    for _ in range(2):
+        text = await registry.render()
+        assert "requests_total 8" in text
+        assert "latency_seconds_count 2" in text
+        assert "in_flight" not in text
+
+    # Снимки завершившихся воркеров перенесены в архив
+    assert {path.name for path in tmp_path.glob("*.json")} == {"archive.json", f"{os.getpid()}.json"}
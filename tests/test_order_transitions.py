@@ -0,0 +1,28 @@
+import pytest
+
+from libs.database.models import ORDER_TRANSITIONS, OrderState, transition_sources
+
+
+@pytest.mark.parametrize(
+    ("target", "sources"),
+    [
+        (OrderState.PENDING, []),
+        (OrderState.CREATED, [OrderState.PENDING]),
+        (OrderState.ACCEPTED, [OrderState.CREATED]),
+        (OrderState.IN_TRANSIT, [OrderState.ACCEPTED]),
+        (OrderState.DELIVERED, [OrderState.IN_TRANSIT]),
+        (OrderState.EXPIRED, []),
+    ],
+)
+def test_transition_sources(target, sources):
+    assert transition_sources(target) == sources
+
+
+def test_every_state_has_transitions():
+    assert set(ORDER_TRANSITIONS) == set(OrderState)
+
+
+@pytest.mark.parametrize("final", [OrderState.DELIVERED, OrderState.EXPIRED])
+def test_final_states_lead_nowhere(final):
+    assert ORDER_TRANSITIONS[final] == set()
+    assert all(final not in transition_sources(target) for target in OrderState)
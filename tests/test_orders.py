@@ -0,0 +1,109 @@
+import uuid
+
+import httpx
+from sqlmodel import update
+
+from libs.database.engine import async_session
+from libs.database.models import User, UserFlag
+from libs.database.tracker import assert_max_queries
+
+
+def _cart(product_ids, quantity=2):
+    return {"items": [{"product_id": str(product_id), "quantity": quantity} for product_id in product_ids]}
+
+
+async def _make_admin(client, user):
+    # Флаги лежат в токене, поэтому после смены нужно войти заново
+    async with async_session() as session:
+        await session.exec(update(User).where(User.id == user["id"]).values(flags=UserFlag.ADMIN.value))
+        await session.commit()
+    await client.post("/auth/login", json={"email": user["email"], "password": user["password"]})
+
+
+async def test_create_order_queries_do_not_depend_on_cart_size(client, products):
+    # Проверка товаров, INSERT заказа и INSERT позиций
+    for size in (1, len(products)):
+        with assert_max_queries(3):
+            response = await client.post("/orders/", json=_cart(products[:size]))
+        assert response.status_code == 200
+        assert len(response.json()["items"]) == size
+
+
+async def test_list_orders_uses_two_queries(client, products):
+    for size in range(1, 4):
+        await client.post("/orders/", json=_cart(products[:size]))
+
+    # Страница заказов и позиции всех заказов страницы
+    with assert_max_queries(2):
+        response = await client.get("/orders/")
+    assert response.status_code == 200
+    assert len(response.json()["items"]) == 3
+
+
+async def test_bulk_status_uses_two_queries(client, user, products):
+    orders = [(await client.post("/orders/", json=_cart(products[:size]))).json()["id"] for size in range(1, 6)]
+    await _make_admin(client, user)
+
+    missing = str(uuid.uuid4())
+    # UPDATE статусов и подтверждение резервов
+    with assert_max_queries(2):
+        response = await client.post("/orders/status", json={"order_ids": orders + [missing], "status": "ACCEPTED"})
+    assert response.status_code == 200
+    assert sorted(response.json()["updated"]) == sorted(orders)
+    assert response.json()["failed"] == [missing]
+
+
+async def test_bulk_status_reports_orders_that_cannot_move(client, user, products):
+    created = (await client.post("/orders/", json=_cart(products[:1]))).json()["id"]
+    accepted = (await client.post("/orders/", json=_cart(products[:1]))).json()["id"]
+    await _make_admin(client, user)
+    await client.post("/orders/status", json={"order_ids": [accepted], "status": "ACCEPTED"})
+
+    missing = str(uuid.uuid4())
+    response = await client.post(
+        "/orders/status", json={"order_ids": [created, accepted, missing, created], "status": "ACCEPTED"}
+    )
+    assert response.status_code == 200
+    assert response.json() == {"updated": [created], "failed": [accepted, missing]}
+
+
+async def test_update_order_moves_to_next_status(client, products):
+    order = (await client.post("/orders/", json=_cart(products[:1]))).json()
+
+    response = await client.put(f"/orders/{order['id']}", json={"status": "ACCEPTED", "version": order["version"]})
+    assert response.status_code == 200
+    assert response.json()["status"] == "ACCEPTED"
+    assert response.json()["version"] == order["version"] + 1
+
+
+async def test_update_missing_order_is_not_found(client, user):
+    response = await client.put(f"/orders/{uuid.uuid4()}", json={"status": "ACCEPTED"})
+    assert response.status_code == 404
+
+
+async def test_update_foreign_order_is_not_found(app, client, products):
+    order = (await client.post("/orders/", json=_cart(products[:1]))).json()
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="https://testserver") as other:
+        credentials = {"email": f"{uuid.uuid4().hex}@example.com", "password": "password"}
+        await other.post("/auth/register", json={**credentials, "first_name": "Other", "last_name": "User"})
+        response = await other.put(f"/orders/{order['id']}", json={"status": "ACCEPTED"})
+    assert response.status_code == 404
+
+
+async def test_update_order_with_stale_version_conflicts(client, products):
+    order = (await client.post("/orders/", json=_cart(products[:1]))).json()
+
+    response = await client.put(f"/orders/{order['id']}", json={"status": "ACCEPTED", "version": order["version"] + 1})
+    assert response.status_code == 409
+    assert response.json()["detail"]["status"] == "CREATED"
+    assert response.json()["detail"]["version"] == order["version"]
+
+
+async def test_update_order_to_unreachable_status_conflicts(client, products):
+    order = (await client.post("/orders/", json=_cart(products[:1]))).json()
+
+    response = await client.put(f"/orders/{order['id']}", json={"status": "DELIVERED"})
+    assert response.status_code == 409
+    assert response.json()["detail"]["status"] == "CREATED"
+    assert response.json()["detail"]["version"] == order["version"]
@@ -0,0 +1,38 @@
+import base64
+import json
+import uuid
+from datetime import datetime
+
+import pytest
+
+from libs.database.pagination import InvalidCursor, encode_cursor, decode_cursor
+
+
+def _cursor(*values) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(values)).encode()).rstrip(b"=").decode()
+
+
+def test_round_trip():
+    created_at, order_id = datetime(2024, 1, 2, 3, 4, 5, 6), uuid.uuid4()
+    assert decode_cursor(encode_cursor(created_at, order_id), datetime, uuid.UUID) == [created_at, order_id]
+
+
+def test_non_string_uuid_is_invalid():
+    # "WzVd" - это JSON [5]
+    with pytest.raises(InvalidCursor):
+        decode_cursor("WzVd", uuid.UUID)
+
+
+def test_non_string_datetime_is_invalid():
+    with pytest.raises(InvalidCursor):
+        decode_cursor(_cursor(5, str(uuid.uuid4())), datetime, uuid.UUID)
+
+
+def test_aware_datetime_is_invalid():
+    with pytest.raises(InvalidCursor):
+        decode_cursor(_cursor("2024-01-02T03:04:05+00:00", str(uuid.uuid4())), datetime, uuid.UUID)
+
+
+def test_garbage_is_invalid():
+    with pytest.raises(InvalidCursor):
+        decode_cursor("not a cursor!", uuid.UUID)
@@ -0,0 +1,5 @@
+from libs.database.migrations.checks import check_query_plans
+
+
+async def test_hot_queries_use_their_indexes(database):
+    assert await check_query_plans() == []